@@ -0,0 +1,15 @@
+"""Offline benchmarks (see bench/run.py).
+
+Nothing here may touch a real deployment, so the tools take their database from
+BENCH_DB_URL instead of DB_URL (which a .env file may point at production) and
+never talk to api.telegram.org.
+"""
+import os
+import sys
+
+def use_bench_db():
+    """Points DB_URL at BENCH_DB_URL. Call before anything imports config."""
+    url = os.environ.get("BENCH_DB_URL")
+    if not url:
+        sys.exit("Set BENCH_DB_URL to a scratch database, e.g. BENCH_DB_URL=sqlite:////tmp/bench.db")
+    os.environ["DB_URL"] = url
@@ -0,0 +1,116 @@
+"""A stand-in for the Telegram Bot API, for benchmarks and replays.
+
+    python -m bench.fake_api --port 8081 [--latency-ms 30]
+    BOT_API_URL=http://127.0.0.1:8081 python main.py
+
+Answers every method with a plausible result: sent / edited messages come back
+as Message objects with fresh ids, getChatMember says "member", getUpdates
+waits and returns nothing, everything else returns true. It sets no rate
+limits of its own (the outbound scheduler still applies its own). Calls are
+counted per method, so a run can check what was sent.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import time
+from aiohttp import web
+
+BOT_USER = {"id": 1000001, "is_bot": True, "first_name": "BotLibrary", "username": "botlibrary_bench_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": True}
+
+MESSAGE_METHODS = ("sendMessage", "sendPhoto", "sendDocument", "copyMessage", "forwardMessage",
+                   "editMessageText", "editMessageCaption", "editMessageReplyMarkup")
+
+def _chat(chat_id):
+    if isinstance(chat_id, str) and chat_id.startswith("@"):
+        return {"id": -1001000000001, "type": "channel", "title": chat_id[1:], "username": chat_id[1:]}
+    chat_id = int(chat_id)
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+    return {"id": chat_id, "type": "supergroup" if str(chat_id).startswith("-100") else "group",
+            "title": f"chat{chat_id}"}
+
+class FakeBotApi:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = collections.Counter()      # method -> count
+        self.texts = collections.Counter()      # first line of sent texts -> count
+        self.message_ids = itertools.count(1000)
+        self.runner = None
+        self.url = None
+
+        self.app = web.Application(client_max_size=50 * 1024 * 1024)
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle)
+
+    async def start(self, port: int = 0, host: str = "127.0.0.1") -> str:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        try:
+            params = dict(await request.post()) if request.body_exists else {}
+        except ConnectionResetError:
+            return web.Response(status=499)    # the caller was cancelled mid-request
+        self.calls[method] += 1
+        if method == "getUpdates":
+            await asyncio.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            return web.json_response({"ok": True, "result": []})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getChatMember":
+            user_id = int(params.get("user_id", 0))
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}}
+        if method in MESSAGE_METHODS:
+            text = params.get("text") or params.get("caption") or ""
+            self.texts[text.split("\n", 1)[0][:40]] += 1
+            if "inline_message_id" in params:
+                return True
+            message = {
+                "message_id": int(params.get("message_id") or next(self.message_ids)),
+                "date": int(time.time()),
+                "chat": _chat(params.get("chat_id", 0)),
+                "from": BOT_USER,
+                "text": text,
+            }
+            if params.get("reply_markup"):
+                message["reply_markup"] = json.loads(params["reply_markup"])
+            return message
+        return True
+
+async def _serve(port: int, latency: float):
+    api = FakeBotApi(latency)
+    url = await api.start(port, "0.0.0.0")
+    print(f"Fake Bot API on {url} (latency {latency * 1000:.0f} ms). Ctrl+C to stop.")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print("calls:", dict(api.calls.most_common(10)))
+    finally:
+        await api.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.port, args.latency_ms / 1000))
+    except KeyboardInterrupt:
+        pass
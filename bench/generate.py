@@ -0,0 +1,114 @@
+"""Synthetic catalogs for benchmarks.
+
+    BENCH_DB_URL=sqlite:////tmp/bench.db python -m bench.generate --scale small
+    BENCH_DB_URL=postgresql://localhost/bench python -m bench.generate --scale full
+    python -m bench.generate --users 200000 --bots 50000 --votes 400000
+
+Point BENCH_DB_URL at an empty database: the schema is created, then users, bots
+and votes are streamed through bulk_io (COPY on Postgres), which also builds
+the rating aggregates and the counters. The same seed gives the same catalog.
+
+    small   50k users, 10k bots, 100k votes
+    full    500k users, 100k bots, 1M votes
+
+Descriptions are drawn from a made-up vocabulary with a skewed word frequency.
+Votes are skewed toward low bot ids, and bot 1 (HOT_BOT) alone gets 5% of them.
+"""
+import argparse
+import datetime
+import random
+import time
+
+SCALES = {
+    "small": {"users": 50_000, "bots": 10_000, "votes": 100_000},
+    "full": {"users": 500_000, "bots": 100_000, "votes": 1_000_000},
+}
+CATEGORIES = ["Utility", "Entertainment", "Productivity", "Social", "Gaming", "Other"]
+USER_BASE = 100_000_000     # synthetic user ids are USER_BASE + n
+HOT_BOT = 1
+SEED = 1
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "zu", "bel", "cor", "dan", "fin",
+              "gor", "hal", "jun", "kel", "lum", "mor", "nix", "pol", "quin", "ros", "tal", "ven"]
+_COMMON = ["bot", "music", "download", "video", "chat", "games", "news", "weather", "translate",
+           "files", "photos", "search", "quiz", "crypto", "movies", "stickers", "reminder", "notes",
+           "group", "admin", "ai", "anime", "books", "fitness", "recipes", "jobs", "memes", "polls"]
+
+def vocabulary(seed: int = SEED, size: int = 5000) -> list:
+    """Common words first, so skewed picks favour them."""
+    rng = random.Random(seed)
+    vocab, seen = list(_COMMON), set(_COMMON)
+    while len(vocab) < size:
+        word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+def skewed(rng: random.Random, n: int) -> int:
+    """0..n-1, log-uniform: low values are much more likely."""
+    return min(n - 1, int(n ** rng.random()) - 1)
+
+def sentence(rng: random.Random, vocab: list, low: int, high: int) -> str:
+    return " ".join(vocab[skewed(rng, len(vocab))] for _ in range(rng.randint(low, high)))
+
+def username(i: int, vocab: list) -> str:
+    return f"@{vocab[i % len(vocab)]}{vocab[(i // len(vocab) + 7 * i) % len(vocab)]}_{i}_bot"
+
+def _users(rng, count, now):
+    for n in range(count):
+        joined = now - datetime.timedelta(seconds=rng.randint(0, 365 * 86400))
+        yield {"user_id": USER_BASE + n, "username": f"user{USER_BASE + n}", "role": "user",
+               "join_date": joined, "last_seen": joined, "blocked": False}
+
+def _bots(rng, count, users, vocab, now):
+    for i in range(1, count + 1):
+        submitted = now - datetime.timedelta(seconds=rng.randint(86400, 365 * 86400))
+        yield {
+            "bot_id": i,
+            "username": username(i, vocab),
+            "description": sentence(rng, vocab, 12, 35).capitalize() + ".",
+            "features": sentence(rng, vocab, 3, 8),
+            "category": rng.choice(CATEGORIES),
+            "submitted_by": USER_BASE + rng.randrange(users) if users else None,
+            "submission_date": submitted,
+            "approval_date": submitted + datetime.timedelta(hours=rng.randint(1, 72)),
+            "channel_message_id": 10_000 + i,
+        }
+
+def _votes(rng, count, bots, users, now):
+    for _ in range(count):
+        bot_id = HOT_BOT if rng.random() < 0.05 else skewed(rng, bots) + 1
+        yield {"bot_id": bot_id, "user_id": USER_BASE + rng.randrange(users),
+               "score": rng.choice((1, 2, 3, 3, 4, 4, 4, 5, 5, 5)),
+               "voted_at": now - datetime.timedelta(seconds=rng.randint(0, 180 * 86400))}
+
+def generate(users: int, bots: int, votes: int, seed: int = SEED):
+    from database import init_db
+    from bulk_io import import_records
+
+    init_db()
+    rng = random.Random(seed)
+    vocab = vocabulary(seed)
+    now = datetime.datetime.utcnow()
+    started = time.monotonic()
+    import_records("users", _users(rng, users, now))
+    import_records("bots", _bots(rng, bots, users, vocab, now))
+    if users and bots:
+        # Repeated (bot, user) pairs are skipped, so slightly fewer votes land than asked for
+        import_records("votes", _votes(rng, votes, bots, users, now))
+    print(f"✅ Catalog generated in {time.monotonic() - started:.1f}s")
+
+if __name__ == "__main__":
+    from bench import use_bench_db
+    use_bench_db()
+    parser = argparse.ArgumentParser(description="Fill BENCH_DB_URL with a synthetic catalog.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--bots", type=int)
+    parser.add_argument("--votes", type=int)
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+    sizes = dict(SCALES[args.scale])
+    sizes.update({name: getattr(args, name) for name in sizes if getattr(args, name) is not None})
+    generate(sizes["users"], sizes["bots"], sizes["votes"], args.seed)
@@ -0,0 +1,255 @@
+"""Replays a recorded update log (services/update_log.py) against a local bot.
+
+    UPDATE_LOG=/var/log/botlibrary/updates.jsonl.gz python main.py     # in production
+    BENCH_DB_URL=sqlite:////tmp/bench.db python -m bench.replay updates.jsonl.gz
+    python -m bench.replay updates.jsonl.gz --speed 10x --concurrency 128
+    python -m bench.replay updates.jsonl.gz --speed max --json report.json
+
+The updates go through the same Application, update processor and handlers
+as in production, against BENCH_DB_URL and the fake Bot API
+(bench/fake_api.py), with Telegram's rate limits lifted as in bench/run.py.
+CHANNEL_ID and the staff group come from the log, and staff recorded in it
+get their role here, so votes and moderation clicks take the same paths.
+
+    --speed 1x      updates are sent with their recorded spacing (gaps longer
+    --speed 10x     than --max-gap are cut short), or 10 times faster
+    --speed max     as fast as --concurrency allows
+    --concurrency   updates in flight at once; when that's reached, sending
+                    waits, and the lag behind the recording is reported
+
+Latency is from handing the update to the update processor to the end of its
+handlers, so it includes waiting on the key locks, as users would. It is
+reported per handler (the last one that ran for the update) with the share
+of updates whose handlers raised.
+
+Bot, submission and user ids are replayed as recorded: the closer the catalog
+is to production's (bulk_io.py export / import), the closer the replay.
+"""
+import argparse
+import asyncio
+import collections
+import gzip
+import json
+import os
+import sys
+import time
+
+from bench import use_bench_db
+
+def parse_speed(value: str):
+    """'max' -> None, '1x' / '2.5x' / '10' -> factor."""
+    if value == "max":
+        return None
+    factor = float(value.rstrip("x"))
+    if factor <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive")
+    return factor
+
+# As written by services/update_log.py (not imported: it would load config.py
+# before configure() has set the bench environment)
+FORMAT = "botlibrary-updates"
+VERSION = 1
+
+def read_log(path: str):
+    """Yields (header, record) for every record, header being the one of the
+    process that wrote it."""
+    header = None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if "header" in entry:
+                header = entry["header"]
+                if header.get("format") != FORMAT or header.get("version") != VERSION:
+                    sys.exit(f"{path}: not an update log this version can read")
+            else:
+                yield header, entry
+
+def load(path: str, limit: int = None):
+    """(first header, [(time, role, update dict), ...]) from an update log."""
+    header, records = None, []
+    for record_header, record in read_log(path):
+        header = header or record_header
+        records.append((record["t"], record.get("role"), record["update"]))
+        if limit and len(records) >= limit:
+            break
+    if not records:
+        sys.exit(f"{path} has no updates")
+    return header or {}, records
+
+def schedule(records: list, speed, max_gap: float) -> list:
+    """Offsets from the start at which to send each update (all 0 at max speed)."""
+    if speed is None:
+        return [0.0] * len(records)
+    offsets, offset = [], 0.0
+    previous = records[0][0]
+    for t, _, _ in records:
+        offset += min(max(t - previous, 0.0), max_gap) / speed
+        previous = t
+        offsets.append(offset)
+    return offsets
+
+async def add_staff(records: list):
+    """Gives the recorded staff their role (under their pseudonymous ids)."""
+    from database import AsyncSessionLocal, User
+    staff = {}
+    for _, role, data in records:
+        sender = _sender(data)
+        if role and sender:
+            staff[sender] = "sudo" if role == "owner" else role
+    async with AsyncSessionLocal() as session:
+        for user_id, role in staff.items():
+            await session.merge(User(user_id=user_id, username=f"u{user_id}", role=role))
+        await session.commit()
+    return len(staff)
+
+def _sender(data: dict):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"]["id"]
+    return None
+
+class Replay:
+    def __init__(self, concurrency: int):
+        self.app = None
+        self.slots = asyncio.Semaphore(concurrency)
+        self.latencies = collections.defaultdict(list)     # handler -> seconds
+        self.errors = collections.Counter()                 # handler -> updates that raised
+        self.failed = set()                                 # update_ids whose handlers raised
+        self.max_lag = 0.0
+
+    async def on_error(self, update, context):
+        update_id = getattr(update, "update_id", None)
+        if update_id not in self.failed and len(self.failed) < 5:
+            print(f"  ⚠️ update {update_id}: {context.error!r}")
+        self.failed.add(update_id)
+
+    async def run(self, records: list, offsets: list, paced: bool) -> float:
+        tasks = set()
+        started = time.perf_counter()
+        for (_, _, data), offset in zip(records, offsets):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.slots.acquire()
+            if paced:
+                self.max_lag = max(self.max_lag, time.perf_counter() - started - offset)
+            task = asyncio.create_task(self.send(data))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+    async def send(self, data: dict):
+        from telegram import Update
+        try:
+            update = Update.de_json(data, self.app.bot)
+            label = {}
+            sent = time.perf_counter()
+            await self.app.update_processor.process_update(update, self.handle(update, label))
+            handler = label.get("handler", "not_processed")
+            self.latencies[handler].append(time.perf_counter() - sent)
+            if update.update_id in self.failed:
+                self.errors[handler] += 1
+        finally:
+            self.slots.release()
+
+    async def handle(self, update, label: dict):
+        from services import metrics
+        try:
+            await self.app.process_update(update)
+        finally:
+            stats = metrics.current_update()
+            label["handler"] = stats.handler if stats else "unhandled"
+
+def summary(latencies: list, errors: int) -> dict:
+    from bench.run import percentile
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+def print_report(report: dict):
+    meta = report["meta"]
+    lag = "" if meta["max_lag_seconds"] is None else f", max lag {meta['max_lag_seconds']}s"
+    print(f"\n{meta['updates']} updates recorded over {meta['recorded_seconds']}s, replayed at {meta['speed']} "
+          f"(concurrency {meta['concurrency']}) in {meta['seconds']}s: {meta['per_second']}/s{lag}\n")
+    print(f"{'handler':<24}{'count':>8}{'errors':>8}{'err %':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, r in report["handlers"].items():
+        print(f"{name:<24}{r['count']:>8}{r['errors']:>8}{r['error_rate'] * 100:>8.2f}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+
+async def replay(args) -> dict:
+    from bench.fake_api import FakeBotApi
+    from bench.run import application, configure, prepare_db, finish_broadcasts
+
+    header, records = load(args.log, args.limit)
+    # The log's channel and staff group, so rating and moderation updates match them
+    if header.get("channel_id"):
+        os.environ["CHANNEL_ID"] = str(header["channel_id"])
+    if header.get("staff_group_id"):
+        os.environ["STAFF_GROUP_ID"] = str(header["staff_group_id"])
+    api = FakeBotApi(args.latency_ms / 1000)
+    configure(args.api_url or await api.start())
+
+    await prepare_db()
+    staff = await add_staff(records)
+    offsets = schedule(records, args.speed, args.max_gap)
+    print(f"Replaying {len(records)} updates ({staff} staff) over about {offsets[-1]:.0f}s...")
+
+    runner = Replay(args.concurrency)
+    try:
+        async with application(runner.on_error) as runner.app:
+            from services.broadcast import broadcast_engine
+            elapsed = await runner.run(records, offsets, paced=args.speed is not None)
+            # Recorded /broadcasts would otherwise message the whole catalog, and resume next time
+            job_ids = list(broadcast_engine.tasks)
+            await broadcast_engine.stop()
+            if job_ids:
+                await finish_broadcasts(job_ids)
+    finally:
+        await api.stop()
+
+    all_latencies = [value for values in runner.latencies.values() for value in values]
+    handlers = {name: summary(runner.latencies[name], runner.errors[name])
+                for name in sorted(runner.latencies, key=lambda name: -len(runner.latencies[name]))}
+    return {
+        "meta": {
+            "log": args.log,
+            "updates": len(records),
+            "recorded_seconds": round(records[-1][0] - records[0][0], 1),
+            "speed": "max" if args.speed is None else f"{args.speed:g}x",
+            "concurrency": args.concurrency,
+            "seconds": round(elapsed, 1),
+            "per_second": round(len(records) / elapsed, 1) if elapsed else 0.0,
+            "max_lag_seconds": None if args.speed is None else round(runner.max_lag, 3),
+        },
+        "handlers": {"all": summary(all_latencies, sum(runner.errors.values())), **handlers},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded update log against a local bot.")
+    parser.add_argument("log", help="gzipped update log written with UPDATE_LOG")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1x (default), 10x, ... or max")
+    parser.add_argument("--concurrency", type=int, default=64, help="updates in flight at once")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="longest pause kept from the recording, seconds")
+    parser.add_argument("--limit", type=int, help="replay only the first N updates")
+    parser.add_argument("--latency-ms", type=float, default=0, help="fake Bot API response time")
+    parser.add_argument("--api-url", help="use a Bot API stand-in that's already running")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    use_bench_db()
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
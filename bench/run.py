@@ -0,0 +1,469 @@
+"""Offline benchmark: the real Application, a fake Bot API and a synthetic catalog.
+
+    BENCH_DB_URL=sqlite:////tmp/bench.db python -m bench.generate --scale small
+    BENCH_DB_URL=sqlite:////tmp/bench.db python -m bench.run
+    BENCH_DB_URL=sqlite:////tmp/bench.db python -m bench.run --save-baseline
+    python -m bench.run --scenarios search,inline --requests 5000 --concurrency 64
+
+Updates are built in memory (bench/updates.py) and fed straight to the
+update processor, the same path polling and webhooks take, so the numbers
+include key locks, handlers, the DB and the HTTP round trip to the fake API
+(bench/fake_api.py, started in-process unless --api-url is given). Telegram's
+rate limits are lifted: this measures the bot, not the flood rules.
+
+    search      /search with one or two catalog words
+    inline      inline queries typed a keystroke at a time
+    list        /list, then Next through a few pages
+    vote_burst  star votes from distinct users on one bot's channel post
+    approve     claim + approve of fresh submissions by a handful of mods
+    broadcast   /start replies while a /broadcast runs in the background;
+                throughput is the broadcast's send rate
+    limited     votes and inline typing during a broadcast with Telegram's
+                limits in force (the others run without them)
+
+Each scenario reports updates/s and p50/p95/p99 latency per update. With a
+baseline for the backend in bench/baselines/ (sqlite.json, postgresql.json)
+the run fails when a p95 grows, or a throughput drops, by more than
+--tolerance, or a scenario starts raising errors. Baselines are only compared
+when the catalog and the request count are about the same, and they are
+specific to the machine they were saved on: save your own before comparing.
+
+Approved submissions are deleted again at the end; votes from the vote burst
+stay (they're the same users each run, so the counts don't drift).
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import datetime
+import itertools
+import json
+import logging
+import os
+import pathlib
+import random
+import sys
+import time
+
+from bench import use_bench_db
+
+BASELINES = pathlib.Path(__file__).parent / "baselines"
+TOKEN = "123456:BENCH"
+MODS = 8
+LIST_DEPTH = 20
+ANNOUNCEMENT = "📢 <b>ANNOUNCEMENT</b>"     # first line of broadcast messages, as the fake API counts them
+# scenario -> Bench method
+SCENARIOS = {"search": "search", "inline": "inline", "list": "list_pages", "vote_burst": "vote_burst",
+             "approve": "approve", "broadcast": "broadcast", "limited": "limited"}
+# config.py's defaults (Telegram's published limits), for the "limited" scenario
+TELEGRAM_LIMITS = {"global_rate": 30, "private_rate": 1, "group_per_minute": 20, "burst": 3}
+# Telegram's limits would make the other scenarios measure the scheduler's pacing instead
+UNLIMITED = {
+    "OUTBOUND_GLOBAL_RATE": "1000000",
+    "OUTBOUND_PRIVATE_RATE": "1000000",
+    "OUTBOUND_GROUP_PER_MINUTE": "1000000",
+    "OUTBOUND_CHAT_BURST": "1000",
+}
+
+def configure(api_url: str):
+    """Environment for config.py; must run before anything imports it."""
+    use_bench_db()
+    os.environ.update(UNLIMITED)
+    os.environ["BOT_TOKEN"] = TOKEN
+    os.environ["BOT_API_URL"] = api_url
+    os.environ["UPDATE_LOG"] = ""
+    os.environ.setdefault("CHANNEL_ID", "-1001000000001")
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest rank."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+class Bench:
+    def __init__(self, api, users: int, requests: int, concurrency: int):
+        self.app = None
+        self.api = api
+        self.user_count = users
+        self.requests = requests
+        self.concurrency = concurrency
+        self.rng = random.Random(1)
+        self.errors = collections.Counter()     # scenario -> handler errors
+        self.scenario = None
+        self.submissions = []                   # ids inserted for the approve scenario
+
+    async def on_error(self, update, context):
+        self.errors[self.scenario] += 1
+        if self.errors[self.scenario] <= 3:
+            print(f"  ⚠️ {self.scenario}: {context.error!r}")
+
+    async def process(self, data: dict):
+        from telegram import Update
+        update = Update.de_json(data, self.app.bot)
+        await self.app.update_processor.process_update(update, self.app.process_update(update))
+
+    async def drive(self, ops: list, latencies: list = None):
+        """Runs ops (lists of update dicts, each list in order) `concurrency` at a time."""
+        pending = iter(ops)
+
+        async def worker():
+            for op in pending:
+                for data in op:
+                    started = time.perf_counter()
+                    await self.process(data)
+                    if latencies is not None:
+                        latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def measure(self, name: str, ops: list, warmup: list = ()) -> dict:
+        self.scenario = name
+        await self.drive(list(warmup))
+        self.errors[name] = 0
+        latencies = []
+        started = time.perf_counter()
+        await self.drive(ops, latencies)
+        elapsed = time.perf_counter() - started
+        return self.result(name, latencies, len(latencies) / elapsed if elapsed else 0.0)
+
+    def result(self, name: str, latencies: list, throughput: float) -> dict:
+        latencies.sort()
+        return {
+            "count": len(latencies),
+            "errors": self.errors[name],
+            "throughput": round(throughput, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    def users(self, count: int) -> list:
+        from bench.generate import USER_BASE
+        return [USER_BASE + MODS + self.rng.randrange(self.user_count - MODS) for _ in range(count)]
+
+    def warmup(self, build) -> list:
+        return build(max(10, self.requests // 20))
+
+    # --- Scenarios ---
+
+    def search_ops(self, count: int) -> list:
+        from bench import updates
+        from bench.generate import vocabulary, skewed
+        vocab = vocabulary()
+        ops = []
+        for user_id in self.users(count):
+            words = [vocab[skewed(self.rng, len(vocab))] for _ in range(self.rng.choice((1, 1, 2)))]
+            ops.append([updates.command(user_id, "search", *words)])
+        return ops
+
+    async def search(self):
+        return await self.measure("search", self.search_ops(self.requests), self.warmup(self.search_ops))
+
+    def inline_ops(self, count: int) -> list:
+        """`count` keystrokes, in typing sessions of one user each."""
+        from bench import updates
+        from bench.generate import vocabulary, skewed, username
+        vocab = vocabulary()
+        ops, keystrokes = [], 0
+        while keystrokes < count:
+            user_id = self.users(1)[0]
+            if self.rng.random() < 0.3:
+                target = username(skewed(self.rng, 10_000) + 1, vocab)[1:12]
+            else:
+                target = " ".join(vocab[skewed(self.rng, len(vocab))] for _ in range(self.rng.randint(1, 2)))
+            session = [updates.inline_query(user_id, target[:n]) for n in range(1, len(target) + 1)]
+            session = session[:count - keystrokes]
+            keystrokes += len(session)
+            ops.append(session)
+        return ops
+
+    async def inline(self):
+        return await self.measure("inline", self.inline_ops(self.requests), self.warmup(self.inline_ops))
+
+    def page_cursors(self) -> list:
+        """Callback data of the Next button on pages 0..LIST_DEPTH-1, as /list renders it."""
+        from handlers.list_bots import BOTS_PER_PAGE, page_data, ranked_page
+        cursors, direction, cursor = [], None, None
+        for page in range(LIST_DEPTH):
+            _, bots = ranked_page(direction, cursor)
+            if len(bots) <= BOTS_PER_PAGE:
+                break
+            last = bots[BOTS_PER_PAGE - 1]
+            cursors.append(page_data(page + 1, "n", last))
+            direction, cursor = "n", (float(last.rating or 0.0), last.bot_id)
+        return cursors
+
+    def list_ops(self, count: int) -> list:
+        from bench import updates
+        from bench.generate import skewed
+        cursors = self.page_cursors()
+        ops, sent = [], 0
+        while sent < count:
+            user_id = self.users(1)[0]
+            op = [updates.command(user_id, "list")]
+            op += [updates.callback(user_id, data) for data in cursors[:skewed(self.rng, len(cursors) + 1)]]
+            op = op[:count - sent]
+            sent += len(op)
+            ops.append(op)
+        return ops
+
+    async def list_pages(self):
+        return await self.measure("list", self.list_ops(self.requests), self.warmup(self.list_ops))
+
+    def vote_ops(self, count: int) -> list:
+        import config
+        from bench import updates
+        from bench.generate import HOT_BOT
+        chat = updates.channel(config.CHANNEL_ID)
+        scores = (1, 2, 3, 4, 5, 5)
+        return [[updates.callback(user_id, f"rate_{HOT_BOT}_{self.rng.choice(scores)}", chat, 10_000 + HOT_BOT)]
+                for user_id in self.users(count)]
+
+    async def vote_burst(self):
+        return await self.measure("vote_burst", self.vote_ops(self.requests), self.warmup(self.vote_ops))
+
+    async def add_submissions(self, count: int):
+        """Pending submissions for the approve scenario (before post_init, so the views include them)."""
+        from sqlalchemy import insert
+        from database import BotSubmission, engine
+        from services import counters
+        from bench.generate import USER_BASE
+        stamp = int(time.time())
+        rows = [{"bot_username": f"@bench{stamp}_{i}_bot", "description": f"Benchmark submission {i}.",
+                 "features": "bench", "category": "Other", "submitted_by": USER_BASE + MODS + i,
+                 "status": "pending"} for i in range(count)]
+        with engine.begin() as conn:
+            result = conn.execute(insert(BotSubmission).returning(BotSubmission.id), rows)
+            self.submissions = [row[0] for row in result]
+            counters.recount(conn)
+
+    async def approve(self):
+        import config
+        from bench import updates
+        from bench.generate import USER_BASE
+        staff = updates.group(config.STAFF_GROUP_ID)
+        ops = []
+        for i, sub_id in enumerate(self.submissions):
+            mod = USER_BASE + i % MODS
+            ops.append([updates.callback(mod, f"mod_{action}_{sub_id}", staff) for action in ("claim", "approve")])
+        return await self.measure("approve", ops)
+
+    async def broadcast(self):
+        """/start latency while a broadcast runs; throughput is broadcast messages per second."""
+        import config
+        from bench import updates
+        from services.broadcast import broadcast_engine
+        start_ops = [[updates.command(user_id, "start")] for user_id in self.users(self.requests)]
+        await self.drive(self.warmup(lambda count: start_ops[:count]))
+
+        self.scenario = "broadcast"
+        self.errors["broadcast"] = 0
+        await self.process(updates.command(config.OWNER_ID, "broadcast", "Benchmark", "announcement"))
+        sent_before = self.api.texts[ANNOUNCEMENT]
+        latencies = []
+        started = time.perf_counter()
+        await self.drive(start_ops, latencies)
+        elapsed = time.perf_counter() - started
+        sent = self.api.texts[ANNOUNCEMENT] - sent_before
+        job_ids = list(broadcast_engine.tasks)
+        await broadcast_engine.stop()
+        await finish_broadcasts(job_ids)
+        return self.result("broadcast", latencies, sent / elapsed if elapsed else 0.0)
+
+    async def limited(self):
+        """Votes and inline typing while a broadcast runs, under Telegram's limits:
+        callback and inline answers must not queue behind the broadcast."""
+        import config
+        from bench import updates
+        from services.broadcast import broadcast_engine
+        from services.outbound import OutboundScheduler
+        request = self.app.bot.request
+        unlimited, request.scheduler = request.scheduler, OutboundScheduler(**TELEGRAM_LIMITS)
+        try:
+            await self.process(updates.command(config.OWNER_ID, "broadcast", "Benchmark", "announcement"))
+            votes, inline = self.vote_ops(self.requests // 2), self.inline_ops(self.requests - self.requests // 2)
+            ops = [op for pair in itertools.zip_longest(votes, inline) for op in pair if op]
+            result = await self.measure("limited", ops)
+            job_ids = list(broadcast_engine.tasks)
+            await broadcast_engine.stop()
+            await finish_broadcasts(job_ids)
+        finally:
+            await request.scheduler.stop()
+            request.scheduler = unlimited
+        return result
+
+    async def cleanup(self, started: datetime.datetime):
+        """Deletes what the approve scenario added, and the outbox rows of this run."""
+        from sqlalchemy import delete, select
+        from database import AsyncSessionLocal, Bot, BotSubmission, OutboxMessage, engine
+        from services import counters
+        if self.submissions:
+            async with AsyncSessionLocal() as session:
+                bot_ids = (await session.scalars(
+                    select(Bot.bot_id).where(Bot.submission_id.in_(self.submissions)))).all()
+                await session.execute(delete(Bot).where(Bot.bot_id.in_(bot_ids)))
+                await session.execute(delete(BotSubmission).where(BotSubmission.id.in_(self.submissions)))
+                await session.execute(delete(OutboxMessage).where(OutboxMessage.created_at >= started))
+                await session.commit()
+        with engine.begin() as conn:
+            counters.recount(conn)
+
+async def finish_broadcasts(job_ids: list):
+    """Marks stopped broadcasts done; otherwise the next run (or a bot started on
+    this DB) would resume them."""
+    from sqlalchemy import update
+    from database import AsyncSessionLocal, Broadcast
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Broadcast).where(Broadcast.id.in_(job_ids)).values(
+            status="done", finished_at=datetime.datetime.utcnow()))
+        await session.commit()
+
+def backend() -> str:
+    import config
+    return "postgresql" if config.DB_URL.startswith("postgres") else "sqlite"
+
+async def catalog_size() -> dict:
+    from sqlalchemy import func, select
+    from database import AsyncSessionLocal, Bot, User
+    async with AsyncSessionLocal() as session:
+        return {"users": await session.scalar(select(func.count()).select_from(User)),
+                "bots": await session.scalar(select(func.count()).select_from(Bot))}
+
+async def make_mods():
+    from sqlalchemy import update
+    from database import AsyncSessionLocal, User
+    from bench.generate import USER_BASE
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(User).where(User.user_id.between(USER_BASE, USER_BASE + MODS - 1))
+                              .values(role="mod"))
+        await session.commit()
+
+@contextlib.asynccontextmanager
+async def application(error_handler):
+    """The bot's Application, started as main.py starts it but without an updater
+    (updates are fed to it directly). configure() must have run."""
+    from main import application_builder, register_handlers, post_init, post_stop
+    # A log line per Bot API call would cost more than most handlers
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    app = application_builder().updater(None).build()
+    register_handlers(app)
+    app.add_error_handler(error_handler)
+    await app.initialize()
+    await post_init(app)
+    await app.start()
+    try:
+        yield app
+    finally:
+        await app.stop()
+        await post_stop(app)
+        await app.shutdown()
+
+async def prepare_db() -> dict:
+    """Brings the schema up to date and returns the catalog size; exits without a catalog."""
+    from database import init_db
+    init_db()
+    size = await catalog_size()
+    if not size["bots"] or size["users"] < 1000:
+        sys.exit("The benchmark needs a catalog: python -m bench.generate --scale small (or full)")
+    return size
+
+async def run(args) -> dict:
+    from bench.fake_api import FakeBotApi
+    api = FakeBotApi(args.latency_ms / 1000)
+    configure(args.api_url or await api.start())
+
+    size = await prepare_db()
+    bench = Bench(api, size["users"], args.requests, args.concurrency)
+    started = datetime.datetime.utcnow()
+    scenarios = args.scenarios.split(",")
+    await make_mods()
+    if "approve" in scenarios:
+        await bench.add_submissions(args.requests // 2)
+
+    results = {}
+    try:
+        async with application(bench.on_error) as bench.app:
+            for name in scenarios:
+                print(f"⏱️ {name}...")
+                results[name] = await getattr(bench, SCENARIOS[name])()
+    finally:
+        await bench.cleanup(started)
+        await api.stop()
+
+    return {
+        "meta": {"backend": backend(), **size, "requests": args.requests, "concurrency": args.concurrency},
+        "results": results,
+    }
+
+def report(report_data: dict):
+    meta = report_data["meta"]
+    print(f"\n{meta['backend']}: {meta['bots']} bots, {meta['users']} users, "
+          f"{meta['requests']} requests per scenario, concurrency {meta['concurrency']}\n")
+    print(f"{'scenario':<12}{'count':>8}{'errors':>8}{'per s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in report_data["results"].items():
+        print(f"{name:<12}{r['count']:>8}{r['errors']:>8}{r['throughput']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+def comparable(meta: dict, base: dict) -> bool:
+    def close(a, b):
+        return abs(a - b) <= 0.05 * max(a, b, 1)
+    return (meta["backend"] == base["backend"] and meta["concurrency"] == base["concurrency"]
+            and all(close(meta[key], base[key]) for key in ("users", "bots", "requests")))
+
+def regressions(report_data: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    for name, r in report_data["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            continue
+        if r["p95_ms"] > base["p95_ms"] * (1 + tolerance) + 1:
+            found.append(f"{name}: p95 {r['p95_ms']} ms, baseline {base['p95_ms']} ms")
+        if r["throughput"] < base["throughput"] * (1 - tolerance):
+            found.append(f"{name}: {r['throughput']}/s, baseline {base['throughput']}/s")
+        if r["errors"] > base["errors"]:
+            found.append(f"{name}: {r['errors']} errors, baseline {base['errors']}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a synthetic catalog.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000, help="updates per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="simulated users at once")
+    parser.add_argument("--latency-ms", type=float, default=0, help="fake Bot API response time")
+    parser.add_argument("--api-url", help="use a Bot API stand-in that's already running")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    use_bench_db()
+    report_data = asyncio.run(run(args))
+    report(report_data)
+
+    path = BASELINES / f"{report_data['meta']['backend']}.json"
+    if args.save_baseline:
+        BASELINES.mkdir(exist_ok=True)
+        path.write_text(json.dumps(report_data, indent=2) + "\n")
+        print(f"\n💾 Baseline saved to {path}")
+        return
+    if not path.exists():
+        print(f"\nNo baseline at {path} (save one with --save-baseline).")
+        return
+    baseline = json.loads(path.read_text())
+    if not comparable(report_data["meta"], baseline["meta"]):
+        print(f"\nBaseline {path} was taken with a different catalog, request count or concurrency; not compared.")
+        return
+    found = regressions(report_data, baseline, args.tolerance)
+    if found:
+        print(f"\n❌ Regressions against {path}:")
+        for line in found:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\n✅ Within {args.tolerance:.0%} of {path}")
+
+if __name__ == "__main__":
+    main()
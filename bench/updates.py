@@ -0,0 +1,62 @@
+"""Update JSON as Telegram sends it, for the scenarios in bench/run.py.
+
+Each builder returns a plain dict (what Update.de_json takes) with a fresh
+update_id. Users are private chats with the same id.
+"""
+import itertools
+import time
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+def private_chat(user_id: int) -> dict:
+    return {"id": user_id, "type": "private", "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+def message(user_id: int, text: str) -> dict:
+    msg = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": private_chat(user_id),
+        "from": user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split(" ", 1)[0])}]
+    return {"update_id": next(_update_ids), "message": msg}
+
+def command(user_id: int, name: str, *args) -> dict:
+    return message(user_id, " ".join((f"/{name}",) + tuple(str(a) for a in args)))
+
+def callback(user_id: int, data: str, chat: dict = None, message_id: int = None) -> dict:
+    """A button press on a message in `chat` (the user's private chat by default)."""
+    chat = chat or private_chat(user_id)
+    return {"update_id": next(_update_ids), "callback_query": {
+        "id": str(next(_update_ids)),
+        "from": user(user_id),
+        "chat_instance": str(chat["id"]),
+        "data": data,
+        "message": {
+            "message_id": message_id or next(_message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "text": "…",
+        },
+    }}
+
+def inline_query(user_id: int, query: str) -> dict:
+    return {"update_id": next(_update_ids), "inline_query": {
+        "id": str(next(_update_ids)),
+        "from": user(user_id),
+        "query": query,
+        "offset": "",
+    }}
+
+def channel(chat_id) -> dict:
+    chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else -1001000000001
+    return {"id": chat_id, "type": "channel", "title": "BotLibrary"}
+
+def group(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "supergroup", "title": "Staff"}
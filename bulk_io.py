@@ -0,0 +1,284 @@
+"""Bulk import / export of users, bots and votes as JSONL or CSV.
+
+    python bulk_io.py export bots bots.jsonl
+    python bulk_io.py import votes votes.csv.gz
+
+The format follows the extension (.jsonl or .csv, optionally .gz). An import is
+one transaction through a staging table; existing rows win. Import users, then
+bots, then votes, and restart a running bot afterwards.
+"""
+import csv
+import datetime
+import gzip
+import io
+import json
+import sys
+import time
+from sqlalchemy import Table, Column, MetaData, select, text, func
+from database import IS_POSTGRES, make_engine, User, Bot, Vote
+
+BATCH_SIZE = 5000
+
+# Columns that travel. Aggregates (rating, ...) aren't imported; they're rebuilt from votes.
+TABLES = {
+    "users": (User, ["user_id", "username", "role", "join_date", "last_seen", "blocked"]),
+    "bots": (Bot, ["bot_id", "username", "description", "features", "category", "submitted_by",
+                   "approved_by", "submission_date", "approval_date", "channel_message_id"]),
+    "votes": (Vote, ["bot_id", "user_id", "score", "voted_at"]),
+}
+EXPORT_EXTRA = {"bots": ["rating", "vote_count"]}     # informational, ignored on import
+
+# Staging -> real table. {stage} is the staging table, {bot_id} the bots id expression.
+_MOVE = {
+    "users": """
+        INSERT INTO users (user_id, username, role, join_date, last_seen, blocked)
+        SELECT user_id, username, role, join_date, last_seen, blocked FROM {stage}
+        WHERE user_id IS NOT NULL
+        ON CONFLICT DO NOTHING""",
+    "bots": """
+        INSERT INTO bots (bot_id, username, description, features, category, submitted_by, approved_by,
+                          submission_date, approval_date, channel_message_id, score_sum, vote_count, rating)
+        SELECT {bot_id}, s.username, s.description, s.features, s.category,
+               (SELECT user_id FROM users WHERE user_id = s.submitted_by),
+               (SELECT user_id FROM users WHERE user_id = s.approved_by),
+               s.submission_date, s.approval_date, s.channel_message_id, 0, 0, 0.0
+        FROM {stage} s
+        WHERE s.username IS NOT NULL
+        ON CONFLICT DO NOTHING""",
+    "votes": """
+        INSERT INTO votes (bot_id, user_id, score, voted_at)
+        SELECT s.bot_id, s.user_id, s.score, s.voted_at FROM {stage} s
+        WHERE s.score BETWEEN 1 AND 5 AND EXISTS (SELECT 1 FROM bots WHERE bots.bot_id = s.bot_id)
+        ON CONFLICT DO NOTHING""",
+}
+
+# --- files ---
+
+def _format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".jsonl"):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    raise SystemExit(f"Can't tell the format of {path!r}: use .jsonl or .csv (optionally .gz)")
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+def _read(path: str):
+    """Yields one dict per record, streaming."""
+    with _open(path, "r") as f:
+        if _format(path) == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _plain(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+# --- values ---
+
+def _converter(column):
+    python_type = column.type.python_type
+    if python_type is bool:
+        return lambda v: v if isinstance(v, bool) else str(v).strip().lower() in ("1", "t", "true", "yes")
+    if python_type is datetime.datetime:
+        return lambda v: v if isinstance(v, datetime.datetime) else datetime.datetime.fromisoformat(v)
+    if python_type is datetime.date:
+        return lambda v: v if isinstance(v, datetime.date) else datetime.date.fromisoformat(v)
+    if python_type is str:
+        return str
+    return python_type   # int, float
+
+def _row_builder(model, names):
+    """record dict -> tuple of typed values in `names` order. Missing values get the
+    model's default; empty CSV cells count as missing except in text columns."""
+    columns = [model.__table__.columns[name] for name in names]
+    converters = [_converter(c) for c in columns]
+    defaults = []
+    for c in columns:
+        if c.default is not None and c.default.is_scalar:
+            defaults.append(lambda value=c.default.arg: value)
+        elif c.default is not None and c.default.is_callable:
+            defaults.append(lambda fn=c.default.arg: fn(None))
+        else:
+            defaults.append(lambda: None)
+    text_columns = [c.type.python_type is str for c in columns]
+
+    def build(record: dict):
+        values = []
+        for name, convert, default, is_text in zip(names, converters, defaults, text_columns):
+            value = record.get(name)
+            if value is None or (value == "" and not is_text):
+                values.append(default())
+            else:
+                values.append(convert(value))
+        return tuple(values)
+    return build
+
+# --- Postgres COPY ---
+
+# COPY's csv NULL marker. The default (an empty field) would make every empty
+# string NULL too, since csv.writer doesn't quote empty fields.
+_COPY_NULL = "\\N"
+
+class _CsvStream(io.RawIOBase):
+    """Read-only file object turning row tuples into COPY csv text, a chunk at a time."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = b""
+        self.count = 0
+        self.out = io.StringIO()
+        self.writer = csv.writer(self.out, lineterminator="\n")
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow([_copy_value(v) for v in row])
+            self.count += 1
+            if self.out.tell() > 65536 or size < 0:
+                self._drain()
+        self._drain()
+        if size < 0:
+            chunk, self.buffer = self.buffer, b""
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+    def _drain(self):
+        self.buffer += self.out.getvalue().encode("utf-8")
+        self.out.seek(0)
+        self.out.truncate()
+
+def _copy_value(value):
+    if value is None:
+        return _COPY_NULL
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+def _raw_cursor(conn):
+    return conn.connection.driver_connection.cursor()
+
+# --- import ---
+
+def import_file(table_name: str, path: str):
+    import_records(table_name, _read(path))
+
+def import_records(table_name: str, records):
+    """Imports an iterable of record dicts (what a file line / CSV row holds); see above."""
+    model, names = TABLES[table_name]
+    build = _row_builder(model, names)
+    engine = make_engine()
+    started = time.monotonic()
+
+    stage = Table(
+        f"import_{table_name}", MetaData(),
+        *[Column(name, model.__table__.columns[name].type) for name in names],
+        prefixes=["TEMPORARY"],
+    )
+    with engine.begin() as conn:
+        stage.drop(conn, checkfirst=True)
+        stage.create(conn)
+
+        rows = (build(record) for record in records)
+        if IS_POSTGRES:
+            stream = _CsvStream(rows)
+            _raw_cursor(conn).copy_expert(
+                f"COPY {stage.name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')", stream)
+            staged = stream.count
+        else:
+            staged = 0
+            insert = stage.insert()
+            batch = []
+            for row in rows:
+                batch.append(dict(zip(names, row)))
+                if len(batch) >= BATCH_SIZE:
+                    conn.execute(insert, batch)
+                    staged += len(batch)
+                    batch = []
+            if batch:
+                conn.execute(insert, batch)
+                staged += len(batch)
+
+        bot_id = "s.bot_id"
+        if table_name == "bots" and IS_POSTGRES:
+            # Explicit ids first, so ids handed out for rows without one can't collide
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('bots', 'bot_id'), GREATEST("
+                f"(SELECT MAX(bot_id) FROM bots), (SELECT MAX(bot_id) FROM {stage.name}), 1))"
+            ))
+            bot_id = "COALESCE(s.bot_id, nextval(pg_get_serial_sequence('bots', 'bot_id')))"
+        inserted = conn.execute(text(_MOVE[table_name].format(stage=stage.name, bot_id=bot_id))).rowcount
+
+        _rebuild(conn, table_name, stage.name)
+        stage.drop(conn)
+
+    elapsed = time.monotonic() - started
+    print(f"✅ {table_name}: {staged} read, {inserted} inserted, {staged - inserted} skipped "
+          f"(already present or invalid) in {elapsed:.1f}s")
+
+def _rebuild(conn, table_name: str, stage_name: str):
+    from services.counters import recount
+    from services.votes import rebuild_aggregates
+
+    if table_name == "votes":
+        rebuild_aggregates(conn, bots_from=stage_name)
+    recount(conn)
+
+# --- export ---
+
+def export_file(table_name: str, path: str):
+    model, names = TABLES[table_name]
+    names = names + EXPORT_EXTRA.get(table_name, [])
+    columns = [model.__table__.columns[name] for name in names]
+    order = list(model.__table__.primary_key.columns)
+    engine = make_engine()
+    fmt = _format(path)
+    started = time.monotonic()
+    count = 0
+
+    with engine.connect() as conn, _open(path, "w") as f:
+        if IS_POSTGRES and fmt == "csv":
+            query = select(*columns).order_by(*order).compile(conn)
+            _raw_cursor(conn).copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            count = conn.scalar(select(func.count()).select_from(model.__table__))
+        else:
+            writer = None
+            if fmt == "csv":
+                writer = csv.writer(f, lineterminator="\n")
+                writer.writerow(names)
+            result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(
+                select(*columns).order_by(*order))
+            for row in result:
+                if writer:
+                    writer.writerow(["" if v is None else _copy_value(v) for v in row])
+                else:
+                    f.write(json.dumps(dict(zip(names, map(_plain, row))), ensure_ascii=False) + "\n")
+                count += 1
+
+    print(f"✅ {table_name}: {count} rows exported to {path} in {time.monotonic() - started:.1f}s")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("import", "export") or sys.argv[2] not in TABLES:
+        print(f"Usage: python bulk_io.py import|export {'|'.join(TABLES)} FILE.jsonl|FILE.csv[.gz]")
+        sys.exit(2)
+    command, table_name, path = sys.argv[1:]
+    if command == "import":
+        import_file(table_name, path)
+    else:
+        export_file(table_name, path)
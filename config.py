@@ -1,9 +1,12 @@
 import os
+import hashlib
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Bot API server, when not api.telegram.org: a local Bot API server, or bench/fake_api.py
+BOT_API_URL = os.getenv("BOT_API_URL", "").rstrip("/")
 OWNER_ID = int(os.getenv("OWNER_ID", "5667016949"))
 # Channel to post approved bots to
 CHANNEL_ID = os.getenv("CHANNEL_ID") 
@@ -12,4 +15,93 @@ SUDO_USERS = set(int(x) for x in os.getenv("SUDO_USERS", "").split(",") if x)
 SUDO_USERS.add(OWNER_ID)
 
 DB_URL = os.getenv("DB_URL", "sqlite:///botlibrary.db")
+
+# Connection pool (per engine). Serverless Postgres (Neon) drops idle connections and
+# cold-starts slowly, so connections are pinged before use and recycled before they go stale.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "240"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Connections opened at boot so the first updates don't pay for the connect
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "2"))
+# Behind PgBouncer in transaction mode (e.g. Neon's "-pooler" host): no prepared statements
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "true" if "-pooler" in DB_URL else "false").lower() in ("1", "true", "yes")
 STAFF_GROUP_ID = int(os.getenv("STAFF_GROUP_ID", "-1003601833258"))
+
+# "polling" for local development, "webhook" in production. Both serve /, /ready and
+# /metrics on PORT; in webhook mode Telegram also posts updates to WEBHOOK_URL + WEBHOOK_PATH.
+RUN_MODE = os.getenv("RUN_MODE", "polling").lower()
+PORT = int(os.getenv("PORT", "8080"))
+# Public base URL, e.g. https://botlibrary.onrender.com (Render sets RENDER_EXTERNAL_URL)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", os.getenv("RENDER_EXTERNAL_URL", "")).rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Telegram echoes this back in a header on every webhook call; derived from the token if unset
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Updates processed at once. Updates from the same user, and clicks on the same bot or
+# submission, still run one at a time (see services/update_processor.py)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+# Updates admitted but waiting for a key held by an earlier one
+UPDATE_BACKLOG = int(os.getenv("UPDATE_BACKLOG", "1000"))
+
+# Votes are acknowledged instantly and written in batches this often
+VOTE_FLUSH_INTERVAL_MS = int(os.getenv("VOTE_FLUSH_INTERVAL_MS", "500"))
+# A bot's channel post is edited at most once per this many seconds (Telegram flood limits;
+# never less than the channel lane's spacing, 60 / OUTBOUND_GROUP_PER_MINUTE)
+CHANNEL_EDIT_WINDOW = float(os.getenv("CHANNEL_EDIT_WINDOW", "5"))
+
+# Force-join check cache for votes (per user). Non-members are re-checked sooner.
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "600"))
+MEMBERSHIP_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "30"))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))
+
+# New /start users are inserted in batches this often; last_seen is written at most
+# once per LAST_SEEN_INTERVAL seconds per user (username changes go out right away)
+USER_FLUSH_INTERVAL_MS = int(os.getenv("USER_FLUSH_INTERVAL_MS", "300"))
+LAST_SEEN_INTERVAL = float(os.getenv("LAST_SEEN_INTERVAL", "300"))
+LAST_SEEN_CACHE_SIZE = int(os.getenv("LAST_SEEN_CACHE_SIZE", "100000"))
+
+# Staff roles are cached in memory; other workers' changes arrive via NOTIFY on
+# Postgres, and every worker re-reads them this often as a fallback
+ROLE_RELOAD_INTERVAL = float(os.getenv("ROLE_RELOAD_INTERVAL", "60"))
+# Same for the catalog (approvals, deletions, ratings), but rebuilding its views costs
+# seconds on a large catalog, so workers only reload when NOTIFY isn't available
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "300"))
+
+# Broadcasts, paced by the outbound scheduler's bulk lane (OUTBOUND_* below)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "200"))
+
+# Rendered /list pages, invalidated whenever the catalog changes
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "1000"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "3600"))
+
+# New submissions are compared against the catalog and pending submissions; matches
+# at or above this estimated word-pair overlap are shown to mods (0..1)
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.5"))
+DUPLICATE_MATCHES = int(os.getenv("DUPLICATE_MATCHES", "3"))
+
+# Outbound Bot API calls (services/outbound.py), after Telegram's published limits:
+# ~30 messages/s overall, ~1/s in a private chat (short bursts are tolerated),
+# 20/minute in a group or channel
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+# A 429 is waited out and retried this many times, if Telegram asks for at most this many seconds
+OUTBOUND_RETRIES = int(os.getenv("OUTBOUND_RETRIES", "3"))
+OUTBOUND_MAX_RETRY_AFTER = float(os.getenv("OUTBOUND_MAX_RETRY_AFTER", "60"))
+
+# Channel posts and submitter DMs after approve / reject go through the outbox;
+# the worker also polls this often for retries and rows left by other workers
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "10"))
+
+# Opt-in: append anonymized incoming updates to this gzipped JSONL file, for replaying
+# a load incident with bench/replay.py (see services/update_log.py). Off when empty.
+UPDATE_LOG = os.getenv("UPDATE_LOG", "")
+# Fraction of users whose updates are kept (all of them, for each kept user)
+UPDATE_LOG_SAMPLE = float(os.getenv("UPDATE_LOG_SAMPLE", "1"))
+# Key for the user id pseudonyms; set it to keep them stable across restarts
+UPDATE_LOG_SALT = os.getenv("UPDATE_LOG_SALT", "")
@@ -1,6 +1,13 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime, JSON, Boolean, BigInteger
-from sqlalchemy.orm import DeclarativeBase, sessionmaker, relationship
+from sqlalchemy import create_engine, make_url, text, Index, Column, Integer, String, Float, ForeignKey, DateTime, Date, JSON, Boolean, BigInteger
+from sqlalchemy.orm import DeclarativeBase, sessionmaker, relationship, deferred
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from datetime import datetime
+from uuid import uuid4
+import asyncio
+import re
+import time
 import config
 
 class Base(DeclarativeBase):
@@ -12,6 +19,9 @@ class User(Base):
     username = Column(String, nullable=True)
     role = Column(String, default="user") # owner, sudo, mod, user
     join_date = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, nullable=True)
+    # Set when a broadcast finds the user blocked the bot; later broadcasts skip them
+    blocked = Column(Boolean, default=False)
     
     # Relationships
     submissions = relationship("BotSubmission", back_populates="submitter", foreign_keys="BotSubmission.submitted_by")
@@ -26,11 +36,13 @@ class Bot(Base):
     features = Column(String)
     category = Column(String)
     
-    # Rating stats
+    # Rating stats: running aggregates over the votes table, kept current by services.votes.record_vote
     rating = Column(Float, default=0.0)
+    score_sum = Column(Integer, default=0)
     vote_count = Column(Integer, default=0)
-    # Keeping track of who voted to prevent duplicates: {user_id: score}
-    votes_data = Column(JSON, default=dict)
+    # Legacy {user_id: score} dict, superseded by the votes table (see migrate_votes.py).
+    # Deferred so ordinary Bot loads don't drag it along.
+    votes_data = deferred(Column(JSON, default=dict))
     
     submitted_by = Column(BigInteger, ForeignKey("users.user_id"))
     approved_by = Column(BigInteger, ForeignKey("users.user_id"))
@@ -39,6 +51,12 @@ class Bot(Base):
     approval_date = Column(DateTime, default=datetime.utcnow)
     channel_message_id = Column(Integer, nullable=True)
 
+    # Match the (rating DESC, bot_id ASC) order used by Top Rated, categories and /list paging
+    __table_args__ = (
+        Index("ix_bots_rating", rating.desc(), bot_id),
+        Index("ix_bots_category_rating", category, rating.desc(), bot_id),
+    )
+
 class BotSubmission(Base):
     __tablename__ = "submissions"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -57,9 +75,196 @@ class BotSubmission(Base):
     claimed_by = Column(BigInteger, ForeignKey("users.user_id"), nullable=True)
     reviewer = relationship("User", foreign_keys=[claimed_by], back_populates="reviews")
     claim_time = Column(DateTime, nullable=True)
-    
-engine = create_engine(config.DB_URL)
+
+    __table_args__ = (
+        Index("ix_submissions_status", status),
+        Index("ix_submissions_bot_username", bot_username, status), # duplicate check in get_name
+        Index("ix_submissions_claimed_by", claimed_by),
+        Index("ix_submissions_claim_time", claim_time),
+    )
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    text = Column(String)
+    created_by = Column(BigInteger)
+    status = Column(String, default="running") # running, done
+    # Users are sent to in user_id order; a restart resumes after this id
+    last_user_id = Column(BigInteger, default=0)
+    sent_count = Column(Integer, default=0)
+    blocked_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class Vote(Base):
+    __tablename__ = "votes"
+    bot_id = Column(Integer, ForeignKey("bots.bot_id", ondelete="CASCADE"), primary_key=True)
+    # Voters don't have to have /start-ed the bot, so no FK to users
+    user_id = Column(BigInteger, primary_key=True)
+    score = Column(Integer, nullable=False)
+    voted_at = Column(DateTime, default=datetime.utcnow)
+
+class Counter(Base):
+    """Running totals for /stats, changed in the same transaction as the rows they
+    count (see services/counters.py)."""
+    __tablename__ = "counters"
+    name = Column(String, primary_key=True) # users, bots, bots:<category>, pending, votes, ...
+    value = Column(BigInteger, nullable=False, default=0)
+
+class DailyStat(Base):
+    """Counter values at the start of each UTC day, written by the daily rollup job."""
+    __tablename__ = "daily_stats"
+    day = Column(Date, primary_key=True)
+    name = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False)
+
+class OutboxMessage(Base):
+    """Telegram side effects of a moderation decision, written in the same transaction
+    as the decision and delivered by services/outbox.py. Delivered rows are deleted."""
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)   # bot_approved, message
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, default=0)
+    # When it's due; a worker holding the row pushes it out by a lease. NULL: gave up
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_outbox_due", next_attempt_at),
+    )
+
+class SchemaVersion(Base):
+    """One row per applied step of migrations.MIGRATIONS."""
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+def _async_url(url: str) -> str:
+    """Maps the sync DB_URL onto its async driver (asyncpg / aiosqlite)."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if url.startswith("postgresql:") or url.startswith("postgresql+psycopg2:"):
+        url = re.sub(r"^postgresql(\+psycopg2)?:", "postgresql+asyncpg:", url)
+        # asyncpg doesn't understand libpq's sslmode/channel_binding (Neon adds both)
+        url = re.sub(r"([?&])sslmode=", r"\1ssl=", url)
+        url = re.sub(r"[?&]channel_binding=[^&]*", "", url)
+        if "&" in url and "?" not in url:
+            url = url.replace("&", "?", 1)
+    return url
+
+class _PoolStats:
+    """Adds counters to a QueuePool: callers waiting for a connection and connect latency."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.slowest_connect = 0.0
+
+    def _do_get(self):
+        self.waiting += 1
+        try:
+            return super()._do_get()
+        finally:
+            self.waiting -= 1
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        record = super()._create_connection()
+        elapsed = time.perf_counter() - start
+        self.connects += 1
+        self.connect_seconds += elapsed
+        self.slowest_connect = max(self.slowest_connect, elapsed)
+        return record
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": max(0, self.overflow()),
+            "waiting": self.waiting,
+            "connects": self.connects,
+            "avg_connect_ms": 1000 * self.connect_seconds / self.connects if self.connects else 0.0,
+            "max_connect_ms": 1000 * self.slowest_connect,
+        }
+
+class StatsQueuePool(_PoolStats, QueuePool):
+    pass
+
+class StatsAsyncQueuePool(_PoolStats, AsyncAdaptedQueuePool):
+    pass
+
+def make_engine(url: str = None, asynchronous: bool = False):
+    """Every engine in the project comes from here, so pool settings apply everywhere."""
+    url = url or config.DB_URL
+    if asynchronous:
+        url = _async_url(url)
+    kwargs = {}
+    parsed = make_url(url)
+    # In-memory SQLite needs SQLAlchemy's default single-connection pool
+    if not (parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")):
+        kwargs.update(
+            poolclass=StatsAsyncQueuePool if asynchronous else StatsQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+        )
+    if config.DB_PGBOUNCER and url.startswith("postgresql+asyncpg"):
+        # Transaction pooling hands each transaction whichever server connection is free,
+        # so statements prepared on one may not exist on the next: turn both caches off
+        # (SQLAlchemy's via the URL, asyncpg's via connect_args) and never reuse a name.
+        url = parsed.update_query_dict({"prepared_statement_cache_size": "0"})
+        kwargs["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    factory = create_async_engine if asynchronous else create_engine
+    return factory(url, **kwargs)
+
+# Sync engine: schema setup and one-off scripts only
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine)
 
+# Async engine: used by every handler so DB round trips don't block the event loop.
+# expire_on_commit=False because lazy refreshes aren't possible outside a greenlet.
+async_engine = make_engine(asynchronous=True)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+IS_POSTGRES = engine.dialect.name == "postgresql"
+
+def dialect_insert(table):
+    """INSERT for this database's dialect, which has on_conflict_do_nothing / do_update."""
+    return postgresql.insert(table) if IS_POSTGRES else sqlite.insert(table)
+
+def pool_stats() -> dict:
+    """Stats of the handlers' (async) pool; empty when it isn't a StatsAsyncQueuePool."""
+    pool = async_engine.pool
+    return pool.stats() if isinstance(pool, _PoolStats) else {}
+
+async def warm_up_pool(count: int = None):
+    """Opens `count` connections at once so the first updates after boot find them ready."""
+    count = min(config.DB_POOL_WARMUP if count is None else count, config.DB_POOL_SIZE)
+    if count <= 0:
+        return
+
+    async def touch():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(touch() for _ in range(count)))
+    print(f"DB pool warmed up: {count} connections in {1000 * (time.perf_counter() - start):.0f} ms.")
+
 def init_db():
-    Base.metadata.create_all(engine)
+    """Brings the schema up to date (see migrations.py)."""
+    from migrations import upgrade
+    upgrade()
@@ -1,8 +1,8 @@
-from sqlalchemy import create_engine, text
-import config
+from sqlalchemy import text
+from database import make_engine
 
 def enable_unaccent():
-    engine = create_engine(config.DB_URL)
+    engine = make_engine()
     with engine.connect() as conn:
         try:
             conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent;"))
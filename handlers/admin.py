@@ -1,7 +1,14 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
-from database import SessionLocal, User, Bot, BotSubmission
+from sqlalchemy import select, func, delete
+from database import AsyncSessionLocal, User, Bot, BotSubmission, Vote, pool_stats
 from handlers.utils import restricted
+from services.membership import membership_cache
+from services import catalog_events, counters
+from services.counters import read_stats
+from services.broadcast import broadcast_engine
+from services.roles import roles
+from services.user_registry import user_registry
 import config
 import html
 
@@ -13,19 +20,19 @@ async def add_sudo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         user_id = int(context.args[0])
-        config.SUDO_USERS.add(user_id) # Runtime update
-        # DB update
-        session = SessionLocal()
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if user:
-            user.role = "sudo"
-        else:
-            # If user not in DB, create placeholder? Or assume they exist?
-            # Better to create if not exists
-            user = User(user_id=user_id, role="sudo")
-            session.add(user)
-        session.commit()
-        session.close()
+        async with AsyncSessionLocal() as session:
+            user = await session.get(User, user_id)
+            if user:
+                user.role = "sudo"
+            else:
+                # If user not in DB, create placeholder? Or assume they exist?
+                # Better to create if not exists
+                user = User(user_id=user_id, role="sudo")
+                session.add(user)
+                await counters.bump(session, {counters.USERS: 1})
+            await session.commit()
+        user_registry.known.add(user_id)
+        await roles.role_changed(user_id, "sudo")
         
         await update.message.reply_text(f"✅ User {user_id} promoted to SUDO.")
     except (IndexError, ValueError):
@@ -36,15 +43,17 @@ async def add_mod(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Sudos and Owner can add mods
     try:
         user_id = int(context.args[0])
-        session = SessionLocal()
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if user:
-            user.role = "mod"
-        else:
-            user = User(user_id=user_id, role="mod")
-            session.add(user)
-        session.commit()
-        session.close()
+        async with AsyncSessionLocal() as session:
+            user = await session.get(User, user_id)
+            if user:
+                user.role = "mod"
+            else:
+                user = User(user_id=user_id, role="mod")
+                session.add(user)
+                await counters.bump(session, {counters.USERS: 1})
+            await session.commit()
+        user_registry.known.add(user_id)
+        await roles.role_changed(user_id, "mod")
         
         await update.message.reply_text(f"✅ User {user_id} promoted to MODERATOR.")
     except (IndexError, ValueError):
@@ -59,17 +68,19 @@ async def remove_sudo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user_id = int(context.args[0])
         if user_id in config.SUDO_USERS:
-             config.SUDO_USERS.remove(user_id)
+            await update.message.reply_text("⚠️ This user is set in SUDO_USERS/OWNER_ID; remove them from the environment instead.")
+            return
         
-        session = SessionLocal()
-        user = session.query(User).filter(User.user_id == user_id).first()
+        async with AsyncSessionLocal() as session:
+            user = await session.get(User, user_id)
+            if user:
+                user.role = "user"
+                await session.commit()
         if user:
-            user.role = "user"
-            session.commit()
+            await roles.role_changed(user_id, "user")
             await update.message.reply_text(f"✅ User {user_id} removed from SUDO.")
         else:
             await update.message.reply_text("⚠️ User not found in DB.")
-        session.close()
     except (IndexError, ValueError):
         await update.message.reply_text("Usage: /removesudo <user_id>")
 
@@ -77,15 +88,17 @@ async def remove_sudo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def remove_mod(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user_id = int(context.args[0])
-        session = SessionLocal()
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if user and user.role == "mod":
-            user.role = "user"
-            session.commit()
+        async with AsyncSessionLocal() as session:
+            user = await session.get(User, user_id)
+            removed = bool(user and user.role == "mod")
+            if removed:
+                user.role = "user"
+                await session.commit()
+        if removed:
+            await roles.role_changed(user_id, "user")
             await update.message.reply_text(f"✅ User {user_id} removed from MODERATOR.")
         else:
              await update.message.reply_text("⚠️ User not found or not a mod.")
-        session.close()
     except (IndexError, ValueError):
         await update.message.reply_text("Usage: /removemod <user_id>")
 
@@ -100,41 +113,42 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # If admin wants format, they should use it. But for broadcast, usually safest is to just copy text.
     # Let's trust admin input but use HTML for the "ANNOUNCEMENT" header.
     
-    session = SessionLocal()
-    users = session.query(User).all()
-    count = 0
-    for user in users:
-        try:
-            # Using HTML for consistency
-            await context.bot.send_message(chat_id=user.user_id, text=f"📢 <b>ANNOUNCEMENT</b>\n\n{html.escape(message)}", parse_mode="HTML")
-            count += 1
-        except:
-            pass # Blocked or deleted
-    session.close()
-    await update.message.reply_text(f"✅ Broadcast sent to {count} users.")
+    # Runs in the background: streamed in chunks, rate limited, resumed after a restart
+    job_id = await broadcast_engine.start(context.bot, message, update.effective_user.id)
+    await update.message.reply_text(f"📢 Broadcast #{job_id} started. I'll message you when it's done.")
 
 @restricted
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    session = SessionLocal()
-    total_users = session.query(User).count()
-    total_bots = session.query(Bot).count()
-    pending_subs = session.query(BotSubmission).filter(BotSubmission.status == "pending").count()
-    
-    # Category breakdown
-    from sqlalchemy import func
-    categories = session.query(Bot.category, func.count(Bot.bot_id)).group_by(Bot.category).all()
+    # Maintained counters: a handful of rows however big the tables get
+    totals, trends = await read_stats()
+    categories = sorted((name.split(":", 1)[1], value) for name, value in totals.items()
+                        if name.startswith("bots:") and value)
     cat_text = "\n".join([f"• {c[0]}: {c[1]}" for c in categories])
-    
-    session.close()
+    cache = membership_cache.stats()
     
     text = (
         "📊 <b>System Statistics</b>\n\n"
-        f"👥 Total Users: {total_users}\n"
-        f"🤖 Approved Bots: {total_bots}\n"
-        f"⏳ Pending Reviews: {pending_subs}\n\n"
+        f"👥 Total Users: {totals.get(counters.USERS, 0)}\n"
+        f"🤖 Approved Bots: {totals.get(counters.BOTS, 0)}\n"
+        f"⏳ Pending Reviews: {totals.get(counters.PENDING, 0)}\n"
+        f"⭐ Votes: {totals.get(counters.VOTES, 0)}\n\n"
         "📂 <b>Categories</b>:\n"
-        f"{cat_text}"
+        f"{cat_text}\n\n"
     )
+    for days, change in trends.values():
+        label = f"Last {days} days" if days else "Today"
+        text += (
+            f"📈 <b>{label}</b>: {change.get(counters.USERS, 0):+} users, {change.get(counters.BOTS, 0):+} bots, "
+            f"{change.get(counters.VOTES, 0):+} votes, {change.get(counters.SUBMITTED, 0)} submitted "
+            f"({change.get(counters.APPROVED, 0)} approved / {change.get(counters.REJECTED, 0)} rejected)\n"
+        )
+    text += f"\n🧲 Join-check cache: {cache['hits']} hits / {cache['misses']} misses ({cache['size']} users)"
+    pool = pool_stats()
+    if pool:
+        text += (
+            f"\n🔌 DB pool: {pool['checked_out']}/{pool['size']} in use (+{pool['overflow']} overflow), "
+            f"{pool['waiting']} waiting, connect avg {pool['avg_connect_ms']:.0f} ms / max {pool['max_connect_ms']:.0f} ms"
+        )
     await update.message.reply_text(text, parse_mode="HTML")
     
 @restricted
@@ -147,13 +161,12 @@ async def delete_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not username.startswith("@"):
         username = "@" + username
 
-    session = SessionLocal()
     # Find the bot
-    bot = session.query(Bot).filter(Bot.username == username).first()
+    async with AsyncSessionLocal() as session:
+        bot = await session.scalar(select(Bot).where(Bot.username == username))
     
     if not bot:
         await update.message.reply_text(f"❌ Bot {username} not found in library.")
-        session.close()
         return
 
     try:
@@ -168,21 +181,23 @@ async def delete_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 2. Delete from DB (Bot and Submission)
         # Note: We should probably delete the submission or mark it deleted?
         # User said "everything is deleted".
-        
-        # Check for related submission
-        sub = session.query(BotSubmission).filter(BotSubmission.id == bot.submission_id).first()
-        if sub:
-            session.delete(sub)
-        
-        session.delete(bot)
-        session.commit()
+        async with AsyncSessionLocal() as session:
+            # Check for related submission
+            sub = await session.get(BotSubmission, bot.submission_id) if bot.submission_id else None
+            if sub:
+                await session.delete(sub)
+            
+            votes = await session.execute(delete(Vote).where(Vote.bot_id == bot.bot_id))
+            await session.delete(await session.merge(bot))
+            await counters.bump(session, {counters.BOTS: -1, counters.category_key(bot.category): -1,
+                                          counters.VOTES: -votes.rowcount})
+            await session.commit()
+        await catalog_events.bot_removed(bot.bot_id)
         
         await update.message.reply_text(f"✅ Bot {username} has been completely removed from the database.")
         
     except Exception as e:
         await update.message.reply_text(f"❌ Error during deletion: {e}")
-        
-    session.close()
 
 add_sudo_handler = CommandHandler("addsudo", add_sudo)
 rem_sudo_handler = CommandHandler("removesudo", remove_sudo)
@@ -1,38 +1,16 @@
 import html
 from telegram import Update, InlineQueryResultArticle, InputTextMessageContent
 from telegram.ext import ContextTypes, InlineQueryHandler
-from database import SessionLocal, Bot
+from services.inline_index import inline_index
 from uuid import uuid4
 
-from sqlalchemy import or_, func
-
 async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.inline_query.query
     if not query:
         return
 
-    session = SessionLocal()
-    
-    try:
-        # Try accent-insensitive
-        # Postgres only
-        results = session.query(Bot).filter(
-            or_(
-                func.unaccent(Bot.username).ilike(func.unaccent(f"%{query}%")),
-                func.unaccent(Bot.description).ilike(func.unaccent(f"%{query}%")),
-                func.unaccent(Bot.features).ilike(func.unaccent(f"%{query}%"))
-            )
-        ).limit(10).all()
-    except Exception as e:
-        session.rollback()
-        # Fallback (or SQLite)
-        results = session.query(Bot).filter(
-             or_(
-                Bot.username.ilike(f"%{query}%"),
-                Bot.description.ilike(f"%{query}%"),
-                Bot.features.ilike(f"%{query}%")
-            )
-        ).limit(10).all()
+    # Served from memory: fires on every keystroke and tolerates typos
+    results = inline_index.search(query, limit=10)
     
     inline_results = []
     for bot in results:
@@ -59,11 +37,10 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     parse_mode="HTML"
                 ),
                 url=post_link, # This makes the title clickable in the result list (on some clients)
-                thumb_url="https://cdn-icons-png.flaticon.com/512/4712/4712035.png",
+                thumbnail_url="https://cdn-icons-png.flaticon.com/512/4712/4712035.png",
             )
         )
     
-    session.close()
     await update.inline_query.answer(inline_results, cache_time=5)
 
 inline_handler = InlineQueryHandler(inline_query)
@@ -1,43 +1,84 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
-from database import SessionLocal, Bot
+from services import cache
+from services.catalog import catalog
+from services.leaderboard import leaderboards
 import math
 import html
 import config
 
 BOTS_PER_PAGE = 15
 
+# Callback data: list_page_{page}                      -> first page
+#                list_page_{page}_n_{rating}_{bot_id}  -> page after that row
+#                list_page_{page}_p_{rating}_{bot_id}  -> page before that row
+# Seeking on (rating DESC, bot_id ASC) keeps deep pages as cheap as the first one and
+# rows don't shift between pages when ratings change mid-browse.
+
+def parse_page_data(data: str):
+    parts = data.split("_")
+    page = int(parts[2])
+    if len(parts) == 6 and parts[3] in ("n", "p"):
+        return page, parts[3], (float(parts[4]), int(parts[5]))
+    # Old-style offset buttons still on screen: start over
+    return 0, None, None
+
+def page_data(page: int, direction: str, row) -> str:
+    return f"list_page_{page}_{direction}_{float(row.rating or 0.0)!r}_{row.bot_id}"
+
 async def list_bots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check current page
     query = update.callback_query
-    page = 0
-    
+    page, direction, cursor = 0, None, None
+
     if query:
         await query.answer()
         data = query.data
         if data.startswith("list_page_"):
-            page = int(data.split("_")[2])
-    
-    session = SessionLocal()
-    total_bots = session.query(Bot).count()
-    total_pages = math.ceil(total_bots / BOTS_PER_PAGE)
-    
-    offset = page * BOTS_PER_PAGE
-    bots = session.query(Bot).order_by(Bot.rating.desc()).offset(offset).limit(BOTS_PER_PAGE).all()
-    session.close()
-    
+            page, direction, cursor = parse_page_data(data)
+
+    # Rendered pages are cached until the catalog changes (approve, delete, rating flush)
+    key = ("list", cache.catalog_version, page, direction, cursor)
+    rendered = cache.page_cache.get(key)
+    if rendered is None:
+        rendered = render_page(page, direction, cursor)
+        cache.page_cache.set(key, rendered)
+
+    text, reply_markup = rendered
+    await send_list_response(update, text, reply_markup)
+
+def ranked_page(direction: str, cursor):
+    """One page (+1 lookahead row unless going back) from the maintained ranking."""
+    board = leaderboards.all
+    if direction == "p":
+        ids = board.before(*cursor, BOTS_PER_PAGE)
+    elif direction == "n":
+        ids = board.after(*cursor, BOTS_PER_PAGE + 1)
+    else:
+        ids = board.top(BOTS_PER_PAGE + 1)
+    return len(board), catalog.get_many(ids)
+
+def render_page(page: int, direction: str, cursor):
+    total_bots, bots = ranked_page(direction, cursor)
+
+    if direction == "p":
+        has_next = True
+    else:
+        has_next = len(bots) > BOTS_PER_PAGE
+        bots = bots[:BOTS_PER_PAGE]
+
     if not bots:
-        text = "📂 <b>Bot Library</b>\n\nNo bots found."
-        await send_list_response(update, text, None)
-        return
+        return "📂 <b>Bot Library</b>\n\nNo bots found.", None
 
+    total_pages = max(math.ceil(total_bots / BOTS_PER_PAGE), page + 1)
     text = f"📂 <b>Bot Library</b> (Page {page + 1}/{total_pages})\n\n"
-    
+    offset = page * BOTS_PER_PAGE
+
     for i, bot in enumerate(bots):
         safe_name = html.escape(bot.username)
         # Link to channel post if available (Construction logic similar to search)
         link = f"https://t.me/{bot.username.replace('@', '')}"
-        
+
         if bot.channel_message_id and config.CHANNEL_ID:
             clean_id = str(config.CHANNEL_ID).replace("-100", "")
             # Using private link format which works for members
@@ -48,20 +89,20 @@ async def list_bots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Pagination Buttons
     keyboard = []
     nav_row = []
-    
+
     if page > 0:
-        nav_row.append(InlineKeyboardButton("⬅️ Back", callback_data=f"list_page_{page - 1}"))
-    
-    if page < total_pages - 1:
-        nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"list_page_{page + 1}"))
-        
+        nav_row.append(InlineKeyboardButton("⬅️ Back", callback_data=page_data(page - 1, "p", bots[0])))
+
+    if has_next:
+        nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=page_data(page + 1, "n", bots[-1])))
+
     if nav_row:
         keyboard.append(nav_row)
-        
+
     # Standard "Back to Menu" doesn't exist for a standalone command but we can add one if user came from menu
     # For now just simple navigation
-    
-    await send_list_response(update, text, InlineKeyboardMarkup(keyboard))
+
+    return text, InlineKeyboardMarkup(keyboard)
 
 async def send_list_response(update, text, reply_markup):
     if update.callback_query:
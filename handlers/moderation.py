@@ -1,6 +1,12 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.ext import ContextTypes, CallbackQueryHandler
-from database import SessionLocal, BotSubmission, Bot, User
+from sqlalchemy import select, update as sql_update, or_
+from sqlalchemy.exc import IntegrityError
+from database import AsyncSessionLocal, BotSubmission, Bot, User
+from services import catalog_events, counters, outbox
+from services.outbox import outbox_worker
+from services.catalog import catalog
+from services.near_duplicates import near_duplicates, submission_key
 from handlers.utils import is_admin
 import config
 import datetime
@@ -10,12 +16,13 @@ import html
 
 async def notify_new_submission(context: ContextTypes.DEFAULT_TYPE, submission_id: int):
     """Sends a notification to all sudo users/mods about a new submission."""
-    session = SessionLocal()
-    sub = session.query(BotSubmission).filter(BotSubmission.id == submission_id).first()
+    async with AsyncSessionLocal() as session:
+        sub = await session.get(BotSubmission, submission_id)
     if not sub:
-        session.close()
         return
 
+    matches = await similar_entries(sub)
+
     safe_user = html.escape(sub.bot_username)
     safe_desc = html.escape(sub.description)
     safe_feat = html.escape(sub.features)
@@ -27,23 +34,20 @@ async def notify_new_submission(context: ContextTypes.DEFAULT_TYPE, submission_i
         f"📝 Desc: {safe_desc}\n"
         f"⚙️ Features: {safe_feat}\n"
         f"🏷️ Category: {sub.category}\n\n"
-        "Status: ⏳ Awaiting Review"
-    )
-    
-    keyboard = [[InlineKeyboardButton("I Will Check ✋", callback_data=f"mod_claim_{submission_id}")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    submitter_text = (
-        "🆕 <b>NEW BOT SUBMISSION</b>\n\n"
-        f"👤 Submitted by: {sub.submitted_by}\n" 
-        f"🤖 Bot: {safe_user}\n\n"
-        f"📝 Desc: {safe_desc}\n"
-        f"⚙️ Features: {safe_feat}\n"
-        f"🏷️ Category: {sub.category}\n\n"
-        "Status: ⏳ Awaiting Review"
     )
+    if matches:
+        submitter_text += "🧬 <b>Similar to:</b>\n" + "".join(
+            f"• {html.escape(username)} ({label}, {score:.0%})\n" for _, username, label, score in matches
+        ) + "\n"
+    submitter_text += "Status: ⏳ Awaiting Review"
     
     keyboard = [[InlineKeyboardButton("I Will Check ✋", callback_data=f"mod_claim_{submission_id}")]]
+    # One tap when it's plainly a copy of a listed bot
+    for key, username, label, score in matches:
+        if key > 0:
+            keyboard.append([InlineKeyboardButton(f"📑 Reject as duplicate of {username}",
+                                                  callback_data=f"mod_dupe_{submission_id}_{key}")])
+            break
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     # Send to Staff Group
@@ -56,8 +60,65 @@ async def notify_new_submission(context: ContextTypes.DEFAULT_TYPE, submission_i
         )
     except Exception as e:
         print(f"Failed to send notification to Staff Group ({config.STAFF_GROUP_ID}): {e}")
-            
-    session.close()
+
+async def similar_entries(sub):
+    """[(key, username, label, score)] for the listed bots / pending submissions closest
+    to `sub` (see services/near_duplicates.py)."""
+    hits = near_duplicates.similar(sub.description, sub.features, config.DUPLICATE_THRESHOLD,
+                                   config.DUPLICATE_MATCHES, exclude=submission_key(sub.id))
+    if not hits:
+        return []
+    sub_ids = [-key for key, _ in hits if key < 0]
+    subs = {}
+    if sub_ids:
+        async with AsyncSessionLocal() as session:
+            subs = dict((await session.execute(
+                select(BotSubmission.id, BotSubmission.bot_username).where(BotSubmission.id.in_(sub_ids))
+            )).all())
+
+    matches = []
+    for key, score in hits:
+        if key > 0 and catalog.get(key):
+            matches.append((key, catalog.get(key).username, "listed", score))
+        elif key < 0 and -key in subs:
+            matches.append((key, subs[-key], "pending", score))
+    return matches
+
+# --- State transitions ---
+# Each is one conditional UPDATE, so when several mods (or bot workers) click at
+# once exactly one matches the row; the rest get no row back and are told why.
+
+async def transition(session, sub_id: int, user_id: int, values: dict, unclaimed_ok: bool = False):
+    """Applies `values` to a pending submission claimed by user_id (or unclaimed, if allowed).
+    Returns the updated submission row if this call won, else None. Runs in the caller's transaction."""
+    claimed = BotSubmission.claimed_by == user_id
+    if unclaimed_ok:
+        claimed = or_(BotSubmission.claimed_by.is_(None), claimed)
+    result = await session.execute(
+        sql_update(BotSubmission)
+        .where(BotSubmission.id == sub_id, BotSubmission.status == "pending", claimed)
+        .values(**values)
+        .returning(*BotSubmission.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )
+    return result.first()
+
+async def report_lost(query, session, sub_id: int):
+    """Tells a mod whose transition didn't apply what happened instead."""
+    sub = await session.get(BotSubmission, sub_id)
+    if not sub:
+        text = "⚠️ Submission not found."
+    elif sub.status != "pending":
+        text = f"⚠️ Already {sub.status}."
+    elif sub.claimed_by and sub.claimed_by != query.from_user.id:
+        text = "⚠️ Already claimed by another mod!"
+    else:
+        text = "⚠️ You didn't claim this."
+    await query.answer(text, show_alert=True)
+
+def rejection_text(sub, reason_text: str) -> str:
+    return (f"❌ <b>Submission Rejected</b>\n\nYour bot {html.escape(sub.bot_username)} was not approved.\n"
+            f"<b>Reason</b>: {html.escape(reason_text)}")
 
 # --- Handlers ---
 
@@ -70,21 +131,17 @@ async def mod_actions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("⛔ You are not part of the moderation team.", show_alert=True)
         return
 
-    session = SessionLocal()
-    
     if data.startswith("mod_claim_"):
         sub_id = int(data.split("_")[2])
-        sub = session.query(BotSubmission).filter(BotSubmission.id == sub_id).first()
-        
-        if sub.claimed_by and sub.claimed_by != user_id:
-            await query.answer("⚠️ Already claimed by another mod!", show_alert=True)
-            session.close()
-            return
-
-        # Update DB
-        sub.claimed_by = user_id
-        sub.claim_time = datetime.datetime.utcnow()
-        session.commit()
+        async with AsyncSessionLocal() as session:
+            # Re-claiming your own (the reject menu's Back button) is allowed
+            sub = await transition(session, sub_id, user_id,
+                                   {"claimed_by": user_id, "claim_time": datetime.datetime.utcnow()},
+                                   unclaimed_ok=True)
+            if not sub:
+                await report_lost(query, session, sub_id)
+                return
+            await session.commit()
         
         # Update Message
         # Note: message.text_html might not be available, need to reconstruct or be careful.
@@ -121,15 +178,12 @@ async def mod_actions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     elif data.startswith("mod_unclaim_"):
         sub_id = int(data.split("_")[2])
-        sub = session.query(BotSubmission).filter(BotSubmission.id == sub_id).first()
-        
-        if sub.claimed_by != user_id:
-             await query.answer("⚠️ You didn't claim this.", show_alert=True)
-             session.close()
-             return
-
-        sub.claimed_by = None
-        session.commit()
+        async with AsyncSessionLocal() as session:
+            sub = await transition(session, sub_id, user_id, {"claimed_by": None, "claim_time": None})
+            if not sub:
+                await report_lost(query, session, sub_id)
+                return
+            await session.commit()
         
         safe_user = html.escape(sub.bot_username)
         # Revert message
@@ -145,94 +199,41 @@ async def mod_actions(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data.startswith("mod_approve_"):
         sub_id = int(data.split("_")[2])
-        sub = session.query(BotSubmission).filter(BotSubmission.id == sub_id).first()
-        
-        # 1. Update Submission Status
-        sub.status = "approved"
-        sub.approved_by = user_id # Logic to track who approved
-        
-        # 2. Add to actual Bots table
-        new_bot = Bot(
-            submission_id=sub.id,
-            username=sub.bot_username,
-            description=sub.description,
-            features=sub.features,
-            category=sub.category,
-            submitted_by=sub.submitted_by,
-            approved_by=user_id,
-            submission_date=sub.submission_date
-        )
-        session.add(new_bot)
-        session.commit()
-        
-        safe_user = html.escape(sub.bot_username)
-        safe_desc = html.escape(sub.description)
-        safe_feat = html.escape(sub.features)
-        
-        # 3. Post to Channel
-        channel_text = (
-            f"<b>{safe_user}</b>\n"
-            f"━━━━━━━━━━━━━━━━━━━━━\n\n"
-            f"<b>📖 Description</b>\n"
-            f"{safe_desc}\n\n"
-            f"<b>🚀 Features</b>\n"
-            f"{safe_feat}\n\n"
-            f"━━━━━━━━━━━━━━━━━━━━━\n"
-            f"<b>📂 Category:</b> #{sub.category}\n"
-            f"<b>⭐ Rating:</b> 0.0/5.0 (0 votes)\n"
-            f"<b>👤 Submitter:</b> <a href=\"tg://user?id={sub.submitted_by}\">Profile</a>\n" 
-            f"━━━━━━━━━━━━━━━━━━━━━\n"
-            f"🔗 <a href=\"https://t.me/{sub.bot_username.replace('@', '')}\">Start Bot</a>"
-        )
-        rating_keyboard = [
-            [InlineKeyboardButton("⭐ 1", callback_data=f"rate_{new_bot.bot_id}_1"),
-             InlineKeyboardButton("⭐ 2", callback_data=f"rate_{new_bot.bot_id}_2"),
-             InlineKeyboardButton("⭐ 3", callback_data=f"rate_{new_bot.bot_id}_3")],
-            [InlineKeyboardButton("⭐ 4", callback_data=f"rate_{new_bot.bot_id}_4"),
-             InlineKeyboardButton("⭐ 5", callback_data=f"rate_{new_bot.bot_id}_5")]
-        ]
-        
-        if config.CHANNEL_ID:
-            try:
-                msg = await context.bot.send_message(
-                    chat_id=config.CHANNEL_ID, 
-                    text=channel_text, 
-                    reply_markup=InlineKeyboardMarkup(rating_keyboard),
-                    parse_mode="HTML"
-                )
-                new_bot.channel_message_id = msg.message_id
-                session.commit()
-            except Exception as e:
-                print(f"Channel post failed: {e}")
-                await query.message.reply_text(f"⚠️ Approved but failed to post to channel: {e}")
-
-        # 4. Notify User
-        try:
-            notification_text = f"🎉 <b>Congratulations!</b>\n\nYour bot <b>{sub.bot_username}</b> has been approved and posted to the library!"
-            notification_keyboard = []
-            
-            # If we have the channel post, add the link
-            if 'msg' in locals():
-                post_link = msg.link
-                # fallback for private channels
-                if not post_link and config.CHANNEL_ID:
-                    if str(config.CHANNEL_ID).startswith("-100"):
-                         clean_id = str(config.CHANNEL_ID).replace("-100", "")
-                         post_link = f"https://t.me/c/{clean_id}/{msg.message_id}"
-                    
-                if post_link:
-                    notification_keyboard.append([InlineKeyboardButton("🔗 View Post", url=post_link)])
+        # One transaction: the status change, the bot, its search entry, the counters and
+        # the outbox row for the channel post and the submitter's DM
+        async with AsyncSessionLocal() as session:
+            # Only the claiming mod, only once
+            sub = await transition(session, sub_id, user_id, {"status": "approved"})
+            if not sub:
+                await report_lost(query, session, sub_id)
+                return
 
-            await context.bot.send_message(
-                chat_id=sub.submitted_by, 
-                text=notification_text, 
-                parse_mode="HTML",
-                reply_markup=InlineKeyboardMarkup(notification_keyboard) if notification_keyboard else None
+            new_bot = Bot(
+                submission_id=sub.id,
+                username=sub.bot_username,
+                description=sub.description,
+                features=sub.features,
+                category=sub.category,
+                submitted_by=sub.submitted_by,
+                approved_by=user_id,
+                submission_date=sub.submission_date
             )
-        except Exception as e:
-            print(f"Failed to notify user: {e}") 
-            
-        # Update Mod Message
+            session.add(new_bot)
+            try:
+                await session.flush()
+            except IntegrityError:
+                # Same username approved from another submission; the status change rolls back too
+                await session.rollback()
+                await query.answer("⚠️ A bot with this username is already in the library.", show_alert=True)
+                return
+            await counters.bump(session, {counters.PENDING: -1, counters.APPROVED: 1, counters.BOTS: 1,
+                                          counters.category_key(new_bot.category): 1})
+            outbox.add(session, outbox.BOT_APPROVED, {"bot_id": new_bot.bot_id})
+            await session.commit()
+        await catalog_events.submission_closed(sub_id)
+        await catalog_events.bot_added(new_bot)
+        outbox_worker.wake()
+
         approver_name = html.escape(query.from_user.first_name)
         approver_link = f"<a href='tg://user?id={query.from_user.id}'>{approver_name}</a>"
         await query.edit_message_text(f"✅ Approved by {approver_link}", parse_mode="HTML")
@@ -253,7 +254,6 @@ async def mod_actions(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton("🔙 Back", callback_data=f"mod_claim_{sub_id}")] # Reverts to claim view (which is 'Being reviewed by...')
             ]
             await query.edit_message_text("❓ <b>Select Rejection Reason</b>:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="HTML")
-            session.close()
             return
             
         # Step 2: Process Rejection
@@ -267,23 +267,43 @@ async def mod_actions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         }
         reason_text = reason_map.get(reason_code, "Configuration mismatch.")
         
-        sub = session.query(BotSubmission).filter(BotSubmission.id == sub_id).first()
-        sub.status = "rejected"
-        sub.rejection_reason = reason_text
-        session.commit()
-        
-        # Notify User
-        try:
-            await context.bot.send_message(
-                chat_id=sub.submitted_by, 
-                text=f"❌ <b>Submission Rejected</b>\n\nYour bot {sub.bot_username} was not approved.\n<b>Reason</b>: {reason_text}",
-                parse_mode="HTML"
-            )
-        except:
-            pass
-            
+        async with AsyncSessionLocal() as session:
+            sub = await transition(session, sub_id, user_id, {"status": "rejected", "rejection_reason": reason_text})
+            if not sub:
+                await report_lost(query, session, sub_id)
+                return
+            await counters.bump(session, {counters.PENDING: -1, counters.REJECTED: 1})
+            outbox.add(session, outbox.MESSAGE, {"chat_id": sub.submitted_by, "text": rejection_text(sub, reason_text)})
+            await session.commit()
+        await catalog_events.submission_closed(sub_id)
+        outbox_worker.wake()
+
         await query.edit_message_text(f"❌ Rejected by {query.from_user.username}\nReason: {reason_code}")
-        
-    session.close()
+
+    elif data.startswith("mod_dupe_"):
+        # Format: mod_dupe_{sub_id}_{bot_id}, from the new submission notification
+        parts = data.split("_")
+        sub_id, bot_id = int(parts[2]), int(parts[3])
+        original = catalog.get(bot_id)
+        async with AsyncSessionLocal() as session:
+            reason_text = (f"This bot duplicates {original.username}, which is already in our library."
+                           if original else "This bot is already in our library.")
+            # Claim and reject in one step; fails if another mod has it
+            sub = await transition(session, sub_id, user_id,
+                                   {"status": "rejected", "rejection_reason": reason_text,
+                                    "claimed_by": user_id, "claim_time": datetime.datetime.utcnow()},
+                                   unclaimed_ok=True)
+            if not sub:
+                await report_lost(query, session, sub_id)
+                return
+            await counters.bump(session, {counters.PENDING: -1, counters.REJECTED: 1})
+            outbox.add(session, outbox.MESSAGE, {"chat_id": sub.submitted_by, "text": rejection_text(sub, reason_text)})
+            await session.commit()
+        await catalog_events.submission_closed(sub_id)
+        outbox_worker.wake()
+
+        await query.edit_message_text(
+            f"❌ Rejected by {query.from_user.username}\nReason: duplicate of {original.username if original else bot_id}"
+        )
 
 moderation_handler = CallbackQueryHandler(mod_actions, pattern="^mod_")
@@ -1,34 +1,30 @@
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ContextTypes, CallbackQueryHandler
-from database import SessionLocal, Bot
-from handlers.utils import restricted
+from telegram import Update
+from telegram.ext import ContextTypes, CallbackQueryHandler, ChatMemberHandler
+from services.vote_buffer import vote_buffer
+from services.catalog import catalog
+from services.membership import is_channel_member, is_channel_chat, remember_status
 import config
-import html
 
 async def rate_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = query.from_user.id
     # data format: rate_{bot_id}_{score}
     parts = query.data.split("_")
-    bot_id = int(parts[1])
-    score = int(parts[2])
-    
-    session = SessionLocal()
-    bot = session.query(Bot).filter(Bot.bot_id == bot_id).first()
-    
-    
-    if not bot:
-        await query.answer("Bot not found!", show_alert=True)
-        session.close()
+    try:
+        bot_id, score = int(parts[1]), int(parts[2])
+    except (IndexError, ValueError):
+        bot_id = score = None
+    # Clients can send any callback data: only 1-5 stars on a bot in the library count
+    if score not in range(1, 6) or catalog.get(bot_id) is None:
+        await query.answer("⚠️ Bot not found.", show_alert=True)
         return
-
+    
     # --- Force Join Check ---
     if config.CHANNEL_ID:
         try:
-            member = await context.bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
-            if member.status not in ["member", "administrator", "creator"]:
+            # Cached per user; kept fresh by channel_member_handler below
+            if not await is_channel_member(context.bot, user_id):
                 await query.answer("⚠️ You must join our channel to vote!", show_alert=True)
-                session.close()
                 return
         except Exception as e:
             # If bot isn't admin or can't see member status, fail gracefully (allow vote or log check fail)
@@ -37,70 +33,17 @@ async def rate_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
     # ------------------------
         
-    # Check if user already voted (votes_data is a dictionary)
-    votes = dict(bot.votes_data) if bot.votes_data else {}
-    
-    if str(user_id) in votes:
-        previous_score = votes[str(user_id)]
-        if previous_score == score:
-            await query.answer(f"✅ You already rated {score} stars!", show_alert=False)
-            session.close()
-            return
-        else:
-            # Update vote
-            votes[str(user_id)] = score
-            context_text = f"✅ Rating updated to {score} stars!"
-    else:
-        # New vote
-        votes[str(user_id)] = score
-        context_text = f"✅ You rated {score} stars!"
-        
-    bot.votes_data = votes # Assign updated votes to bot object
-    
-    # Calculate new rating (average)
-    # We should average the VALUES in votes_data
-    
-    total_score = sum(bot.votes_data.values())
-    count = len(bot.votes_data)
-    
-    bot.rating = round(total_score / count, 1)
-    bot.vote_count = count
-    session.commit()
-    
-    # Update Channel Message
-    # We need to preserve the message content but update the Rating line.
-    
-    # Using text_html gives us the current message in HTML.
-    # But wait, 'text_html' might not exist in some library versions? It should in recent PTB.
-    # If not, we can reconstruct it from DB since we have the bot data! This is SAFER.
-    # Reconstructing is 100% safe against "Nested entity" errors because we control the format.
-    
-    safe_user = html.escape(bot.username)
-    safe_desc = html.escape(bot.description)
-    safe_feat = html.escape(bot.features)
-    
-    new_text = (
-            f"<b>{safe_user}</b>\n"
-            f"━━━━━━━━━━━━━━━━━━━━━\n\n"
-            f"<b>📖 Description</b>\n"
-            f"{safe_desc}\n\n"
-            f"<b>🚀 Features</b>\n"
-            f"{safe_feat}\n\n"
-            f"━━━━━━━━━━━━━━━━━━━━━\n"
-            f"<b>📂 Category:</b> #{bot.category}\n"
-            f"<b>⭐ Rating:</b> {bot.rating}/5.0 ({bot.vote_count} votes)\n"
-            f"<b>👤 Submitter:</b> <a href=\"tg://user?id={bot.submitted_by}\">Profile</a>\n" 
-            f"━━━━━━━━━━━━━━━━━━━━━\n"
-            f"🔗 <a href=\"https://t.me/{bot.username.replace('@', '')}\">Start Bot</a>"
-    )
+    # Acknowledge straight away; the buffer writes the vote within VOTE_FLUSH_INTERVAL_MS
+    # and refreshes the channel post at most once per CHANNEL_EDIT_WINDOW
+    vote_buffer.add(bot_id, user_id, score)
+    await query.answer(f"✅ You rated {score} stars!")
 
-    try:
-        await query.edit_message_text(new_text, reply_markup=query.message.reply_markup, parse_mode="HTML")
-        await query.answer(context_text)
-    except Exception as e:
-        print(f"Rating update failed: {e}")
-        await query.answer("⚠️ Failed to update rating display.", show_alert=True)
-    
-    session.close()
+async def track_channel_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Keeps the membership cache current when users join or leave the channel."""
+    change = update.chat_member
+    if is_channel_chat(change.chat):
+        remember_status(change.new_chat_member.user.id, change.new_chat_member.status)
 
 rating_handler = CallbackQueryHandler(rate_bot, pattern="^rate_")
+# Needs the bot to be a channel admin and "chat_member" in allowed_updates (see main.py)
+channel_member_handler = ChatMemberHandler(track_channel_member, ChatMemberHandler.CHAT_MEMBER)
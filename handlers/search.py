@@ -1,7 +1,6 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler
-from database import SessionLocal, Bot
-from sqlalchemy import or_, func
+from services.inline_index import inline_index
 import html
 import config
 
@@ -11,33 +10,9 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("🔍 Usage: /search <bot name or description>")
         return
 
-    session = SessionLocal()
-    # Use unaccent() to ignore accents (e.g. pokemon matches Pokémon)
-    # unaccent(column).ilike('%query%') isn't enough if query has no accent but column does.
-    # We should unaccent both sides: unaccent(column) ILIKE unaccent('%query%')
-    
-    # Try Accent-Insensitive Search (Postgres with unaccent)
-    try:
-        results = session.query(Bot).filter(
-            or_(
-                func.unaccent(Bot.username).ilike(func.unaccent(f"%{query_text}%")),
-                func.unaccent(Bot.description).ilike(func.unaccent(f"%{query_text}%")),
-                func.unaccent(Bot.features).ilike(func.unaccent(f"%{query_text}%"))
-            )
-        ).order_by(Bot.rating.desc()).limit(5).all()
-    except Exception as e:
-        print(f"Unaccent search failed (falling back to simple search): {e}")
-        session.rollback()
-        # Fallback to standard ILIKE (Case-insensitive but accent-sensitive)
-        results = session.query(Bot).filter(
-            or_(
-                Bot.username.ilike(f"%{query_text}%"),
-                Bot.description.ilike(f"%{query_text}%"),
-                Bot.features.ilike(f"%{query_text}%")
-            )
-        ).order_by(Bot.rating.desc()).limit(5).all()
-    
-    session.close()
+    # Same in-memory index as inline mode: username prefix, then trigram matches,
+    # accent-insensitive ("pokemon" finds "Pokémon") and typo-tolerant
+    results = inline_index.search(query_text, limit=5)
     
     if not results:
         await update.message.reply_text(f"❌ No bots found matching '<b>{html.escape(query_text)}</b>'.", parse_mode="HTML")
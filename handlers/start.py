@@ -1,6 +1,7 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
-from database import SessionLocal, User, Bot
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, TypeHandler
+from services.leaderboard import top_bots
+from services.user_registry import user_registry
 
 import html
 
@@ -11,14 +12,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user = update.effective_user
     
-    # Add user to DB if new
-    session = SessionLocal()
-    db_user = session.query(User).filter(User.user_id == user.id).first()
-    if not db_user:
-        new_user = User(user_id=user.id, username=user.username)
-        session.add(new_user)
-        session.commit()
-    session.close()
+    # Add user to DB if new (batched in the background). Talking to us again also
+    # clears `blocked`, so they're included in broadcasts again.
+    user_registry.touch(user, register=True, private=True)
 
     # Deep Linking
     if context.args and context.args[0].startswith("bot_"):
@@ -70,9 +66,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("🔍 <b>Browse Library</b>\nSelect a filter:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="HTML")
 
     elif query.data == "browse_top":
-        session = SessionLocal()
-        bots = session.query(Bot).order_by(Bot.rating.desc()).limit(10).all()
-        session.close()
+        # Maintained ranking: a slice of the in-memory catalog, no query
+        bots = top_bots(10)
         
         if not bots:
             await query.edit_message_text("No bots found!", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="browse_bots")]]))
@@ -101,9 +96,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif query.data.startswith("list_cat_"):
         cat = query.data.replace("list_cat_", "")
-        session = SessionLocal()
-        bots = session.query(Bot).filter(Bot.category == cat).order_by(Bot.rating.desc()).limit(15).all()
-        session.close()
+        bots = top_bots(15, category=cat)
         
         if not bots:
             text = f"📂 Category: <b>{cat}</b>\n\nNo bots found."
@@ -115,6 +108,14 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="browse_cats")]]), parse_mode="HTML")
 
+async def track_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs for every update (group -1): username changes and last-seen, written in batches."""
+    user = update.effective_user
+    if user:
+        chat = update.effective_chat
+        user_registry.touch(user, private=bool(chat and chat.type == "private"))
+
+user_tracker = TypeHandler(Update, track_user)
 start_handler = CommandHandler("start", start)
 help_handler = CommandHandler("help", lambda u,c: u.message.reply_text("Use /start to access the menu."))
 # Note: "add_bot" callback is handled in the ConversationHandler entry point
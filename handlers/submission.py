@@ -3,7 +3,9 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler, MessageHandler, 
     filters, CallbackQueryHandler
 )
-from database import SessionLocal, BotSubmission, Bot
+from sqlalchemy import select
+from database import AsyncSessionLocal, BotSubmission, Bot
+from services import catalog_events, counters
 import datetime
 
 import html
@@ -26,18 +28,23 @@ async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Username must start with '@'. Please try again:")
         return NAME
     
-    # Check duplicates
-    session = SessionLocal()
-    if session.query(Bot).filter(Bot.username == text).first():
+    # Check duplicates in the DB, not the catalog: a bot another worker just approved
+    # may not have reached this process's copy yet
+    async with AsyncSessionLocal() as session:
+        existing_bot = await session.scalar(select(Bot.bot_id).where(Bot.username == text).limit(1))
+        pending_sub = None
+        if not existing_bot:
+            pending_sub = await session.scalar(
+                select(BotSubmission.id).where(BotSubmission.bot_username == text, BotSubmission.status == "pending").limit(1)
+            )
+
+    if existing_bot:
         await update.message.reply_text("⚠️ This bot is already in our library!")
-        session.close()
         return ConversationHandler.END
         
-    if session.query(BotSubmission).filter(BotSubmission.bot_username == text, BotSubmission.status == "pending").first():
+    if pending_sub:
         await update.message.reply_text("⚠️ This bot is already submitted and pending review.")
-        session.close()
         return ConversationHandler.END
-    session.close()
     
     context.user_data['bot_username'] = text
     await update.message.reply_text("📝 <b>Description</b>:\nProvide a brief description of your bot:", parse_mode="HTML")
@@ -96,19 +103,20 @@ async def submit_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     # Save to DB
     data = context.user_data
-    session = SessionLocal()
-    submission = BotSubmission(
-        bot_username=data['bot_username'],
-        description=data['bot_desc'],
-        features=data['bot_features'],
-        category=data['bot_category'],
-        submitted_by=update.effective_user.id,
-        status="pending"
-    )
-    session.add(submission)
-    session.commit()
-    submission_id = submission.id
-    session.close() # Close session
+    async with AsyncSessionLocal() as session:
+        submission = BotSubmission(
+            bot_username=data['bot_username'],
+            description=data['bot_desc'],
+            features=data['bot_features'],
+            category=data['bot_category'],
+            submitted_by=update.effective_user.id,
+            status="pending"
+        )
+        session.add(submission)
+        await counters.bump(session, {counters.PENDING: 1, counters.SUBMITTED: 1})
+        await session.commit()
+        submission_id = submission.id
+    await catalog_events.submission_added(submission)
     
     await query.edit_message_text("✅ <b>Submitted!</b> Your bot is now under review.", parse_mode="HTML")
     
@@ -1,31 +1,56 @@
 from functools import wraps
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-import config
+from services.roles import roles
+import html
 
 def restricted(func):
     """Restrict usage of func to allowed users only (Sudos/Owner)."""
     @wraps(func)
     async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        if user_id not in config.SUDO_USERS:
+        if not roles.is_sudo(user_id):
             await update.message.reply_text("⛔ You are not authorized to use this command.")
             return
         return await func(update, context, *args, **kwargs)
     return wrapped
 
-from database import SessionLocal, User
-
 def is_admin(user_id: int) -> bool:
-    if user_id in config.SUDO_USERS:
-        return True
-    
-    # Check DB for 'mod' role
-    session = SessionLocal()
-    user = session.query(User).filter(User.user_id == user_id).first()
-    session.close()
-    
-    if user and user.role in ["owner", "sudo", "mod"]:
-        return True
-        
-    return False
+    """Owner, sudo or mod (cached, see services/roles.py)."""
+    return roles.is_staff(user_id)
+
+
+def channel_post_text(bot) -> str:
+    """The channel post for an approved bot. Rebuilt from DB data on every edit,
+    which is safe against "Nested entity" errors because we control the format."""
+    safe_user = html.escape(bot.username)
+    safe_desc = html.escape(bot.description)
+    safe_feat = html.escape(bot.features)
+    return (
+        f"<b>{safe_user}</b>\n"
+        f"━━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"<b>📖 Description</b>\n"
+        f"{safe_desc}\n\n"
+        f"<b>🚀 Features</b>\n"
+        f"{safe_feat}\n\n"
+        f"━━━━━━━━━━━━━━━━━━━━━\n"
+        f"<b>📂 Category:</b> #{bot.category}\n"
+        f"<b>⭐ Rating:</b> {bot.rating or 0.0}/5.0 ({bot.vote_count or 0} votes)\n"
+        f"<b>👤 Submitter:</b> <a href=\"tg://user?id={bot.submitted_by}\">Profile</a>\n" 
+        f"━━━━━━━━━━━━━━━━━━━━━\n"
+        f"🔗 <a href=\"https://t.me/{bot.username.replace('@', '')}\">Start Bot</a>"
+    )
+
+def rating_keyboard(bot_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("⭐ 1", callback_data=f"rate_{bot_id}_1"),
+         InlineKeyboardButton("⭐ 2", callback_data=f"rate_{bot_id}_2"),
+         InlineKeyboardButton("⭐ 3", callback_data=f"rate_{bot_id}_3")],
+        [InlineKeyboardButton("⭐ 4", callback_data=f"rate_{bot_id}_4"),
+         InlineKeyboardButton("⭐ 5", callback_data=f"rate_{bot_id}_5")]
+    ])
+
+def retry_seconds(error) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on the PTB version."""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
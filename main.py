@@ -1,6 +1,10 @@
+import asyncio
+import datetime
 import logging
+import signal
 import config
 from database import init_db
+from telegram import Update
 from telegram.ext import ApplicationBuilder
 
 # Logging setup
@@ -10,24 +14,92 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def main():
-    # Initialize Database
-    print("Initializing Database...")
-    init_db()
-    
-    # Build Application
-    if not config.BOT_TOKEN:
-        print("Error: BOT_TOKEN is not set in config.py or environment variables.")
-        return
+async def post_init(application):
+    # Open DB connections up front (Neon cold starts) and warm in-memory indexes
+    # before the first update arrives
+    from database import warm_up_pool
+    await warm_up_pool()
 
-    print("Starting Bot...")
-    app = ApplicationBuilder().token(config.BOT_TOKEN).build()
-    
-    # Register Handlers
-    from handlers.start import start_handler, button_handler, help_handler
+    from services.roles import roles
+    await roles.load()
+    roles.start()
+
+    from services.user_registry import user_registry
+    await user_registry.load()
+    user_registry.start()
+
+    from services.catalog_events import load_views, catalog_sync
+    await load_views()
+    catalog_sync.start()
+
+    from services.vote_buffer import vote_buffer
+    vote_buffer.start(application.bot)
+
+    from services.broadcast import broadcast_engine
+    await broadcast_engine.resume(application.bot)
+
+    # Also delivers what was left undelivered when the bot last stopped
+    from services.outbox import outbox_worker
+    outbox_worker.start(application.bot)
+
+    from services.update_log import update_recorder
+    if update_recorder:
+        update_recorder.start()
+
+    # /stats trends: snapshot the counters at the start of every UTC day, and now in
+    # case the bot was down at midnight (a day that has its snapshot keeps it)
+    from services.counters import daily_rollup
+    application.job_queue.run_daily(daily_rollup, time=datetime.time(0, 0, 30, tzinfo=datetime.timezone.utc),
+                                    name="daily_stats")
+    application.job_queue.run_once(daily_rollup, 0, name="daily_stats_startup")
+
+async def post_stop(application):
+    # Bot is still usable here (post_shutdown runs after it's torn down)
+    from services.vote_buffer import vote_buffer
+    await vote_buffer.stop()
+
+    from services.broadcast import broadcast_engine
+    await broadcast_engine.stop()
+
+    from services.outbox import outbox_worker
+    await outbox_worker.stop()
+
+    from services.update_log import update_recorder
+    if update_recorder:
+        await update_recorder.stop()
+
+    from services.roles import roles
+    await roles.stop()
+
+    from services.catalog_events import catalog_sync
+    await catalog_sync.stop()
+
+    from services.user_registry import user_registry
+    await user_registry.stop()
+
+    from services.outbound import outbound_scheduler
+    await outbound_scheduler.stop()
+
+def application_builder():
+    """ApplicationBuilder with the update processor, the outbound scheduler and,
+    if BOT_API_URL is set, another Bot API server (bench/fake_api.py, say)."""
+    from services.update_processor import KeyedUpdateProcessor
+    from services.outbound import OutboundRequest, outbound_scheduler
+    builder = ApplicationBuilder().token(config.BOT_TOKEN).concurrent_updates(
+        KeyedUpdateProcessor(config.CONCURRENT_UPDATES, config.UPDATE_BACKLOG)
+    ).request(
+        # Every outbound call is queued by priority and paced to Telegram's limits
+        OutboundRequest(outbound_scheduler, connection_pool_size=256)
+    )
+    if config.BOT_API_URL:
+        builder = builder.base_url(f"{config.BOT_API_URL}/bot").base_file_url(f"{config.BOT_API_URL}/file/bot")
+    return builder
+
+def register_handlers(app):
+    from handlers.start import start_handler, button_handler, help_handler, user_tracker
     from handlers.submission import submission_handler
     from handlers.moderation import moderation_handler
-    from handlers.rating import rating_handler
+    from handlers.rating import rating_handler, channel_member_handler
     from handlers.search import search_handler
     from handlers.list_bots import list_handler, list_callback_handler
     from handlers.admin import (
@@ -38,11 +110,13 @@ def main():
     )
     from telegram.ext import CallbackQueryHandler
     
+    app.add_handler(user_tracker, group=-1) # Sees every update before the handlers below
     app.add_handler(submission_handler) # High priority for conversation
     app.add_handler(start_handler)
     app.add_handler(help_handler)
     app.add_handler(moderation_handler)
     app.add_handler(rating_handler)
+    app.add_handler(channel_member_handler)
     app.add_handler(search_handler)
     app.add_handler(list_handler)
     app.add_handler(list_callback_handler)
@@ -61,29 +135,91 @@ def main():
     # Extras
     from handlers.inline import inline_handler
     app.add_handler(inline_handler)
+
+    # Handler latency, per-update DB work and Bot API calls for /metrics
+    from services.metrics import instrument_handlers, instrument_engine
+    from database import async_engine
+    instrument_handlers(app)
+    instrument_engine(async_engine)
+
+def main():
+    # Initialize Database
+    print("Initializing Database...")
+    init_db()
     
-    # --- Keep Alive for Render ---
-    from flask import Flask
-    import threading
-    import os
-    
-    flask_app = Flask(__name__)
-    
-    @flask_app.route('/')
-    def health_check():
-        return "Bot is Alive!", 200
-        
-    def run_flask():
-        port = int(os.environ.get("PORT", 8080))
-        flask_app.run(host='0.0.0.0', port=port)
-        
-    # Start server in background thread
-    threading.Thread(target=run_flask, daemon=True).start()
-    print("Web server started for UptimeRobot...")
-    # -----------------------------
+    # Build Application
+    if not config.BOT_TOKEN:
+        print("Error: BOT_TOKEN is not set in config.py or environment variables.")
+        return
+
+    print("Starting Bot...")
+    builder = application_builder()
+    if config.RUN_MODE == "webhook":
+        if not config.WEBHOOK_URL:
+            print("Error: RUN_MODE=webhook needs WEBHOOK_URL (the bot's public https URL).")
+            return
+        builder = builder.updater(None) # Updates arrive through our own HTTP server
+    app = builder.build()
+    register_handlers(app)
+
+    if config.UPDATE_LOG:
+        # Anonymized copies of incoming updates, for bench/replay.py
+        from services.update_log import update_recorder
+        app.update_processor.on_update = update_recorder.record
+        print(f"Recording updates to {config.UPDATE_LOG}")
     
-    print("Bot is polling...")
-    app.run_polling()
+    asyncio.run(run(app))
+
+async def run(app):
+    """Application lifecycle, run by hand so one HTTP server on this loop can serve
+    webhooks and health checks (run_polling/run_webhook would own the loop)."""
+    from services.http_server import HttpServer
+
+    webhook = config.RUN_MODE == "webhook"
+    server = HttpServer(
+        app, config.PORT,
+        webhook_path=config.WEBHOOK_PATH if webhook else None,
+        secret=config.WEBHOOK_SECRET,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass # Windows: Ctrl+C still raises KeyboardInterrupt
+
+    await app.initialize()
+    await post_init(app)
+    await server.start()
+    # ALL_TYPES so channel chat_member updates reach the membership cache
+    if webhook:
+        await app.bot.set_webhook(
+            url=config.WEBHOOK_URL + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        )
+        print(f"Webhook set to {config.WEBHOOK_URL}{config.WEBHOOK_PATH}")
+    else:
+        await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        print("Bot is polling...")
+    await app.start()
+    server.ready = True
+
+    try:
+        await stop.wait()
+    finally:
+        print("Shutting down...")
+        server.ready = False
+        # The webhook stays registered: Telegram holds updates until we're back
+        if app.updater and app.updater.running:
+            await app.updater.stop()
+        await app.stop()
+        await post_stop(app)
+        await server.stop()
+        await app.shutdown()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,40 @@
+from sqlalchemy import select, func, update, insert
+from database import engine, Bot, Vote
+
+def migrate_votes_from_json(conn):
+    """One-time move of Bot.votes_data ({user_id: score}) into the votes table.
+
+    Migration step 2 (see migrations.py); a no-op once the votes table has rows. Aggregates
+    (score_sum / vote_count / rating) are recomputed from the copied rows and the
+    legacy JSON is cleared.
+    """
+    if conn.execute(select(Vote.bot_id).limit(1)).first():
+        return
+    voted_bots = conn.execute(select(Bot.bot_id).where(Bot.vote_count > 0)).scalars().all()
+    if not voted_bots:
+        return
+
+    print(f"Migrating votes of {len(voted_bots)} bots from votes_data JSON...")
+    moved = 0
+    for bot_id in voted_bots:
+        votes = conn.execute(select(Bot.votes_data).where(Bot.bot_id == bot_id)).scalar() or {}
+        rows = [{"bot_id": bot_id, "user_id": int(uid), "score": int(score)} for uid, score in votes.items()]
+        if rows:
+            conn.execute(insert(Vote), rows)
+            moved += len(rows)
+
+        score_sum = sum(r["score"] for r in rows)
+        conn.execute(update(Bot).where(Bot.bot_id == bot_id).values(
+            score_sum=score_sum,
+            vote_count=len(rows),
+            rating=round(score_sum / len(rows), 1) if rows else 0.0,
+            votes_data={}
+        ))
+    print(f"✅ Moved {moved} votes into the votes table.")
+
+if __name__ == "__main__":
+    from database import init_db
+    # Applies every pending migration, this one included
+    init_db()
+    with engine.connect() as conn:
+        print(f"votes rows: {conn.execute(select(func.count()).select_from(Vote)).scalar()}")
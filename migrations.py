@@ -0,0 +1,259 @@
+"""Versioned schema migrations.
+
+Every applied step is recorded in `schema_version`; upgrade() runs the missing
+ones in order. init_db() calls it on boot, or run it by hand:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py status     # applied / pending steps
+    python migrations.py check      # which index each handler's hot query uses (EXPLAIN)
+
+A step is a function taking a sync Connection. Ordinary steps run in one
+transaction. Steps marked online run on an autocommit connection instead, so
+Postgres can build indexes CONCURRENTLY while the bot keeps reading and writing
+the table. An online step can't be rolled back halfway, so it must be safe to
+re-run (IF NOT EXISTS and the like).
+
+Add new steps at the end of MIGRATIONS; never renumber or edit applied ones.
+"""
+import datetime
+import re
+import sys
+from typing import Callable, NamedTuple
+from sqlalchemy import inspect, insert, select, text, func
+from sqlalchemy.schema import CreateIndex
+import config
+from database import IS_POSTGRES, engine, Base, SchemaVersion, User, Bot, BotSubmission, Counter, DailyStat, OutboxMessage
+
+# pg_advisory_lock key, so only one process migrates at a time. Session locks don't
+# survive PgBouncer's transaction pooling, so they're skipped there.
+LOCK_KEY = 7224_0001
+USE_LOCK = IS_POSTGRES and not config.DB_PGBOUNCER
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+    online: bool = False
+
+# --- helpers for steps ---
+
+def add_column(conn, table_name: str, column_name: str):
+    """ALTER TABLE ADD COLUMN from the model's definition, if the column isn't there yet.
+
+    Only nullable columns or scalar defaults: that's a metadata-only change on
+    Postgres 11+ and SQLite, so it doesn't rewrite or lock the table for long.
+    """
+    if column_name in {c["name"] for c in inspect(conn).get_columns(table_name)}:
+        return
+    col = Base.metadata.tables[table_name].columns[column_name]
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {col.name} {col.type.compile(dialect=conn.dialect)}"
+    if col.default is not None and col.default.is_scalar:
+        ddl += f" DEFAULT {col.default.arg!r}"
+    conn.execute(text(ddl))
+
+def create_index(conn, table_name: str, index_name: str):
+    """Creates an index declared on a model, CONCURRENTLY on Postgres. Use from online steps."""
+    index = next(i for i in Base.metadata.tables[table_name].indexes if i.name == index_name)
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    if IS_POSTGRES:
+        # A concurrent build that failed leaves an INVALID index behind; IF NOT EXISTS would keep it
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": index_name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+    conn.execute(text(ddl))
+
+# --- steps ---
+
+def _baseline(conn):
+    # Deployments from before migrations existed: create what's missing, add columns
+    # that create_all() never added to their existing tables
+    Base.metadata.create_all(conn)
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for col in table.columns:
+            if col.name not in existing:
+                add_column(conn, table.name, col.name)
+
+def _votes_from_json(conn):
+    from migrate_votes import migrate_votes_from_json
+    migrate_votes_from_json(conn)
+
+def _search_index(conn):
+    from services.search_index import setup_search_index
+    setup_search_index(conn)
+
+def _hot_query_indexes(conn):
+    for table_name, index_name in (
+        ("bots", "ix_bots_rating"),
+        ("bots", "ix_bots_category_rating"),
+        ("submissions", "ix_submissions_status"),
+        ("submissions", "ix_submissions_bot_username"),
+        ("submissions", "ix_submissions_claimed_by"),
+        ("submissions", "ix_submissions_claim_time"),
+    ):
+        create_index(conn, table_name, index_name)
+
+def _users_last_seen(conn):
+    add_column(conn, "users", "last_seen")
+
+def _counters(conn):
+    from services.counters import recount
+    Base.metadata.create_all(conn, tables=[Counter.__table__, DailyStat.__table__])
+    recount(conn)
+
+def _outbox(conn):
+    OutboxMessage.__table__.create(conn, checkfirst=True)
+
+def _drop_search_index(conn):
+    if IS_POSTGRES:
+        conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_bots_search_vector"))
+        conn.execute(text("ALTER TABLE bots DROP COLUMN IF EXISTS search_vector"))
+    else:
+        conn.execute(text("DROP TABLE IF EXISTS bots_fts"))
+
+MIGRATIONS = [
+    Migration(1, "baseline tables and columns", _baseline),
+    Migration(2, "votes table from votes_data JSON", _votes_from_json),
+    Migration(3, "full-text search index", _search_index, online=True),
+    Migration(4, "indexes for hot queries", _hot_query_indexes, online=True),
+    Migration(5, "users.last_seen", _users_last_seen),
+    Migration(6, "counters and daily stats for /stats", _counters),
+    Migration(7, "outbox for moderation side effects", _outbox),
+    Migration(8, "drop the unused full-text search index", _drop_search_index, online=True),
+]
+
+# --- runner ---
+
+def _applied(conn):
+    return {row.version: row for row in conn.execute(select(SchemaVersion))}
+
+def upgrade():
+    """Applies pending migrations in order. Safe to call from several processes at once."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        if USE_LOCK:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_KEY})
+        try:
+            with engine.begin() as conn:
+                SchemaVersion.__table__.create(conn, checkfirst=True)
+                applied = _applied(conn)
+
+            for migration in MIGRATIONS:
+                if migration.version in applied:
+                    continue
+                print(f"Applying migration {migration.version}: {migration.name}...")
+                if migration.online:
+                    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        migration.apply(conn)
+                        conn.execute(insert(SchemaVersion).values(version=migration.version, name=migration.name))
+                else:
+                    with engine.begin() as conn:
+                        migration.apply(conn)
+                        conn.execute(insert(SchemaVersion).values(version=migration.version, name=migration.name))
+        finally:
+            if USE_LOCK:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+
+def status():
+    with engine.begin() as conn:
+        SchemaVersion.__table__.create(conn, checkfirst=True)
+        applied = _applied(conn)
+    for migration in MIGRATIONS:
+        row = applied.get(migration.version)
+        state = f"applied {row.applied_at:%Y-%m-%d %H:%M}" if row else "pending"
+        print(f"{migration.version:>3}  {migration.name:<40} {state}")
+
+# --- index check ---
+
+def hot_queries():
+    """(handler, query, index we expect it to use) for the queries that run per update.
+    Catalog reads (browse, /list, search) are served from memory and don't appear here."""
+    return [
+        ("submission.get_name", "approved duplicate",
+         select(Bot.bot_id).where(Bot.username == "@some_bot").limit(1), "bots_username"),
+        ("submission.get_name", "pending duplicate",
+         select(BotSubmission.id).where(BotSubmission.bot_username == "@some_bot", BotSubmission.status == "pending").limit(1),
+         "ix_submissions_bot_username"),
+        ("admin.stats", "trend snapshot",
+         select(func.min(DailyStat.day)).where(DailyStat.day >= datetime.date(2024, 1, 1)), "daily_stats_pkey"),
+        ("admin.delete_bot", "bot by username",
+         select(Bot).where(Bot.username == "@some_bot"), "bots_username"),
+        ("moderation.claim", "submission by id",
+         select(BotSubmission).where(BotSubmission.id == 1), None),
+        ("outbox.deliver_due", "due messages",
+         select(OutboxMessage.id).where(OutboxMessage.next_attempt_at <= datetime.datetime(2024, 1, 1))
+         .order_by(OutboxMessage.next_attempt_at).limit(50), "ix_outbox_due"),
+        ("broadcast._run", "next chunk of users",
+         select(User.user_id).where(User.user_id > 0, User.blocked.isnot(True)).order_by(User.user_id).limit(200), None),
+    ]
+
+def _pg_indexes(plan):
+    found = []
+    node_type = plan.get("Node Type", "")
+    if "Index Name" in plan:
+        found.append(plan["Index Name"])
+    elif node_type == "Seq Scan":
+        found.append(f"SEQ SCAN {plan['Relation Name']}")
+    for child in plan.get("Plans", []):
+        found += _pg_indexes(child)
+    return found
+
+def _sqlite_indexes(rows):
+    found = []
+    for row in rows:
+        detail = row[-1]
+        m = re.search(r"USING (?:COVERING )?INDEX (\w+)", detail)
+        if m:
+            found.append(m.group(1))
+        elif "PRIMARY KEY" in detail:
+            found.append("primary key")
+        elif detail.startswith("SCAN "):
+            found.append(f"SEQ SCAN {detail.split()[1]}")
+    return found
+
+def _normalize(name: str) -> str:
+    # Unique constraints and composite primary keys are auto-named indexes on both backends
+    if name in ("bots_username_key", "sqlite_autoindex_bots_1"):
+        return "bots_username"
+    if name == "sqlite_autoindex_daily_stats_1":
+        return "daily_stats_pkey"
+    return name
+
+def check_indexes() -> bool:
+    """Prints the indexes EXPLAIN picks for each hot query. False if any misses the expected one.
+
+    Planners prefer sequential scans on tiny tables, so run this against a DB with realistic data.
+    """
+    ok = True
+    with engine.connect() as conn:
+        for handler, label, stmt, expected in hot_queries():
+            sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            if IS_POSTGRES:
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+                used = _pg_indexes(plan[0]["Plan"])
+            else:
+                used = _sqlite_indexes(conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all())
+            used = [_normalize(name) for name in used]
+
+            missed = expected is not None and expected not in used
+            ok = ok and not missed
+            print(f"{'⚠️' if missed else '✅'} {handler:<22} {label:<22} {', '.join(used) or '-'}"
+                  + (f"  (expected {expected})" if missed else ""))
+    return ok
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        upgrade()
+        print("✅ Schema is up to date.")
+    elif command == "status":
+        status()
+    elif command == "check":
+        sys.exit(0 if check_indexes() else 1)
+    else:
+        print(f"Unknown command {command!r}. Use upgrade, status or check.")
+        sys.exit(2)
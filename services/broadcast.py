@@ -0,0 +1,135 @@
+"""Rate-limited, resumable /broadcast delivery.
+
+Users are streamed in user_id order, BROADCAST_CHUNK_SIZE at a time, and each
+chunk is sent concurrently (BROADCAST_CONCURRENCY in flight). After every chunk
+the cursor, counters and newly blocked users are committed together, so a
+restart resumes from the last finished chunk (at worst one chunk is sent twice).
+Pacing and RetryAfter are the outbound scheduler's: messages go out in its bulk
+lane, behind everything users are waiting on.
+"""
+import asyncio
+import datetime
+import html
+from sqlalchemy import select, update
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from database import AsyncSessionLocal, Broadcast, User
+from services import outbound
+import config
+
+MAX_ATTEMPTS = 3
+
+SENT, BLOCKED, FAILED = "sent", "blocked", "failed"
+
+class BroadcastEngine:
+    def __init__(self, concurrency: int, chunk_size: int):
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.tasks = {}     # broadcast id -> asyncio task
+
+    async def start(self, bot, text: str, created_by: int) -> int:
+        async with AsyncSessionLocal() as session:
+            job = Broadcast(text=text, created_by=created_by)
+            session.add(job)
+            await session.commit()
+        self._spawn(bot, job.id)
+        return job.id
+
+    async def resume(self, bot):
+        """Picks up broadcasts that were still running when the process stopped."""
+        async with AsyncSessionLocal() as session:
+            ids = (await session.scalars(select(Broadcast.id).where(Broadcast.status == "running"))).all()
+        for job_id in ids:
+            print(f"Resuming broadcast #{job_id}...")
+            self._spawn(bot, job_id)
+
+    async def stop(self):
+        # Progress is committed per chunk, so cancelling just means resume() continues it next boot
+        for task in list(self.tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+
+    def _spawn(self, bot, job_id: int):
+        if job_id not in self.tasks:
+            task = asyncio.create_task(self._run(bot, job_id))
+            self.tasks[job_id] = task
+            task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    async def _run(self, bot, job_id: int):
+        try:
+            async with AsyncSessionLocal() as session:
+                job = await session.get(Broadcast, job_id)
+            text = f"📢 <b>ANNOUNCEMENT</b>\n\n{html.escape(job.text)}"
+            cursor = job.last_user_id or 0
+            limiter = asyncio.Semaphore(self.concurrency)
+
+            while True:
+                async with AsyncSessionLocal() as session:
+                    user_ids = (await session.scalars(
+                        select(User.user_id)
+                        .where(User.user_id > cursor, User.blocked.isnot(True))
+                        .order_by(User.user_id)
+                        .limit(self.chunk_size)
+                    )).all()
+                if not user_ids:
+                    break
+
+                outcomes = await asyncio.gather(*(self._send(bot, limiter, uid, text) for uid in user_ids))
+                blocked = [uid for uid, outcome in zip(user_ids, outcomes) if outcome == BLOCKED]
+                cursor = user_ids[-1]
+
+                async with AsyncSessionLocal() as session:
+                    if blocked:
+                        await session.execute(update(User).where(User.user_id.in_(blocked)).values(blocked=True))
+                    await session.execute(update(Broadcast).where(Broadcast.id == job_id).values(
+                        last_user_id=cursor,
+                        sent_count=Broadcast.sent_count + outcomes.count(SENT),
+                        blocked_count=Broadcast.blocked_count + len(blocked),
+                        failed_count=Broadcast.failed_count + outcomes.count(FAILED),
+                    ))
+                    await session.commit()
+
+            async with AsyncSessionLocal() as session:
+                job = await session.get(Broadcast, job_id)
+                job.status = "done"
+                job.finished_at = datetime.datetime.utcnow()
+                await session.commit()
+
+            try:
+                with outbound.lane(outbound.NOTIFICATIONS):
+                    await bot.send_message(
+                        chat_id=job.created_by,
+                        text=(
+                            f"✅ Broadcast #{job_id} finished.\n\n"
+                            f"📨 Sent: {job.sent_count}\n"
+                            f"🚫 Blocked: {job.blocked_count}\n"
+                            f"⚠️ Failed: {job.failed_count}"
+                        )
+                    )
+            except Exception as e:
+                print(f"Failed to report broadcast #{job_id}: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Broadcast #{job_id} stopped with an error (will resume on restart): {e}")
+
+    async def _send(self, bot, limiter, user_id: int, text: str) -> str:
+        async with limiter:
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    with outbound.lane(outbound.BULK):
+                        await bot.send_message(chat_id=user_id, text=text, parse_mode="HTML")
+                    return SENT
+                except RetryAfter:
+                    pass # the scheduler has paused sending for as long as Telegram asked
+                except Forbidden:
+                    return BLOCKED # blocked the bot / deactivated account
+                except BadRequest as e:
+                    if "chat not found" in str(e).lower():
+                        return BLOCKED
+                    return FAILED
+                except NetworkError:
+                    await asyncio.sleep(2 ** attempt)
+            return FAILED
+
+broadcast_engine = BroadcastEngine(config.BROADCAST_CONCURRENCY, config.BROADCAST_CHUNK_SIZE)
@@ -0,0 +1,58 @@
+"""Small in-process caches.
+
+TTLCache is a size-bounded LRU with expiry. The catalog version is bumped
+whenever the set of approved bots or their ratings change (approve, delete,
+vote flush); anything rendered from the catalog keys its cache entries by it,
+so one bump invalidates them all.
+"""
+import time
+from collections import OrderedDict
+import config
+
+class TTLCache:
+    """LRU dict with a size bound and per-entry expiry. Counts hits and misses."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()   # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self.data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self.data[key]
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value, ttl: float = None):
+        self.data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def invalidate(self, key):
+        self.data.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+catalog_version = 0
+
+def bump_catalog_version():
+    global catalog_version
+    catalog_version += 1
+
+# Rendered /list pages: (catalog_version, cursor...) -> (text, reply_markup)
+page_cache = TTLCache(config.PAGE_CACHE_SIZE, config.PAGE_CACHE_TTL)
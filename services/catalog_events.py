@@ -0,0 +1,201 @@
+"""One place that keeps every in-memory view of the catalog in sync.
+
+Handlers call these after the DB transaction commits instead of poking each
+index themselves; load_views() builds all of them at startup.
+
+Every worker keeps its own views, so each event is applied here and, on
+Postgres, NOTIFYd to the other workers (the same way services/roles.py does
+it). They re-read the bots / submissions named in the notification rather than
+trusting a payload, so notifications that arrive late or out of order still
+leave the current rows. Where NOTIFY can't be used (SQLite, PgBouncer
+transaction pooling, a dropped listener connection) the views are reloaded
+every CATALOG_RELOAD_INTERVAL instead.
+"""
+import asyncio
+import uuid
+from sqlalchemy import select, text
+from database import AsyncSessionLocal, IS_POSTGRES, async_engine, Bot, BotSubmission
+from services.catalog import catalog, _COLUMNS
+from services.inline_index import inline_index
+from services.leaderboard import leaderboards
+from services.near_duplicates import near_duplicates, bot_key, submission_key
+from services.cache import bump_catalog_version
+import config
+
+CHANNEL = "catalog_changes"
+# Lets a worker skip its own notifications, which it has applied already
+_WORKER = uuid.uuid4().hex[:12]
+# pg_notify payloads are capped at 8000 bytes
+_IDS_PER_NOTIFY = 500
+
+async def bot_added(bot):
+    """A bot was approved (or its channel post / details changed)."""
+    _add_bot(bot)
+    await catalog_sync.notify("bots", [bot.bot_id])
+
+async def bot_removed(bot_id: int):
+    _remove_bot(bot_id)
+    await catalog_sync.notify("bots", [bot_id])
+
+async def ratings_changed(changes):
+    """changes: {bot_id: (rating, vote_count)} from one vote flush."""
+    _update_ratings(changes)
+    await catalog_sync.notify("ratings", list(changes))
+
+async def submission_added(sub):
+    near_duplicates.add(submission_key(sub.id), sub.description, sub.features)
+    await catalog_sync.notify("submissions", [sub.id])
+
+async def submission_closed(sub_id: int):
+    """Approved or rejected: no longer a pending duplicate candidate."""
+    near_duplicates.remove(submission_key(sub_id))
+    await catalog_sync.notify("submissions", [sub_id])
+
+def _add_bot(bot):
+    record = catalog.add(bot)
+    inline_index.add(record)
+    leaderboards.add(record.bot_id, record.rating, record.category)
+    near_duplicates.add(bot_key(record.bot_id), record.description, record.features)
+    bump_catalog_version()
+
+def _remove_bot(bot_id: int):
+    catalog.remove(bot_id)
+    inline_index.remove(bot_id)
+    leaderboards.remove(bot_id)
+    near_duplicates.remove(bot_key(bot_id))
+    bump_catalog_version()
+
+def _update_ratings(changes):
+    for bot_id, (rating, vote_count) in changes.items():
+        previous = catalog.update_rating(bot_id, rating, vote_count)
+        if previous is not None:
+            inline_index.rating_changed(bot_id, previous, rating)
+            leaderboards.update_rating(bot_id, rating)
+    if changes:
+        bump_catalog_version()
+
+async def load_views():
+    await catalog.load()
+    inline_index.build(catalog.bots.values())
+    leaderboards.build(catalog.bots.values())
+    await near_duplicates.load(catalog.bots.values())
+    print(f"Catalog views loaded ({len(catalog)} bots).")
+
+class CatalogSync:
+    """Applies the other workers' catalog events to this one's views."""
+
+    def __init__(self, reload_interval: float):
+        self.reload_interval = reload_interval
+        self._task = None
+        self._listen_conn = None
+        self._refreshes = set()
+        self._lock = asyncio.Lock()   # refreshes and reloads apply one at a time, in arrival order
+
+    async def notify(self, kind: str, ids):
+        """Tells the other workers to re-read ids; the change is committed and applied here already."""
+        if not IS_POSTGRES or not ids:
+            return
+        try:
+            async with async_engine.connect() as conn:
+                for i in range(0, len(ids), _IDS_PER_NOTIFY):
+                    payload = f"{_WORKER}:{kind}:{','.join(map(str, ids[i:i + _IDS_PER_NOTIFY]))}"
+                    await conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                       {"channel": CHANNEL, "payload": payload})
+                await conn.commit()
+        except Exception as e:
+            print(f"Failed to notify catalog change {kind} {ids}: {e}")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        worker, kind, ids = payload.split(":", 2)
+        if worker == _WORKER:
+            return
+        task = asyncio.create_task(self._refresh(kind, [int(i) for i in ids.split(",")]))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    async def _refresh(self, kind: str, ids: list):
+        """Re-reads the rows another worker changed and applies what they hold now."""
+        try:
+            async with self._lock:
+                async with AsyncSessionLocal() as session:
+                    if kind == "ratings":
+                        rows = (await session.execute(
+                            select(Bot.bot_id, Bot.rating, Bot.vote_count).where(Bot.bot_id.in_(ids))
+                        )).all()
+                        _update_ratings({bot_id: (rating, vote_count) for bot_id, rating, vote_count in rows})
+                    elif kind == "bots":
+                        rows = {row.bot_id: row for row in (await session.execute(
+                            select(*_COLUMNS).where(Bot.bot_id.in_(ids)))).all()}
+                        for bot_id in ids:
+                            if bot_id in rows:
+                                _add_bot(rows[bot_id])
+                            else:
+                                _remove_bot(bot_id)   # deleted since
+                    elif kind == "submissions":
+                        rows = {row.id: row for row in (await session.execute(
+                            select(BotSubmission.id, BotSubmission.description, BotSubmission.features)
+                            .where(BotSubmission.id.in_(ids), BotSubmission.status == "pending"))).all()}
+                        for sub_id in ids:
+                            if sub_id in rows:
+                                near_duplicates.add(submission_key(sub_id), rows[sub_id].description, rows[sub_id].features)
+                            else:
+                                near_duplicates.remove(submission_key(sub_id))
+        except Exception as e:
+            print(f"Failed to apply catalog change {kind} {ids}: {e}")
+
+    async def reload(self):
+        async with self._lock:
+            await load_views()
+            bump_catalog_version()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._refreshes) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        await self._close_listener()
+
+    async def _run(self):
+        while True:
+            listening = False
+            if IS_POSTGRES and not config.DB_PGBOUNCER:
+                try:
+                    await self._ensure_listener()
+                    listening = True
+                except Exception as e:
+                    print(f"Catalog change listener unavailable, relying on reloads: {e}")
+            await asyncio.sleep(self.reload_interval)
+            if listening:
+                continue  # _ensure_listener reloads if the connection dropped meanwhile
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f"Failed to reload the catalog: {e}")
+
+    async def _ensure_listener(self):
+        if self._listen_conn is not None:
+            raw = (await self._listen_conn.get_raw_connection()).driver_connection
+            if not raw.is_closed():
+                return
+            await self._close_listener()
+            await self.reload()   # changes may have been missed while it was down
+
+        self._listen_conn = await async_engine.connect()
+        raw = (await self._listen_conn.get_raw_connection()).driver_connection
+        await raw.add_listener(CHANNEL, self._on_notify)
+
+    async def _close_listener(self):
+        if self._listen_conn is not None:
+            conn, self._listen_conn = self._listen_conn, None
+            try:
+                await conn.invalidate()   # the LISTEN session shouldn't go back into the pool
+                await conn.close()
+            except Exception:
+                pass
+
+catalog_sync = CatalogSync(config.CATALOG_RELOAD_INTERVAL)
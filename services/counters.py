@@ -0,0 +1,89 @@
+"""Running totals and daily history for /stats.
+
+The paths that change users, bots, submissions and votes bump a counter in the
+same transaction, so /stats reads a handful of rows. daily_rollup() snapshots
+them into daily_stats once a UTC day; recount() rebuilds them from the tables.
+"""
+import datetime
+from sqlalchemy import select, delete, insert, func, literal, true
+from database import AsyncSessionLocal, dialect_insert, Counter, DailyStat, User, Bot, BotSubmission, Vote
+
+USERS = "users"           # users who /start-ed
+BOTS = "bots"             # approved bots; per category under category_key()
+PENDING = "pending"       # submissions awaiting review
+SUBMITTED = "submitted"   # running totals of those events
+APPROVED = "approved"
+REJECTED = "rejected"
+VOTES = "votes"           # votes cast; a changed score isn't a new vote
+
+TREND_DAYS = (7, 30)
+
+def category_key(category: str) -> str:
+    return f"bots:{category}"
+
+async def bump(session, deltas: dict):
+    """Adds {name: delta} to the counters inside the caller's transaction (caller commits)."""
+    # Sorted, so two transactions bumping the same counters lock them in the same order
+    rows = [{"name": name, "value": delta} for name, delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+    stmt = dialect_insert(Counter)
+    stmt = stmt.on_conflict_do_update(index_elements=[Counter.name],
+                                      set_={"value": Counter.value + stmt.excluded.value})
+    await session.execute(stmt, rows)
+
+def recount(conn):
+    """Replaces every counter with a fresh count of the tables (sync Connection)."""
+    values = {
+        USERS: conn.scalar(select(func.count()).select_from(User)),
+        BOTS: conn.scalar(select(func.count()).select_from(Bot)),
+        PENDING: conn.scalar(select(func.count()).select_from(BotSubmission).where(BotSubmission.status == "pending")),
+        SUBMITTED: conn.scalar(select(func.count()).select_from(BotSubmission)),
+        APPROVED: conn.scalar(select(func.count()).select_from(BotSubmission).where(BotSubmission.status == "approved")),
+        REJECTED: conn.scalar(select(func.count()).select_from(BotSubmission).where(BotSubmission.status == "rejected")),
+        VOTES: conn.scalar(select(func.count()).select_from(Vote)),
+    }
+    for category, count in conn.execute(select(Bot.category, func.count()).group_by(Bot.category)):
+        values[category_key(category)] = count
+    conn.execute(delete(Counter))
+    conn.execute(insert(Counter), [{"name": name, "value": value} for name, value in values.items()])
+
+def _today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+async def snapshot(day: datetime.date = None):
+    """Copies the counters into daily_stats for `day` (today, UTC), unless already done."""
+    day = day or _today()
+    # WHERE true: SQLite would otherwise parse ON CONFLICT as a join constraint
+    stmt = dialect_insert(DailyStat).from_select(
+        ["day", "name", "value"],
+        select(literal(day, DailyStat.day.type), Counter.name, Counter.value).where(true())
+    ).on_conflict_do_nothing(index_elements=[DailyStat.day, DailyStat.name])
+    async with AsyncSessionLocal() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+async def daily_rollup(context=None):
+    """Job-queue callback (see main.py)."""
+    try:
+        await snapshot()
+    except Exception as e:
+        print(f"Daily stats rollup failed: {e}")
+
+async def read_stats():
+    """(counters, trends): counters is {name: value}; trends is {window: (days, {name: change})},
+    measured from the oldest snapshot inside each window. A window is left out when
+    there's no snapshot in it, or only the one the shorter window already uses."""
+    today = _today()
+    async with AsyncSessionLocal() as session:
+        counters = dict((await session.execute(select(Counter.name, Counter.value))).all())
+        trends = {}
+        for window in TREND_DAYS:
+            day = await session.scalar(select(func.min(DailyStat.day)).where(DailyStat.day >= today - datetime.timedelta(days=window)))
+            if day is None or any(days == (today - day).days for days, _ in trends.values()):
+                continue
+            then = dict((await session.execute(
+                select(DailyStat.name, DailyStat.value).where(DailyStat.day == day)
+            )).all())
+            trends[window] = ((today - day).days, {name: value - then.get(name, 0) for name, value in counters.items()})
+    return counters, trends
@@ -0,0 +1,120 @@
+"""The bot's one HTTP server, running on the bot's own event loop.
+
+    POST WEBHOOK_PATH   Telegram updates (webhook mode only). Requests without the
+                        right X-Telegram-Bot-Api-Secret-Token are refused.
+    GET  /              liveness, for Render / UptimeRobot
+    GET  /ready         readiness: started, in-memory views loaded, DB reachable
+    GET  /metrics       Prometheus text format: the gauges below plus the handler,
+                        DB and Bot API histograms from services/metrics
+"""
+import asyncio
+import hmac
+import json
+from aiohttp import web
+from sqlalchemy import text
+from telegram import Update
+from database import async_engine, pool_stats
+import config
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+READY_DB_TIMEOUT = 3
+
+class HttpServer:
+    def __init__(self, application, port: int, webhook_path: str = None, secret: str = None):
+        self.application = application
+        self.port = port
+        self.webhook_path = webhook_path
+        self.secret = secret
+        self.ready = False      # set once startup is done, cleared when shutting down
+        self.runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/", self.health)
+        self.app.router.add_get("/ready", self.readiness)
+        self.app.router.add_get("/metrics", self.metrics)
+        if webhook_path:
+            self.app.router.add_post(webhook_path, self.webhook)
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "0.0.0.0", self.port).start()
+        print(f"HTTP server listening on :{self.port}")
+
+    async def stop(self):
+        self.ready = False
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def webhook(self, request: web.Request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret or ""):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400)
+        # Answer Telegram right away; the application processes it from its queue
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        return web.Response()
+
+    async def health(self, request: web.Request):
+        return web.Response(text="Bot is Alive!")
+
+    async def readiness(self, request: web.Request):
+        from services.catalog import catalog
+        from services.inline_index import inline_index
+        from services.leaderboard import leaderboards
+
+        checks = {
+            "started": self.ready,
+            "views_loaded": catalog.ready and inline_index.ready and leaderboards.ready,
+            "database": await self._ping_db(),
+        }
+        status = 200 if all(checks.values()) else 503
+        return web.json_response(checks, status=status)
+
+    async def _ping_db(self) -> bool:
+        try:
+            async with async_engine.connect() as conn:
+                await asyncio.wait_for(conn.execute(text("SELECT 1")), READY_DB_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def metrics(self, request: web.Request):
+        return web.Response(text=render_metrics(self.application), content_type="text/plain", charset="utf-8")
+
+def render_metrics(application) -> str:
+    from services.vote_buffer import vote_buffer
+    from services.user_registry import user_registry
+    from services.catalog import catalog
+    from services.cache import page_cache
+    from services.membership import membership_cache
+    from services.outbound import outbound_scheduler
+    from services.outbox import outbox_worker
+    from services.update_log import update_recorder
+    from services import metrics
+
+    gauges = {
+        "update_queue_size": application.update_queue.qsize(),
+        "catalog_bots": len(catalog),
+        "pending_votes": len(vote_buffer.pending),
+        "pending_user_writes": len(user_registry.new) + len(user_registry.updates),
+    }
+    for name, value in pool_stats().items():
+        gauges[f"db_pool_{name}"] = value
+    for name, cache in (("page_cache", page_cache), ("membership_cache", membership_cache)):
+        stats = cache.stats()
+        gauges[f"{name}_size"] = stats["size"]
+        gauges[f"{name}_hits_total"] = stats["hits"]
+        gauges[f"{name}_misses_total"] = stats["misses"]
+    for name, value in outbound_scheduler.stats().items():
+        gauges[f"outbound_{name}"] = value
+    for name, value in outbox_worker.stats().items():
+        gauges[f"outbox_{name}"] = value
+    if update_recorder:
+        for name, value in update_recorder.stats().items():
+            gauges[f"update_log_{name}"] = value
+
+    return "".join(f"botlibrary_{name} {value}\n" for name, value in gauges.items()) + metrics.render()
@@ -0,0 +1,285 @@
+"""In-process index over approved bots for inline mode.
+
+Inline queries fire on every keystroke, so they're answered from memory:
+- a trigram inverted index (accent-folded) for typo-tolerant matches ("pokmon" -> "Pokémon")
+- a sorted list of usernames for `@user...` prefix autocomplete
+
+The index is built at startup by build() from the catalog's records (see
+services/catalog.py) and then kept current by add()/remove()/rating_changed()
+from the approve, delete and rating paths. Postings are sorted int arrays;
+add()/remove() go to small overlays that are merged into them every
+MERGE_EVERY changes.
+"""
+import bisect
+import collections
+from array import array
+import heapq
+import itertools
+import math
+import re
+import unicodedata
+from services.leaderboard import Leaderboard
+
+MIN_SIMILARITY = 0.5 # share of the query's trigrams a bot must contain
+# Above this many exact matches, walk the rating order instead of sorting every match
+WALK_THRESHOLD = 500
+# Fuzzy scoring looks at no more candidates than this (very unspecific queries hit the exact path anyway)
+MAX_CANDIDATES = 5000
+# Bots added or removed since the last merge before the overlays are folded into the postings
+MERGE_EVERY = 256
+# Relevance: trigrams found in the username count this much more than ones found only in the
+# description or features, and an exact username gets EXACT_NAME on top
+USERNAME_WEIGHT = 2.0
+EXACT_NAME = 1.0
+# Unspecific queries rank this many times `limit` of the best rated matches by relevance
+WALK_RERANK = 2
+
+def normalize(value: str) -> str:
+    """Lowercase and strip accents: 'Pokémon' -> 'pokemon'."""
+    value = value or ""
+    if value.isascii():
+        return value.lower()
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+_WORD_SPLIT = re.compile(r"[\W_]+")
+
+def _words(value: str):
+    return [w for w in _WORD_SPLIT.split(normalize(value)) if w]
+
+def trigrams(value: str) -> set:
+    grams = set()
+    for word in set(_words(value)):
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _username_key(username: str) -> str:
+    return normalize(username).lstrip("@")
+
+class InlineIndex:
+    def __init__(self):
+        self.bots = {}          # bot_id -> CatalogBot
+        self.postings = {}      # trigram -> sorted array('i') of bot_ids, as of the last merge
+        self.added = {}         # trigram -> set(bot_id) added since then
+        self.removed = set()    # bot_ids whose entries in postings no longer count
+        self.dirty = set()      # trigrams whose posting changes at the next merge
+        self.pending = 0        # adds and removes since the last merge
+        self.usernames = []     # sorted [(username_key, bot_id)]
+        self.ranked = Leaderboard()  # rating order, for walking unspecific queries
+        self.ready = False
+
+    def _doc_trigrams(self, bot) -> set:
+        # Underscore-less username too, so "pokebot" also hits "@poke_bot"
+        return trigrams(f"{bot.username} {bot.username.replace('_', '')} {bot.description} {bot.features}")
+
+    def add(self, entry):
+        """Adds or replaces a bot (a CatalogBot, shared with the catalog)."""
+        if entry.bot_id in self.bots:
+            self.remove(entry.bot_id)
+
+        self.bots[entry.bot_id] = entry
+        grams = self._doc_trigrams(entry)
+        for gram in grams:
+            self.added.setdefault(gram, set()).add(entry.bot_id)
+        self.dirty.update(grams)
+        bisect.insort(self.usernames, (_username_key(entry.username), entry.bot_id))
+        self.ranked.add(entry.bot_id, entry.rating)
+        self._changed()
+
+    def remove(self, bot_id: int):
+        entry = self.bots.pop(bot_id, None)
+        if not entry:
+            return
+        grams = self._doc_trigrams(entry)
+        for gram in grams:
+            ids = self.added.get(gram)
+            if ids is not None:
+                ids.discard(bot_id)
+                if not ids:
+                    del self.added[gram]
+        self.removed.add(bot_id)
+        self.dirty.update(grams)
+        _remove_sorted(self.usernames, (_username_key(entry.username), bot_id))
+        self.ranked.remove(bot_id, entry.rating)
+        self._changed()
+
+    def _changed(self):
+        self.pending += 1
+        if self.pending >= MERGE_EVERY:
+            self.merge()
+
+    def merge(self):
+        """Folds the overlays into the postings (only the trigrams they touched)."""
+        removed = self.removed
+        for gram in self.dirty:
+            ids = {i for i in self.postings.get(gram, ()) if i not in removed}
+            ids.update(self.added.get(gram, ()))
+            if ids:
+                self.postings[gram] = array("i", sorted(ids))
+            else:
+                self.postings.pop(gram, None)
+        self.added, self.removed, self.dirty, self.pending = {}, set(), set(), 0
+
+    def _count(self, gram: str) -> int:
+        """Size of gram's posting (an upper bound while bots are pending removal)."""
+        return len(self.postings.get(gram, ())) + len(self.added.get(gram, ()))
+
+    def _has(self, gram: str, bot_id: int) -> bool:
+        added = self.added.get(gram)
+        if added and bot_id in added:
+            return True
+        ids = self.postings.get(gram)
+        if not ids or bot_id in self.removed:
+            return False
+        i = bisect.bisect_left(ids, bot_id)
+        return i < len(ids) and ids[i] == bot_id
+
+    def _hits(self, gram: str, ids: set) -> set:
+        """The ones of ids that are in gram's posting."""
+        posting = self.postings.get(gram, ())
+        if len(ids) * 16 < len(posting):
+            # A few ids against a long posting: bisect for each rather than scan it
+            return {i for i in ids if self._has(gram, i)}
+        hits = ids.intersection(posting)
+        if self.removed:
+            hits -= self.removed
+        added = self.added.get(gram)
+        if added:
+            hits |= ids & added
+        return hits
+
+    def _ids(self, gram: str):
+        """Iterates gram's posting: merged ids in order, then the ones added since."""
+        removed = self.removed
+        for bot_id in self.postings.get(gram, ()):
+            if bot_id not in removed:
+                yield bot_id
+        yield from self.added.get(gram, ())
+
+    def rating_changed(self, bot_id: int, previous: float, rating: float):
+        """The record itself is updated by the catalog; this moves it in the rating order."""
+        if bot_id in self.bots and previous != rating:
+            self.ranked.remove(bot_id, previous)
+            self.ranked.add(bot_id, rating)
+
+    def relevance(self, bot, query: str, grams: set) -> float:
+        """How well bot matches a query all of whose trigrams it contains: their share
+        in the username, weighted up, plus a bonus for the exact username."""
+        name = _username_key(bot.username)
+        if not any(g.strip() in name.replace("_", "") for g in grams):
+            return 1.0  # matched on the description or features only (the common case)
+        # A query trigram is in the username's trigrams iff it's a substring of its padded words
+        words = f" {' '.join(_words(name) + _words(name.replace('_', '')))} "
+        score = 1.0 + USERNAME_WEIGHT * sum(g in words for g in grams) / len(grams)
+        if name == _username_key(query):
+            score += EXACT_NAME
+        return score
+
+    def prefix(self, prefix: str, limit: int):
+        """Bots whose username starts with prefix: the most of the name it covers first, then best rated."""
+        prefix = _username_key(prefix)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.usernames, (prefix,))
+        hits = []
+        for key, bot_id in self.usernames[start:]:
+            if not key.startswith(prefix):
+                break
+            hits.append(self.bots[bot_id])
+            if len(hits) >= limit * 5: # enough to rank; don't walk a huge "b..." range
+                break
+        hits.sort(key=lambda b: (-len(prefix) / len(_username_key(b.username)), -b.rating, b.username))
+        return hits[:limit]
+
+    def _ranked(self, query: str, ids, limit: int, grams: list):
+        """Top `limit` of ids, most relevant first, rating as the tiebreaker. Large sets walk
+        the rating order and rank only the best rated matches."""
+        if len(ids) > WALK_THRESHOLD:
+            walked = []
+            for _, bot_id in self.ranked.keys:
+                if bot_id in ids and all(self._has(g, bot_id) for g in grams[1:]):
+                    walked.append(bot_id)
+                    if len(walked) >= limit * WALK_RERANK:
+                        break
+            # Usernames starting with the query are worth ranking however low they're rated
+            walked += [b.bot_id for b in self.prefix(query, limit)
+                       if b.bot_id not in walked and all(self._has(g, b.bot_id) for g in grams)]
+            ids = walked
+        grams = set(grams)
+        scored = [(-self.relevance(self.bots[i], query, grams), -self.bots[i].rating, self.bots[i].username, i) for i in ids]
+        return [self.bots[s[3]] for s in heapq.nsmallest(limit, scored)]
+
+    def matches(self, query: str, limit: int):
+        """Bots containing every trigram of the query, most relevant first."""
+        grams = sorted(trigrams(query), key=self._count)
+        if not grams:
+            return []
+        rarest = set(self._ids(grams[0]))
+        if len(rarest) > WALK_THRESHOLD:
+            # Unspecific query ("bot"): intersecting would touch most of the catalog,
+            # walking from the top rated finds enough hits almost immediately
+            return self._ranked(query, rarest, limit, grams)
+        for gram in grams[1:]:
+            if not rarest:
+                break
+            rarest = self._hits(gram, rarest)
+        return self._ranked(query, rarest, limit, grams)
+
+    def fuzzy(self, query: str, limit: int):
+        """Bots containing most of the query's trigrams, most similar first."""
+        grams = sorted(trigrams(query), key=self._count)
+        if not grams:
+            return []
+        need = max(1, math.ceil(len(grams) * MIN_SIMILARITY))
+        # Prefix filtering: a bot with `need` matches must appear in one of the
+        # (len - need + 1) rarest postings, so only those are scanned for candidates.
+        candidates = set()
+        for gram in grams[:len(grams) - need + 1]:
+            candidates.update(itertools.islice(self._ids(gram), MAX_CANDIDATES - len(candidates)))
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+
+        counts = collections.Counter()
+        for gram in grams:
+            counts.update(self._hits(gram, candidates))
+        scored = []
+        for bot_id, matched in counts.items():
+            if matched >= need:
+                bot = self.bots[bot_id]
+                scored.append((-matched, -bot.rating, bot.username, bot_id))
+        return [self.bots[s[3]] for s in heapq.nsmallest(limit, scored)]
+
+    def search(self, query: str, limit: int = 10):
+        """Username prefix hits, then exact trigram matches, then typo-tolerant ones."""
+        query = query.strip()
+        hits = self.prefix(query, limit) if " " not in query else []
+        for finder in (self.matches, self.fuzzy):
+            if len(hits) >= limit:
+                break
+            seen = {b.bot_id for b in hits}
+            hits += [b for b in finder(query, limit) if b.bot_id not in seen]
+        return hits[:limit]
+
+    def build(self, records):
+        """Indexes all of the catalog's records at once."""
+        postings = {}
+        self.bots, self.usernames, self.ranked = {}, [], Leaderboard()
+        for record in records:
+            self.bots[record.bot_id] = record
+            for gram in self._doc_trigrams(record):
+                postings.setdefault(gram, []).append(record.bot_id)
+            self.usernames.append((_username_key(record.username), record.bot_id))
+            self.ranked.keys.append((-(record.rating or 0.0), record.bot_id))
+        self.postings = {gram: array("i", sorted(ids)) for gram, ids in postings.items()}
+        self.added, self.removed, self.dirty, self.pending = {}, set(), set(), 0
+        self.usernames.sort()
+        self.ranked.keys.sort()
+        self.ready = True
+
+def _remove_sorted(items: list, key):
+    i = bisect.bisect_left(items, key)
+    if i < len(items) and items[i] == key:
+        del items[i]
+
+inline_index = InlineIndex()
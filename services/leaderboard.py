@@ -0,0 +1,90 @@
+"""Maintained rankings for Top Rated, category lists and /list.
+
+Each Leaderboard is a sorted list of (-rating, bot_id) keys, i.e. rating DESC with
+bot_id as the tiebreaker (the same order /list seeks on). A rating change is a
+delete + insort; reading a page is a bisect + slice, so browse menus cost
+O(page size) however large the catalog gets.
+"""
+import bisect
+from services.catalog import catalog
+
+class Leaderboard:
+    def __init__(self):
+        self.keys = []  # sorted [(-rating, bot_id)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, bot_id: int, rating: float):
+        bisect.insort(self.keys, (-(rating or 0.0), bot_id))
+
+    def remove(self, bot_id: int, rating: float):
+        key = (-(rating or 0.0), bot_id)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def top(self, limit: int):
+        return [bot_id for _, bot_id in self.keys[:limit]]
+
+    def after(self, rating: float, bot_id: int, limit: int):
+        """The `limit` bots ranked right below (rating, bot_id)."""
+        i = bisect.bisect_right(self.keys, (-rating, bot_id))
+        return [b for _, b in self.keys[i:i + limit]]
+
+    def before(self, rating: float, bot_id: int, limit: int):
+        """The `limit` bots ranked right above (rating, bot_id), best first."""
+        i = bisect.bisect_left(self.keys, (-rating, bot_id))
+        return [b for _, b in self.keys[max(0, i - limit):i]]
+
+class Leaderboards:
+    """The global ranking plus one per category."""
+
+    def __init__(self):
+        self.all = Leaderboard()
+        self.categories = {}    # category -> Leaderboard
+        self.entries = {}       # bot_id -> (rating, category)
+        self.ready = False
+
+    def category(self, name: str) -> Leaderboard:
+        return self.categories.get(name) or Leaderboard()
+
+    def add(self, bot_id: int, rating: float, category: str):
+        if bot_id in self.entries:
+            self.remove(bot_id)
+        rating = rating or 0.0
+        self.entries[bot_id] = (rating, category)
+        self.all.add(bot_id, rating)
+        self.categories.setdefault(category, Leaderboard()).add(bot_id, rating)
+
+    def remove(self, bot_id: int):
+        entry = self.entries.pop(bot_id, None)
+        if entry:
+            rating, category = entry
+            self.all.remove(bot_id, rating)
+            self.categories[category].remove(bot_id, rating)
+
+    def update_rating(self, bot_id: int, rating: float):
+        entry = self.entries.get(bot_id)
+        if entry and entry[0] != rating:
+            self.add(bot_id, rating, entry[1])
+
+    def build(self, records):
+        """All rankings from the catalog's records, with one sort per list
+        instead of an insort per bot."""
+        self.all, self.categories, self.entries = Leaderboard(), {}, {}
+        for record in records:
+            self.entries[record.bot_id] = (record.rating, record.category)
+            self.all.keys.append((-record.rating, record.bot_id))
+            self.categories.setdefault(record.category, Leaderboard()).keys.append((-record.rating, record.bot_id))
+        self.all.keys.sort()
+        for board in self.categories.values():
+            board.keys.sort()
+        self.ready = True
+
+leaderboards = Leaderboards()
+
+def top_bots(limit: int, category: str = None):
+    """Best-rated bots overall or in one category, as catalog records."""
+    board = leaderboards.category(category) if category else leaderboards.all
+    return catalog.get_many(board.top(limit))
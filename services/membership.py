@@ -0,0 +1,36 @@
+"""Cached force-join checks for voting.
+
+rate_bot asks is_channel_member() instead of calling get_chat_member on every
+click. Answers are kept per user for MEMBERSHIP_CACHE_TTL seconds (non-members
+for a shorter while, so people who just joined aren't locked out), and
+ChatMemberHandler updates from the channel overwrite the cached status as soon
+as someone joins or leaves.
+"""
+from services.cache import TTLCache
+import config
+
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+membership_cache = TTLCache(config.MEMBERSHIP_CACHE_SIZE, config.MEMBERSHIP_CACHE_TTL)
+
+def is_channel_chat(chat) -> bool:
+    """Whether a Chat is the configured CHANNEL_ID (numeric id or @username)."""
+    channel = str(config.CHANNEL_ID or "")
+    if not channel:
+        return False
+    if channel.startswith("@"):
+        return bool(chat.username) and chat.username.lower() == channel[1:].lower()
+    return str(chat.id) == channel
+
+def remember_status(user_id: int, status: str):
+    is_member = status in MEMBER_STATUSES
+    membership_cache.set(user_id, is_member, None if is_member else config.MEMBERSHIP_NEGATIVE_TTL)
+
+async def is_channel_member(bot, user_id: int) -> bool:
+    """Raises whatever get_chat_member raises on a cache miss; errors are not cached."""
+    cached = membership_cache.get(user_id)
+    if cached is not None:
+        return cached
+    member = await bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
+    remember_status(user_id, member.status)
+    return member.status in MEMBER_STATUSES
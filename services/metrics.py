@@ -0,0 +1,209 @@
+"""Per-handler, per-update, DB and Bot API instrumentation for /metrics.
+
+Histograms and counters are kept in memory and rendered by hand in the
+Prometheus text format. DB statements are attributed to the update being
+handled through a context variable the update processor sets.
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import time
+from sqlalchemy import event
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+
+PREFIX = "botlibrary_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+API_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets, labels=()):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self.series = {}    # label values -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self.series.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                total += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + (bound,))} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {round(series[-1], 6)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {total}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, values)} {value}" for values, value in sorted(self.values.items())]
+        return lines
+
+class Gauge:
+    def __init__(self, name: str, help_text: str):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.value = 0
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+handler_seconds = Histogram("handler_seconds", "Time spent in a handler callback.", LATENCY_BUCKETS, ["handler"])
+handler_errors = Counter("handler_errors_total", "Handler callbacks that raised.", ["handler"])
+update_db_queries = Histogram("update_db_queries", "SQL statements per update.", QUERY_BUCKETS, ["handler"])
+update_db_seconds = Histogram("update_db_seconds", "Time in SQL statements per update.", LATENCY_BUCKETS, ["handler"])
+db_query_seconds = Histogram("db_query_seconds", "SQL statement execution time.", LATENCY_BUCKETS)
+bot_api_seconds = Histogram("bot_api_seconds", "Bot API request time by method.", API_BUCKETS, ["method"])
+bot_api_errors = Counter("bot_api_errors_total", "Failed Bot API requests by method and HTTP code.", ["method", "code"])
+updates_in_flight = Gauge("updates_in_flight", "Updates admitted by the update processor (running or waiting).")
+updates_running = Gauge("updates_running", "Updates being handled right now.")
+
+METRICS = (handler_seconds, handler_errors, update_db_queries, update_db_seconds, db_query_seconds,
+           bot_api_seconds, bot_api_errors, updates_in_flight, updates_running)
+
+def render() -> str:
+    return "".join(line + "\n" for metric in METRICS for line in metric.render())
+
+# --- per update ---
+
+class _UpdateStats:
+    __slots__ = ("handler", "queries", "db_seconds")
+
+    def __init__(self):
+        self.handler = "unhandled"
+        self.queries = 0
+        self.db_seconds = 0.0
+
+_current = contextvars.ContextVar("update_stats", default=None)
+
+@contextlib.contextmanager
+def track_update():
+    """Wraps the handling of one update (see services/update_processor.py)."""
+    stats = _UpdateStats()
+    token = _current.set(stats)
+    updates_running.value += 1
+    try:
+        yield stats
+    finally:
+        updates_running.value -= 1
+        _current.reset(token)
+        update_db_queries.observe(stats.queries, stats.handler)
+        update_db_seconds.observe(stats.db_seconds, stats.handler)
+
+def current_update():
+    """Stats of the update this task is handling (.handler, .queries, .db_seconds), or None."""
+    return _current.get()
+
+# --- handlers ---
+
+def timed(callback, name: str = None):
+    name = name or getattr(callback, "__name__", type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        stats = _current.get()
+        if stats is not None:
+            stats.handler = name
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, name)
+    wrapper.timed = True
+    return wrapper
+
+def instrument_handlers(application):
+    """Times every registered handler's callback, including those inside conversations.
+    Call after all handlers are added."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument(handler)
+
+def _instrument(handler):
+    if isinstance(handler, ConversationHandler):
+        for inner in handler.entry_points + handler.fallbacks:
+            _instrument(inner)
+        for state_handlers in handler.states.values():
+            for inner in state_handlers:
+                _instrument(inner)
+        return
+    if not getattr(handler.callback, "timed", False):
+        handler.callback = timed(handler.callback)
+
+# --- database ---
+
+def instrument_engine(engine):
+    """Counts and times every statement on `engine` (the async engine's sync_engine works too)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _finished(conn)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            _finished(context.connection)
+
+def _finished(conn):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    db_query_seconds.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+# --- Bot API ---
+
+async def timed_api_call(api_method: str, request):
+    """Awaits `request` (a do_request coroutine returning (code, payload)) and records it."""
+    start = time.perf_counter()
+    try:
+        code, payload = await request
+    except Exception:
+        bot_api_errors.inc(api_method, "network")
+        raise
+    finally:
+        bot_api_seconds.observe(time.perf_counter() - start, api_method)
+    if not 200 <= code <= 299:
+        bot_api_errors.inc(api_method, str(code))
+    return code, payload
@@ -0,0 +1,159 @@
+"""Near-duplicate detection over bot descriptions + features (MinHash / LSH).
+
+Each document (approved bot or pending submission) is reduced to the set of
+its word pairs ("music player", "player for", ...) and summarized by a
+one-permutation MinHash: every shingle is hashed once, the hash's top bits pick
+one of BINS bins and each bin keeps its smallest value. Shingles are hashed with
+Python's hash(), which is salted per process; that's fine because signatures
+are rebuilt at startup and never leave the process. Empty bins borrow from
+the next non-empty one (rotation densification). The share of equal bins of
+two signatures estimates the Jaccard similarity of their shingle sets.
+
+For lookup the signature is cut into BANDS bands of BAND_ROWS values. Documents
+sharing any whole band are candidates for each other, so a query only compares
+against a handful of candidates whatever the catalog size. With 8 bands of 4,
+pairs at Jaccard 0.8 collide with ~98% probability, pairs at 0.3 with ~6%.
+
+Keys are bot_id for approved bots and -submission_id for pending submissions.
+"""
+import bisect
+from array import array
+from sqlalchemy import select
+from database import AsyncSessionLocal, BotSubmission
+from services.inline_index import _words
+
+BINS = 32
+BAND_ROWS = 4
+BANDS = BINS // BAND_ROWS
+_BIN_SHIFT = 27                     # 32-bit hash: top 5 bits pick the bin
+_VALUE_MASK = (1 << _BIN_SHIFT) - 1
+
+def bot_key(bot_id: int) -> int:
+    return bot_id
+
+def submission_key(submission_id: int) -> int:
+    return -submission_id
+
+def shingles(description: str, features: str) -> set:
+    """Hashes of the document's word pairs (single words if it has only one)."""
+    words = _words(f"{description or ''} {features or ''}")
+    if len(words) < 2:
+        return {hash(w) for w in words}
+    return {hash(pair) for pair in zip(words, words[1:])}
+
+def signature(description: str, features: str):
+    """array('I') of BINS values, or None for a document without words."""
+    empty = 1 << 32
+    mins = [empty] * BINS
+    for shingle in shingles(description, features):
+        h = shingle & 0xFFFFFFFF
+        b = h >> _BIN_SHIFT
+        v = h & _VALUE_MASK
+        if v < mins[b]:
+            mins[b] = v
+    if mins.count(empty) == BINS:
+        return None
+
+    # Rotation: an empty bin takes the next non-empty bin's value (circularly), offset
+    # by the distance so it can't be mistaken for a value that really hashed there
+    filled = list(mins)
+    for i in range(BINS):
+        if mins[i] == empty:
+            d = 1
+            while mins[(i + d) % BINS] == empty:
+                d += 1
+            filled[i] = mins[(i + d) % BINS] + (d << _BIN_SHIFT)
+    return array("I", filled)
+
+_BAND_BYTES = BAND_ROWS * array("I").itemsize
+
+def _band_keys(sig):
+    raw = sig.tobytes()
+    return [hash(raw[i:i + _BAND_BYTES]) + band for band, i in enumerate(range(0, len(raw), _BAND_BYTES))]
+
+def similarity(a, b) -> float:
+    return sum(x == y for x, y in zip(a, b)) / BINS
+
+class NearDuplicateIndex:
+    """Signatures by key, plus per band two parallel arrays sorted by band hash:
+    (band hash, key). ~16 bytes per document per band instead of a dict entry
+    and an int object each; an insert or removal is a memmove, which is fine at
+    the rate bots are approved."""
+
+    def __init__(self):
+        self.signatures = {}    # key -> signature
+        self.hashes = [array("q") for _ in range(BANDS)]
+        self.keys = [array("q") for _ in range(BANDS)]
+        self.ready = False
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, key: int, description: str, features: str):
+        self.remove(key)
+        sig = signature(description, features)
+        if sig is None:
+            return
+        self.signatures[key] = sig
+        for band, band_key in enumerate(_band_keys(sig)):
+            i = bisect.bisect_right(self.hashes[band], band_key)
+            self.hashes[band].insert(i, band_key)
+            self.keys[band].insert(i, key)
+
+    def remove(self, key: int):
+        sig = self.signatures.pop(key, None)
+        if sig is None:
+            return
+        for band, band_key in enumerate(_band_keys(sig)):
+            hashes, keys = self.hashes[band], self.keys[band]
+            i = bisect.bisect_left(hashes, band_key)
+            while i < len(hashes) and hashes[i] == band_key:
+                if keys[i] == key:
+                    del hashes[i]
+                    del keys[i]
+                    break
+                i += 1
+
+    def similar(self, description: str, features: str, threshold: float, limit: int, exclude: int = None):
+        """[(key, estimated Jaccard)] of the closest documents at or above threshold, best first."""
+        sig = signature(description, features)
+        if sig is None:
+            return []
+        candidates = set()
+        for band, band_key in enumerate(_band_keys(sig)):
+            hashes, keys = self.hashes[band], self.keys[band]
+            i = bisect.bisect_left(hashes, band_key)
+            while i < len(hashes) and hashes[i] == band_key:
+                candidates.add(keys[i])
+                i += 1
+        candidates.discard(exclude)
+
+        scored = [(similarity(sig, self.signatures[key]), key) for key in candidates]
+        scored = [(key, score) for score, key in sorted(scored, reverse=True) if score >= threshold]
+        return scored[:limit]
+
+    async def load(self, bots):
+        """Indexes `bots` (the catalog's records) and the pending submissions."""
+        signatures = {bot_key(bot.bot_id): signature(bot.description, bot.features) for bot in bots}
+        async with AsyncSessionLocal() as session:
+            subs = await session.stream(
+                select(BotSubmission.id, BotSubmission.description, BotSubmission.features)
+                .where(BotSubmission.status == "pending")
+                .execution_options(yield_per=5000)
+            )
+            async for sub_id, description, features in subs:
+                signatures[submission_key(sub_id)] = signature(description, features)
+
+        # One sort per band instead of an insert per document
+        self.signatures = {key: sig for key, sig in signatures.items() if sig is not None}
+        entries = [[] for _ in range(BANDS)]
+        for key, sig in self.signatures.items():
+            for band, band_key in enumerate(_band_keys(sig)):
+                entries[band].append((band_key, key))
+        for band, pairs in enumerate(entries):
+            pairs.sort()
+            self.hashes[band] = array("q", (h for h, _ in pairs))
+            self.keys[band] = array("q", (k for _, k in pairs))
+        self.ready = True
+
+near_duplicates = NearDuplicateIndex()
@@ -0,0 +1,233 @@
+"""Scheduler for outbound Bot API calls.
+
+OutboundRequest is the bot's request layer. Calls that put something in a chat
+(send*, edit*, copy*, forward*) wait for a slot by lane priority, paced to the
+OUTBOUND_* global and per-chat limits; a 429 pauses the chat (or the whole bot)
+and the call is queued again. Everything else goes straight out.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import time
+from collections import OrderedDict, deque
+from telegram.request import BaseRequest, HTTPXRequest
+from services.metrics import timed_api_call
+import config
+
+INTERACTIVE = "interactive"       # replies and edits in the user's chat (the default)
+CHANNEL = "channel"               # posts and rating edits in CHANNEL_ID
+NOTIFICATIONS = "notifications"   # staff group messages, DMs to submitters
+BULK = "bulk"                     # /broadcast: gets what the others leave over
+LANES = (INTERACTIVE, CHANNEL, NOTIFICATIONS, BULK)   # priority order
+
+_SCHEDULED = ("send", "edit", "copy", "forward")
+_PRUNE_EVERY = 1000
+
+_lane = contextvars.ContextVar("outbound_lane", default=None)
+
+@contextlib.contextmanager
+def lane(name: str):
+    """Calls made inside the block (in this task) use lane `name`."""
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def _chat_id(value):
+    """Chat ids arrive as ints or, from config, as numeric strings."""
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+def _is_private(chat) -> bool:
+    return isinstance(chat, int) and chat > 0
+
+def classify(method: str, chat) -> str:
+    if chat is not None and chat == _chat_id(config.CHANNEL_ID):
+        return CHANNEL
+    if chat == config.STAFF_GROUP_ID and not method.startswith("edit"):
+        return NOTIFICATIONS    # edits there are mods pressing buttons
+    return INTERACTIVE
+
+class OutboundScheduler:
+    """Grants send slots by lane priority under the global and per-chat limits.
+
+    Limits are kept as GCRA (the "virtual scheduling" form of a token bucket):
+    each chat has the time its bucket would next be full, `tat`, and may send
+    once now >= tat - (burst - 1) * interval. A chat at rest needs no entry.
+    """
+
+    def __init__(self, global_rate: float, private_rate: float, group_per_minute: float, burst: int):
+        self.global_interval = 1 / global_rate
+        self.private = (1 / private_rate, (burst - 1) / private_rate)    # interval, tolerance
+        self.group = (60 / group_per_minute, (burst - 1) * 60 / group_per_minute)
+        self.global_tat = 0.0
+        self.chat_tat = {}          # chat_id -> tat
+        self.queues = {name: OrderedDict() for name in LANES}   # lane -> chat -> deque of futures
+        self.depth = dict.fromkeys(LANES, 0)
+        self.granted = dict.fromkeys(LANES, 0)
+        self.wait_seconds = dict.fromkeys(LANES, 0.0)
+        self.max_wait = dict.fromkeys(LANES, 0.0)   # since the last stats() call
+        self.retry_afters = 0
+        self.wakeup = asyncio.Event()
+        self._task = None
+        self._since_prune = 0
+
+    async def acquire(self, lane_name: str, chat):
+        future = asyncio.get_running_loop().create_future()
+        self.queues[lane_name].setdefault(chat, deque()).append(future)
+        self.depth[lane_name] += 1
+        queued = time.monotonic()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self.wakeup.set()
+
+        await future    # cancelled waiters are dropped by _pick
+        waited = time.monotonic() - queued
+        self.granted[lane_name] += 1
+        self.wait_seconds[lane_name] += waited
+        self.max_wait[lane_name] = max(self.max_wait[lane_name], waited)
+
+    def pause(self, chat, seconds: float):
+        """Telegram answered 429 with retry_after=`seconds` for `chat`."""
+        now = time.monotonic()
+        self.retry_afters += 1
+        if chat is not None:
+            _, tolerance = self._limits(chat)
+            # Nothing accrues while paused, so there's no burst when it lifts
+            self.chat_tat[chat] = max(self.chat_tat.get(chat, 0.0), now + seconds + tolerance)
+        if chat is None or _is_private(chat):
+            self.global_tat = max(self.global_tat, now + seconds)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _limits(self, chat):
+        return self.private if _is_private(chat) else self.group
+
+    def _ready_at(self, chat) -> float:
+        if chat is None:
+            return 0.0
+        _, tolerance = self._limits(chat)
+        return self.chat_tat.get(chat, 0.0) - tolerance
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if self.global_tat > now:
+                await asyncio.sleep(self.global_tat - now)
+                continue
+            picked, next_ready = self._pick(now)
+            if picked is None:
+                # Nothing can go yet: sleep until a chat frees up or a request arrives
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), None if next_ready is None else next_ready - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            chat, future = picked
+            self.global_tat = max(self.global_tat, now) + self.global_interval
+            if chat is not None:
+                interval, _ = self._limits(chat)
+                self.chat_tat[chat] = max(self.chat_tat.get(chat, 0.0), now) + interval
+            future.set_result(None)
+            self._prune(now)
+
+    def _pick(self, now: float):
+        """((chat, future), None) for the next request allowed to go, or (None, when one may)."""
+        next_ready = None
+        for name in LANES:
+            chats = self.queues[name]
+            for chat in list(chats):
+                waiters = chats[chat]
+                while waiters and waiters[0].done():
+                    waiters.popleft()
+                    self.depth[name] -= 1
+                if not waiters:
+                    del chats[chat]
+                    continue
+                ready = self._ready_at(chat)
+                if ready <= now:
+                    future = waiters.popleft()
+                    self.depth[name] -= 1
+                    if waiters:
+                        chats.move_to_end(chat)     # round robin between chats
+                    else:
+                        del chats[chat]
+                    return (chat, future), None
+                next_ready = ready if next_ready is None else min(next_ready, ready)
+        return None, next_ready
+
+    def _prune(self, now: float):
+        # Chats whose bucket is full again behave exactly like chats without an entry
+        self._since_prune += 1
+        if self._since_prune >= _PRUNE_EVERY:
+            self._since_prune = 0
+            self.chat_tat = {chat: tat for chat, tat in self.chat_tat.items() if tat > now}
+
+    def stats(self) -> dict:
+        stats = {"retry_after_total": self.retry_afters, "tracked_chats": len(self.chat_tat)}
+        for name in LANES:
+            stats[f"{name}_queued"] = self.depth[name]
+            stats[f"{name}_sent_total"] = self.granted[name]
+            stats[f"{name}_wait_seconds_total"] = round(self.wait_seconds[name], 3)
+            stats[f"{name}_max_wait_seconds"] = round(self.max_wait[name], 3)
+            self.max_wait[name] = 0.0
+        return stats
+
+def _retry_after(payload: bytes):
+    try:
+        return float(json.loads(payload)["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+class OutboundRequest(BaseRequest):
+    """HTTPXRequest with the scheduler in front of it."""
+
+    def __init__(self, scheduler: OutboundScheduler, **kwargs):
+        self.scheduler = scheduler
+        self.http = HTTPXRequest(**kwargs)
+
+    @property
+    def read_timeout(self):
+        return self.http.read_timeout
+
+    async def initialize(self):
+        await self.http.initialize()
+
+    async def shutdown(self):
+        await self.http.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        timeouts = dict(read_timeout=read_timeout, write_timeout=write_timeout,
+                        connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+        api_method = url.rsplit("/", 1)[-1]
+        if not api_method.startswith(_SCHEDULED):
+            return await timed_api_call(api_method, self.http.do_request(url, method, request_data, **timeouts))
+
+        chat = _chat_id(request_data.parameters.get("chat_id")) if request_data else None
+        lane_name = _lane.get() or classify(api_method, chat)
+        for attempt in range(config.OUTBOUND_RETRIES + 1):
+            await self.scheduler.acquire(lane_name, chat)
+            code, payload = await timed_api_call(api_method, self.http.do_request(url, method, request_data, **timeouts))
+            if code != 429:
+                break
+            retry_after = _retry_after(payload)
+            if retry_after is None:
+                break
+            self.scheduler.pause(chat, retry_after)
+            if retry_after > config.OUTBOUND_MAX_RETRY_AFTER:
+                break
+        return code, payload
+
+outbound_scheduler = OutboundScheduler(config.OUTBOUND_GLOBAL_RATE, config.OUTBOUND_PRIVATE_RATE,
+                                       config.OUTBOUND_GROUP_PER_MINUTE, config.OUTBOUND_CHAT_BURST)
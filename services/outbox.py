@@ -0,0 +1,189 @@
+"""Transactional outbox for the Telegram side effects of moderation.
+
+Handlers add() a row in the same transaction as the decision; OutboxWorker
+claims due rows with a lease, delivers them (at least once) and retries
+failures with backoff until MAX_ATTEMPTS parks them.
+"""
+import asyncio
+import datetime
+import html
+from sqlalchemy import select, update, delete
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from database import AsyncSessionLocal, Bot, OutboxMessage
+from handlers.utils import channel_post_text, rating_keyboard, retry_seconds
+from services import catalog_events, outbound
+import config
+
+BOT_APPROVED = "bot_approved"
+MESSAGE = "message"
+
+LEASE = datetime.timedelta(minutes=2)
+MAX_ATTEMPTS = 8
+BATCH_SIZE = 50
+
+def add(session, kind: str, payload: dict):
+    """Queues a side effect inside the caller's transaction (caller commits, then wake()s the worker)."""
+    session.add(OutboxMessage(kind=kind, payload=payload))
+
+def backoff(attempts: int) -> datetime.timedelta:
+    # 10s, 20s, 40s ... capped at an hour
+    return datetime.timedelta(seconds=min(3600, 5 * 2 ** attempts))
+
+def post_link(message_id: int):
+    """Link to a post in CHANNEL_ID, for "@name" or "-100..." ids."""
+    channel = str(config.CHANNEL_ID or "")
+    if channel.startswith("@"):
+        return f"https://t.me/{channel[1:]}/{message_id}"
+    if channel.startswith("-100"):
+        return f"https://t.me/c/{channel[4:]}/{message_id}"
+    return None
+
+class OutboxWorker:
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self.bot = None
+        self.delivered = 0
+        self.retried = 0
+        self.parked = 0
+        self.wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self, bot):
+        self.bot = bot
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """Rows were just committed: deliver now rather than at the next poll."""
+        self.wakeup.set()
+
+    async def stop(self):
+        # Anything undelivered stays in the table for the next start
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                while await self.deliver_due():
+                    pass
+            except Exception as e:
+                print(f"Outbox delivery failed: {e}")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def deliver_due(self) -> int:
+        """Delivers up to BATCH_SIZE due rows; returns how many were due."""
+        async with AsyncSessionLocal() as session:
+            ids = (await session.scalars(
+                select(OutboxMessage.id)
+                .where(OutboxMessage.next_attempt_at <= datetime.datetime.utcnow())
+                .order_by(OutboxMessage.next_attempt_at)
+                .limit(BATCH_SIZE)
+            )).all()
+        for message_id in ids:
+            await self._deliver(message_id)
+        return len(ids)
+
+    async def _deliver(self, message_id: int):
+        now = datetime.datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message_id, OutboxMessage.next_attempt_at <= now)
+                .values(next_attempt_at=now + LEASE, attempts=OutboxMessage.attempts + 1)
+                .returning(OutboxMessage.kind, OutboxMessage.payload, OutboxMessage.attempts)
+            )).first()
+            await session.commit()
+        if row is None:
+            return # another worker has it
+
+        try:
+            if row.kind == BOT_APPROVED:
+                await self._bot_approved(row.payload["bot_id"])
+            elif row.kind == MESSAGE:
+                await self._message(row.payload["chat_id"], row.payload["text"])
+            else:
+                raise ValueError(f"unknown outbox kind {row.kind!r}")
+        except Exception as e:
+            wait = backoff(row.attempts)
+            if isinstance(e, RetryAfter):
+                wait = max(wait, datetime.timedelta(seconds=retry_seconds(e)))
+            parked = row.attempts >= MAX_ATTEMPTS
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(OutboxMessage).where(OutboxMessage.id == message_id).values(
+                        next_attempt_at=None if parked else datetime.datetime.utcnow() + wait,
+                        last_error=str(e)[:500],
+                    )
+                )
+                await session.commit()
+            if parked:
+                self.parked += 1
+                print(f"Outbox #{message_id} ({row.kind}) gave up after {row.attempts} attempts: {e}")
+            else:
+                self.retried += 1
+                print(f"Outbox #{message_id} ({row.kind}) failed, retrying in {wait.total_seconds():.0f}s: {e}")
+            return
+
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(OutboxMessage).where(OutboxMessage.id == message_id))
+            await session.commit()
+        self.delivered += 1
+
+    async def _bot_approved(self, bot_id: int):
+        async with AsyncSessionLocal() as session:
+            bot = await session.get(Bot, bot_id)
+        if bot is None:
+            return # deleted since
+
+        link = post_link(bot.channel_message_id) if bot.channel_message_id else None
+        if config.CHANNEL_ID and not bot.channel_message_id:
+            msg = await self.bot.send_message(
+                chat_id=config.CHANNEL_ID,
+                text=channel_post_text(bot),
+                reply_markup=rating_keyboard(bot.bot_id),
+                parse_mode="HTML"
+            )
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    update(Bot).where(Bot.bot_id == bot_id).values(channel_message_id=msg.message_id)
+                )
+                await session.commit()
+            if not result.rowcount:
+                return # deleted while the post was sent: adding it back would resurrect it
+            bot.channel_message_id = msg.message_id
+            await catalog_events.bot_added(bot) # refresh so inline results link to the post
+            link = msg.link or post_link(msg.message_id)
+
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🔗 View Post", url=link)]]) if link else None
+        await self._message(
+            bot.submitted_by,
+            f"🎉 <b>Congratulations!</b>\n\nYour bot <b>{html.escape(bot.username)}</b> has been approved and posted to the library!",
+            keyboard,
+        )
+
+    async def _message(self, chat_id: int, text: str, reply_markup=None):
+        if not chat_id:
+            return
+        try:
+            with outbound.lane(outbound.NOTIFICATIONS):
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML", reply_markup=reply_markup)
+        except Forbidden:
+            pass # blocked the bot; nothing to retry
+        except BadRequest as e:
+            if "chat not found" not in str(e).lower():
+                raise
+
+    def stats(self) -> dict:
+        return {"delivered_total": self.delivered, "retried_total": self.retried, "parked_total": self.parked}
+
+outbox_worker = OutboxWorker(config.OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,112 @@
+"""Who is staff, without a DB round trip per check.
+
+Roles live in users.role; this keeps {user_id: role} for everyone above "user",
+loaded at startup. /addsudo, /addmod, /removesudo and /removemod call
+role_changed() after their commit: it applies the change here and, on Postgres,
+NOTIFYs every other worker, which LISTENs on a dedicated connection. A periodic
+reload covers what NOTIFY can't (SQLite, PgBouncer transaction pooling, a
+dropped listener connection).
+
+SUDO_USERS / OWNER_ID from the environment are sudo regardless of the table.
+"""
+import asyncio
+from sqlalchemy import select, text
+from database import AsyncSessionLocal, IS_POSTGRES, async_engine, User
+import config
+CHANNEL = "role_changes"
+
+STAFF_ROLES = ("owner", "sudo", "mod")
+SUDO_ROLES = ("owner", "sudo")
+
+class RoleCache:
+    def __init__(self, reload_interval: float):
+        self.reload_interval = reload_interval
+        self.roles = {}     # user_id -> role, only for staff
+        self._task = None
+        self._listen_conn = None
+
+    def role(self, user_id: int) -> str:
+        if user_id == config.OWNER_ID:
+            return "owner"
+        if user_id in config.SUDO_USERS:
+            return "sudo"
+        return self.roles.get(user_id, "user")
+
+    def is_sudo(self, user_id: int) -> bool:
+        return self.role(user_id) in SUDO_ROLES
+
+    def is_staff(self, user_id: int) -> bool:
+        return self.role(user_id) in STAFF_ROLES
+
+    async def load(self):
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(User.user_id, User.role).where(User.role.in_(STAFF_ROLES))
+            )).all()
+        self.roles = {user_id: role for user_id, role in rows}
+
+    async def role_changed(self, user_id: int, role: str):
+        """Call after the users.role change is committed."""
+        self._apply(user_id, role)
+        if IS_POSTGRES:
+            async with async_engine.connect() as conn:
+                await conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                   {"channel": CHANNEL, "payload": f"{user_id}:{role}"})
+                await conn.commit()
+
+    def _apply(self, user_id: int, role: str):
+        if role in STAFF_ROLES:
+            self.roles[user_id] = role
+        else:
+            self.roles.pop(user_id, None)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        user_id, role = payload.split(":", 1)
+        self._apply(int(user_id), role)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._close_listener()
+
+    async def _run(self):
+        while True:
+            if IS_POSTGRES and not config.DB_PGBOUNCER:
+                try:
+                    await self._ensure_listener()
+                except Exception as e:
+                    print(f"Role change listener unavailable, relying on reloads: {e}")
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"Failed to reload roles: {e}")
+
+    async def _ensure_listener(self):
+        if self._listen_conn is not None:
+            raw = (await self._listen_conn.get_raw_connection()).driver_connection
+            if not raw.is_closed():
+                return
+            await self._close_listener()
+            await self.load()   # changes may have been missed while it was down
+
+        self._listen_conn = await async_engine.connect()
+        raw = (await self._listen_conn.get_raw_connection()).driver_connection
+        await raw.add_listener(CHANNEL, self._on_notify)
+
+    async def _close_listener(self):
+        if self._listen_conn is not None:
+            conn, self._listen_conn = self._listen_conn, None
+            try:
+                await conn.invalidate()   # the LISTEN session shouldn't go back into the pool
+                await conn.close()
+            except Exception:
+                pass
+
+roles = RoleCache(config.ROLE_RELOAD_INTERVAL)
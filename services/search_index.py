@@ -0,0 +1,50 @@
+"""Full-text index over approved bots, as created by migration 3.
+
+Postgres: a weighted `search_vector` tsvector column on `bots` behind a GIN index;
+SQLite: an FTS5 table `bots_fts`. Searches are served by services/inline_index.py
+now, and migration 8 drops both.
+"""
+from sqlalchemy import text
+from database import IS_POSTGRES
+
+# Usernames are indexed twice, with and without underscores, so "pokebot" finds "@poke_bot"
+_PG_VECTOR = (
+    "setweight(to_tsvector('simple', unaccent(coalesce(username, '') || ' ' || replace(coalesce(username, ''), '_', ''))), 'A') || "
+    "setweight(to_tsvector('simple', unaccent(coalesce(description, ''))), 'B') || "
+    "setweight(to_tsvector('simple', unaccent(coalesce(features, ''))), 'C')"
+)
+
+def setup_search_index(conn):
+    """Creates the search column/table and its index, then indexes any bot that isn't yet.
+
+    Migration step 3, run on an autocommit connection (see migrations.py) so the
+    GIN index can be built CONCURRENTLY and a missing unaccent grant doesn't abort the rest.
+    """
+    if IS_POSTGRES:
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        except Exception as e:
+            print(f"Could not enable 'unaccent' (run enable_unaccent.py as a superuser): {e}")
+
+        conn.execute(text("ALTER TABLE bots ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+        index_missing(conn)
+        conn.execute(text("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_bots_search_vector ON bots USING GIN (search_vector)"))
+    else:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS bots_fts USING fts5("
+            "username, description, features, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        index_missing(conn)
+
+def index_missing(conn):
+    """Indexes every bot that isn't yet, in one set-based statement (sync Connection)."""
+    if IS_POSTGRES:
+        conn.execute(text(f"UPDATE bots SET search_vector = {_PG_VECTOR} WHERE search_vector IS NULL"))
+    else:
+        # Username with and without underscores, as on Postgres
+        conn.execute(text(
+            "INSERT INTO bots_fts (rowid, username, description, features) "
+            "SELECT bot_id, coalesce(username, '') || ' ' || replace(coalesce(username, ''), '_', ''), "
+            "coalesce(description, ''), coalesce(features, '') FROM bots "
+            "WHERE bot_id NOT IN (SELECT rowid FROM bots_fts)"
+        ))
@@ -0,0 +1,182 @@
+"""Opt-in recording of incoming updates, anonymized, for bench/replay.py.
+
+With UPDATE_LOG set, admitted updates are appended to that file as gzipped JSON
+lines by a background task. User ids become keyed pseudonyms, and names and
+free text are dropped, and so are command arguments, except that user ids
+among them become pseudonyms too. Inline queries, callback data and command
+names are kept.
+"""
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+from collections import deque
+import config
+
+FORMAT = "botlibrary-updates"     # bench/replay.py checks these
+VERSION = 1
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 10_000
+PSEUDONYM_BASE = 10 ** 12     # well above real Telegram ids, so the two never collide
+
+_DROPPED_KEYS = {"contact", "location", "venue", "poll", "dice", "game", "invoice", "successful_payment",
+                 "passport_data", "phone_number", "bio", "first_name", "last_name", "language_code",
+                 "title", "username", "active_usernames", "photo_url"}
+_HASHED_KEYS = {"file_id", "file_unique_id", "chat_instance"}
+_TEXT_KEYS = {"text", "caption"}
+_BOT_USERNAME = re.compile(r"^@\w{3,32}$")
+_CHAT_TYPES = {"private", "group", "supergroup", "channel"}
+
+class Anonymizer:
+    def __init__(self, salt: bytes):
+        self.salt = salt
+
+    def pseudonym(self, user_id: int) -> int:
+        digest = hmac.new(self.salt, str(user_id).encode(), hashlib.sha256).digest()
+        return PSEUDONYM_BASE + int.from_bytes(digest[:5], "big")
+
+    def _hash(self, value) -> str:
+        return hmac.new(self.salt, str(value).encode(), hashlib.sha256).hexdigest()[:24]
+
+    def __call__(self, value):
+        if isinstance(value, list):
+            return [self(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        is_user = "is_bot" in value
+        is_private = value.get("type") == "private"
+        out = {}
+        for key, item in value.items():
+            if key in _DROPPED_KEYS:
+                continue
+            if key in _HASHED_KEYS:
+                out[key] = self._hash(item)
+            elif key in _TEXT_KEYS and isinstance(item, str):
+                out[key] = self._filler(item)
+            elif key == "id" and (is_private or is_user and not value.get("is_bot")):
+                out[key] = self.pseudonym(item)
+            else:
+                out[key] = self(item)
+
+        # Handlers read these, so anonymized objects keep a placeholder
+        if is_user and not value.get("is_bot"):
+            out["first_name"] = "User"
+            out["username"] = f"u{out['id']}"
+        elif is_user:
+            out.update({key: value[key] for key in ("first_name", "username") if key in value})
+        elif is_private:
+            out["first_name"] = "User"
+        elif value.get("type") in _CHAT_TYPES:
+            out["title"] = "Chat"
+        if isinstance(value.get("text"), str) and "entities" in out:
+            # Offsets into text that's gone; only a command's own bot_command entity survives
+            kept = _command_length(value["text"])
+            out["entities"] = [e for e in out["entities"] if e.get("offset", 0) + e.get("length", 0) <= kept]
+            if not out["entities"]:
+                del out["entities"]
+        if "caption" in value:
+            out.pop("caption_entities", None)
+        return out
+
+    def _filler(self, text: str) -> str:
+        if _BOT_USERNAME.match(text):
+            return text
+        # Replay routes on the command, so it stays; its arguments (/addsudo <id>,
+        # /broadcast <text>, /start payloads) go like any other text
+        kept = _command_length(text)
+        if not kept:
+            return re.sub(r"\S", "x", text)
+        return text[:kept] + re.sub(r"\S+", self._argument, text[kept:])
+
+    def _argument(self, match) -> str:
+        arg = match.group()
+        if arg.isascii() and arg.isdigit():
+            return str(self.pseudonym(int(arg)))   # a user id, as it appears everywhere else
+        if _BOT_USERNAME.match(arg) and arg.lower().endswith("bot"):
+            return arg   # /delete @some_bot; people's @handles go
+        return "x" * len(arg)
+
+def _command_length(text: str) -> int:
+    """Length of the leading "/command" (or "/command@bot") in text, 0 if there's none."""
+    return len(text.split(maxsplit=1)[0]) if text.startswith("/") else 0
+
+class UpdateRecorder:
+    def __init__(self, path: str, sample: float, salt: str):
+        self.path = path
+        self.sample = sample
+        self.anonymize = Anonymizer(salt.encode() if salt else os.urandom(32))
+        self.pending = deque()      # (arrival time, Update)
+        self.written = 0
+        self.dropped = 0
+        self.header_written = False
+        self._task = None
+
+    def record(self, update):
+        """Called by the update processor for every admitted update."""
+        user = update.effective_user
+        if user and self.sample < 1 and self._bucket(user.id) >= self.sample:
+            return
+        if len(self.pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self.pending.append((time.time(), update))
+
+    def _bucket(self, user_id: int) -> float:
+        return (self.anonymize.pseudonym(user_id) % 10_000) / 10_000
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Update log write failed: {e}")
+
+    async def flush(self):
+        from services.roles import roles
+        lines = []
+        while self.pending:
+            arrived, update = self.pending.popleft()
+            record = {"t": round(arrived, 3), "update": self.anonymize(update.to_dict())}
+            user = update.effective_user
+            if user and roles.is_staff(user.id):
+                record["role"] = roles.role(user.id)
+            lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if lines:
+            count = len(lines)
+            await asyncio.to_thread(self._write, lines)
+            self.written += count
+
+    def _write(self, lines: list):
+        if not self.header_written:
+            header = {"format": FORMAT, "version": VERSION, "started": time.time(),
+                      "channel_id": config.CHANNEL_ID, "staff_group_id": config.STAFF_GROUP_ID,
+                      "sample": self.sample}
+            lines.insert(0, json.dumps({"header": header}) + "\n")
+            self.header_written = True
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def stats(self) -> dict:
+        return {"written_total": self.written, "dropped_total": self.dropped, "pending": len(self.pending)}
+
+update_recorder = UpdateRecorder(config.UPDATE_LOG, config.UPDATE_LOG_SAMPLE,
+                                 config.UPDATE_LOG_SALT) if config.UPDATE_LOG else None
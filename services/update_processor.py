@@ -0,0 +1,73 @@
+"""Concurrent update processing that keeps ordering where it matters.
+
+Up to CONCURRENT_UPDATES updates run at once, but each first takes a lock per
+key it touches (user, rated bot, moderated submission, chat), so updates that
+share a key run one after another in arrival order.
+"""
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from services import metrics
+
+def update_keys(update) -> list:
+    keys = []
+    if not isinstance(update, Update):
+        return keys
+    if update.effective_user:
+        keys.append(("user", update.effective_user.id))
+    elif update.effective_chat:
+        keys.append(("chat", update.effective_chat.id))
+
+    data = update.callback_query.data if update.callback_query else None
+    if data:
+        parts = data.split("_")
+        if parts[0] == "rate" and len(parts) >= 2 and parts[1].isdigit():
+            keys.append(("bot", int(parts[1])))
+        elif parts[0] == "mod" and len(parts) >= 3 and parts[2].isdigit():
+            keys.append(("submission", int(parts[2])))
+    return sorted(keys)   # one lock order for everyone, so shared keys can't deadlock
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int, max_waiting: int = 1000):
+        # PTB's semaphore only bounds admitted updates (running + waiting on a key); this
+        # one, taken after the key locks, bounds running ones, so a user flooding us
+        # queues behind their own lock without holding slots everyone else needs
+        super().__init__(max_concurrent_updates + max_waiting)
+        self.running = asyncio.Semaphore(max_concurrent_updates)
+        self.locks = {}     # key -> [asyncio.Lock, holders + waiters]
+        self.on_update = None   # called with every admitted update (main.py sets the update log's)
+
+    async def do_process_update(self, update, coroutine):
+        entries = []    # locks we're registered on, in order
+        held = 0        # how many of them we've acquired so far
+        started = False
+        metrics.updates_in_flight.value += 1
+        if self.on_update:
+            self.on_update(update)
+        try:
+            for key in update_keys(update):
+                entry = self.locks.setdefault(key, [asyncio.Lock(), 0])
+                entry[1] += 1
+                entries.append((key, entry))
+                await entry[0].acquire()
+                held += 1
+            async with self.running:
+                started = True
+                with metrics.track_update():
+                    await coroutine
+        finally:
+            metrics.updates_in_flight.value -= 1
+            if not started:
+                coroutine.close()   # cancelled while waiting: it never ran
+            for i, (key, (lock, _)) in enumerate(entries):
+                if i < held:
+                    lock.release()
+                self.locks[key][1] -= 1
+                if not self.locks[key][1]:
+                    del self.locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
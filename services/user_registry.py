@@ -0,0 +1,109 @@
+"""Write-behind user registration and last-seen tracking.
+
+touch() only updates memory: ids known to be in the users table are skipped,
+new /start-ers are inserted in batches with ON CONFLICT DO NOTHING, and
+username / last_seen changes are written as a batched UPDATE.
+"""
+import asyncio
+from datetime import datetime
+from sqlalchemy import select, update, bindparam
+from database import AsyncSessionLocal, dialect_insert, User
+from services.cache import TTLCache
+from services import counters
+import config
+
+_UNSEEN = object()
+
+class UserRegistry:
+    def __init__(self, flush_interval: float, seen_interval: float, seen_size: int):
+        self.flush_interval = flush_interval
+        self.known = set()      # user ids present in the users table
+        # user_id -> username as last written; expiry after seen_interval is what lets
+        # the next update write last_seen again
+        self.seen = TTLCache(seen_size, seen_interval)
+        self.new = {}           # user_id -> username, to insert
+        self.updates = {}       # user_id -> (username, last_seen, private)
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        known = set()
+        async with AsyncSessionLocal() as session:
+            result = await session.stream_scalars(select(User.user_id).execution_options(yield_per=10000))
+            async for user_id in result:
+                known.add(user_id)
+        self.known |= known
+
+    def touch(self, user, register: bool = False, private: bool = False):
+        """Records that `user` (a telegram.User) sent us something. register=True for /start."""
+        if register and user.id not in self.known:
+            self.known.add(user.id)
+            self.new[user.id] = user.username
+
+        if self.seen.get(user.id, _UNSEEN) == user.username:
+            return
+        self.seen.set(user.id, user.username)
+        # private=True: they messaged the bot directly, so they haven't blocked it (any more)
+        self.updates[user.id] = (user.username, datetime.utcnow(), private)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # Not halfway through a flush: on SQLite a write cancelled mid-transaction
+            # keeps the database locked, and the flush below would time out
+            async with self._lock:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"User registry flush failed: {e}")
+
+    async def flush(self):
+        async with self._lock:
+            if not self.new and not self.updates:
+                return
+            new, self.new = self.new, {}
+            updates, self.updates = self.updates, {}
+
+            try:
+                async with AsyncSessionLocal() as session:
+                    if new:
+                        now = datetime.utcnow()
+                        # RETURNING only reports the rows actually inserted, which is what the counter wants
+                        inserted = (await session.execute(
+                            dialect_insert(User).on_conflict_do_nothing(index_elements=[User.user_id]).returning(User.user_id),
+                            [{"user_id": uid, "username": name, "role": "user", "join_date": now,
+                              "blocked": False, "last_seen": now} for uid, name in new.items()]
+                        )).all()
+                        await counters.bump(session, {counters.USERS: len(inserted)})
+                    # Core executemany (not ORM bulk UPDATE, which insists every row exists):
+                    # ids that never /start-ed match nothing
+                    users = User.__table__
+                    for private in (True, False):
+                        rows = [{"uid": uid, "username": name, "last_seen": seen}
+                                for uid, (name, seen, was_private) in updates.items() if was_private == private]
+                        if rows:
+                            stmt = update(users).where(users.c.user_id == bindparam("uid")).values(
+                                username=bindparam("username"), last_seen=bindparam("last_seen"))
+                            if private:
+                                stmt = stmt.values(blocked=False)
+                            await session.execute(stmt, rows)
+                    await session.commit()
+            except BaseException:
+                # Newer touches win; what failed goes back in the queue
+                for uid, name in new.items():
+                    self.new.setdefault(uid, name)
+                for uid, row in updates.items():
+                    self.updates.setdefault(uid, row)
+                raise
+
+user_registry = UserRegistry(config.USER_FLUSH_INTERVAL_MS / 1000, config.LAST_SEEN_INTERVAL, config.LAST_SEEN_CACHE_SIZE)
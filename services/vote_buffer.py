@@ -0,0 +1,155 @@
+"""Write-behind buffer for star ratings.
+
+rate_bot only calls add() and answers the click; a background loop writes the
+buffered votes every VOTE_FLUSH_INTERVAL_MS in one transaction, and each bot's
+channel post is edited at most once per CHANNEL_EDIT_WINDOW with whatever the
+aggregate is by then. stop() flushes everything on graceful shutdown.
+"""
+import asyncio
+import time
+from sqlalchemy.exc import DataError, IntegrityError
+from telegram.error import BadRequest, RetryAfter
+from database import AsyncSessionLocal
+from services.votes import record_vote
+from services import catalog_events, counters
+from services.catalog import catalog
+from handlers.utils import channel_post_text, rating_keyboard, retry_seconds
+import config
+
+# A vote the database will never take (an id out of range, say): retrying can't help
+_PERMANENT_ERRORS = (DataError, IntegrityError, OverflowError)
+
+class VoteBuffer:
+    def __init__(self, flush_interval: float, edit_window: float):
+        self.flush_interval = flush_interval
+        self.edit_window = edit_window
+        self.pending = {}       # (bot_id, user_id) -> score; a later click replaces an earlier one
+        self.last_edit = {}     # bot_id -> monotonic time of the last channel edit
+        self.scheduled = {}     # bot_id -> task waiting for the edit window, then editing
+        self.stale = set()      # bot_ids whose rating changed while their edit was on its way
+        self.bot = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def add(self, bot_id: int, user_id: int, score: int):
+        self.pending[(bot_id, user_id)] = score
+
+    def start(self, bot):
+        self.bot = bot
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes buffered votes and pushes outstanding channel edits right away."""
+        if self._task:
+            # Wait out a flush in progress (see UserRegistry.stop)
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        for bot_id, task in list(self.scheduled.items()):
+            task.cancel()
+            await self._edit_post(bot_id)
+        self.scheduled.clear()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Vote flush failed: {e}")
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            try:
+                changed = await self._write(batch)
+            except BaseException:
+                # Put the batch back unless the user has clicked again since (also on
+                # cancellation at shutdown; replaying a vote that did commit is a no-op)
+                for key, score in batch.items():
+                    self.pending.setdefault(key, score)
+                raise
+
+        await catalog_events.ratings_changed({bot_id: (r.rating, r.vote_count) for bot_id, r in changed.items()})
+        for bot_id in changed:
+            self._schedule_edit(bot_id)
+
+    async def _write(self, batch: dict) -> dict:
+        """Writes batch in one transaction; returns {bot_id: VoteResult} for the bots whose
+        rating changed. A vote that fails for good is dropped from batch and the rest written again."""
+        while True:
+            changed, new_votes, key = {}, 0, None
+            try:
+                async with AsyncSessionLocal() as session:
+                    # In key order, so concurrent flushes (other workers) lock bots in the same order
+                    for key, score in sorted(batch.items()):
+                        result = await record_vote(session, key[0], key[1], score)
+                        if result and result.changed:
+                            changed[key[0]] = result
+                            new_votes += result.previous_score is None
+                    key = None
+                    await counters.bump(session, {counters.VOTES: new_votes})
+                    await session.commit()
+                return changed
+            except _PERMANENT_ERRORS as e:
+                if key is None:
+                    raise
+                print(f"Dropped vote {key} -> {batch[key]}: {e}")
+                del batch[key]
+
+    def _schedule_edit(self, bot_id: int):
+        if not self.bot or not config.CHANNEL_ID:
+            return
+        if bot_id in self.scheduled:
+            # One edit per bot at a time, however long the channel lane makes it wait;
+            # if it has already rendered, it's followed by one with the new numbers
+            self.stale.add(bot_id)
+            return
+        wait = self.last_edit.get(bot_id, 0) + self.edit_window - time.monotonic()
+        self.scheduled[bot_id] = asyncio.create_task(self._edit_later(bot_id, max(0, wait)))
+
+    async def _edit_later(self, bot_id: int, wait: float):
+        try:
+            await asyncio.sleep(wait)
+            self.stale.discard(bot_id)  # the edit below renders the latest numbers
+            await self._edit_post(bot_id)
+        finally:
+            self.scheduled.pop(bot_id, None)
+        if bot_id in self.stale:
+            self.stale.discard(bot_id)
+            self._schedule_edit(bot_id)
+
+    async def _edit_post(self, bot_id: int):
+        bot = catalog.get(bot_id)   # already carries this flush's rating
+        if not bot or not bot.channel_message_id:
+            return
+
+        self.last_edit[bot_id] = time.monotonic()
+        try:
+            await self.bot.edit_message_text(
+                chat_id=config.CHANNEL_ID,
+                message_id=bot.channel_message_id,
+                text=channel_post_text(bot),
+                reply_markup=rating_keyboard(bot.bot_id),
+                parse_mode="HTML"
+            )
+        except RetryAfter as e:
+            # Flood control: push this bot's window out and try again
+            self.last_edit[bot_id] = time.monotonic() + retry_seconds(e)
+            self._schedule_edit(bot_id)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                print(f"Rating update failed: {e}")
+        except Exception as e:
+            print(f"Rating update failed: {e}")
+
+# The window is never shorter than the channel lane's spacing, or edits would queue up there
+vote_buffer = VoteBuffer(config.VOTE_FLUSH_INTERVAL_MS / 1000,
+                         max(config.CHANNEL_EDIT_WINDOW, 60 / config.OUTBOUND_GROUP_PER_MINUTE))
@@ -0,0 +1,101 @@
+"""Vote recording against the normalized votes table.
+
+Each vote is one upsert into `votes` plus a delta applied to the bot's running
+score_sum / vote_count / rating, so a click costs O(1) no matter how many votes
+a bot has, and concurrent clicks from different users can't overwrite each other.
+"""
+from typing import NamedTuple, Optional
+from sqlalchemy import text
+from database import IS_POSTGRES
+
+class VoteResult(NamedTuple):
+    changed: bool                  # False if the user re-sent the score they already gave
+    previous_score: Optional[int]  # None for a first vote
+    rating: Optional[float]        # new aggregates (None when unchanged)
+    vote_count: Optional[int]
+
+# Postgres: the bot's row is locked first, in a statement of its own. A FOR UPDATE
+# on the user's vote can't do that job: for a first vote there's no row to lock, so
+# two clicks would both count as new. Once the lock is held, the vote statement's
+# snapshot includes every earlier vote for the bot.
+_PG_LOCK_BOT = text("SELECT 1 FROM bots WHERE bot_id = :bot_id FOR UPDATE")
+
+# Then one statement: the upsert is skipped when the score is the same, and the
+# bots UPDATE applies the delta against the user's previous score.
+_PG_VOTE = text("""
+WITH prev AS (
+    SELECT score FROM votes WHERE bot_id = :bot_id AND user_id = :user_id
+), upsert AS (
+    INSERT INTO votes (bot_id, user_id, score, voted_at)
+    VALUES (:bot_id, :user_id, :score, timezone('utc', now()))
+    ON CONFLICT (bot_id, user_id) DO UPDATE SET score = EXCLUDED.score, voted_at = EXCLUDED.voted_at
+    WHERE votes.score <> EXCLUDED.score
+    RETURNING 1
+), delta AS (
+    SELECT :score - COALESCE((SELECT score FROM prev), 0) AS sum_delta,
+           CASE WHEN EXISTS (SELECT 1 FROM prev) THEN 0 ELSE 1 END AS count_delta
+)
+UPDATE bots SET
+    score_sum = score_sum + delta.sum_delta,
+    vote_count = vote_count + delta.count_delta,
+    rating = ROUND((score_sum + delta.sum_delta)::numeric / NULLIF(vote_count + delta.count_delta, 0), 1)::float
+FROM delta
+WHERE bots.bot_id = :bot_id AND EXISTS (SELECT 1 FROM upsert)
+RETURNING (SELECT score FROM prev) AS previous_score, bots.rating, bots.vote_count
+""")
+
+async def record_vote(session, bot_id: int, user_id: int, score: int) -> Optional[VoteResult]:
+    """Applies one vote inside the caller's transaction (caller commits).
+
+    Returns None if the bot doesn't exist; the caller's other work is kept.
+    """
+    if IS_POSTGRES:
+        # With the bot locked it can't be deleted before the vote is inserted either
+        if not (await session.execute(_PG_LOCK_BOT, {"bot_id": bot_id})).first():
+            return None
+        row = (await session.execute(_PG_VOTE, {"bot_id": bot_id, "user_id": user_id, "score": score})).first()
+        if row:
+            return VoteResult(True, row.previous_score, row.rating, row.vote_count)
+        return VoteResult(False, score, None, None)
+
+    # SQLite has no DML in CTEs; it only has one writer at a time, so the same
+    # steps inside one transaction are just as atomic.
+    previous = (await session.execute(
+        text("SELECT score FROM votes WHERE bot_id = :bot_id AND user_id = :user_id"),
+        {"bot_id": bot_id, "user_id": user_id}
+    )).scalar()
+    if previous == score:
+        return VoteResult(False, score, None, None)
+
+    sum_delta = score - (previous or 0)
+    count_delta = 0 if previous is not None else 1
+    row = (await session.execute(text("""
+        UPDATE bots SET
+            score_sum = score_sum + :sum_delta,
+            vote_count = vote_count + :count_delta,
+            rating = ROUND(CAST(score_sum + :sum_delta AS REAL) / (vote_count + :count_delta), 1)
+        WHERE bot_id = :bot_id
+        RETURNING rating, vote_count
+    """), {"bot_id": bot_id, "sum_delta": sum_delta, "count_delta": count_delta})).first()
+    if not row:
+        return None
+
+    await session.execute(text("""
+        INSERT INTO votes (bot_id, user_id, score, voted_at) VALUES (:bot_id, :user_id, :score, CURRENT_TIMESTAMP)
+        ON CONFLICT (bot_id, user_id) DO UPDATE SET score = excluded.score, voted_at = excluded.voted_at
+    """), {"bot_id": bot_id, "user_id": user_id, "score": score})
+    return VoteResult(True, previous, row.rating, row.vote_count)
+
+def rebuild_aggregates(conn, bots_from: str = None):
+    """Recomputes score_sum / vote_count / rating from the votes table in two set-based
+    UPDATEs (sync Connection). bots_from names a table whose bot_id column limits the
+    rebuild to those bots; all bots otherwise. Used after bulk imports."""
+    where = f"WHERE bot_id IN (SELECT bot_id FROM {bots_from})" if bots_from else ""
+    conn.execute(text(f"""
+        UPDATE bots SET
+            score_sum = COALESCE((SELECT SUM(score) FROM votes WHERE votes.bot_id = bots.bot_id), 0),
+            vote_count = (SELECT COUNT(*) FROM votes WHERE votes.bot_id = bots.bot_id)
+        {where}
+    """))
+    average = "ROUND(score_sum::numeric / vote_count, 1)::float" if IS_POSTGRES else "ROUND(CAST(score_sum AS REAL) / vote_count, 1)"
+    conn.execute(text(f"UPDATE bots SET rating = CASE WHEN vote_count > 0 THEN {average} ELSE 0.0 END {where}"))
@@ -0,0 +1,7 @@
+"""Points the bot at a scratch database before anything imports config:
+TEST_PG_URL when it's set (see test_votes_postgres.py), a throwaway SQLite file otherwise."""
+import os
+import tempfile
+
+os.environ["DB_URL"] = os.environ.get("TEST_PG_URL") or \
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="botlibrary-tests-"), "test.db")
@@ -0,0 +1,54 @@
+"""Result order of services/inline_index.py."""
+from services.catalog import CatalogBot
+from services.inline_index import InlineIndex, WALK_THRESHOLD
+
+def _bot(bot_id, username, rating, description="", features=""):
+    return CatalogBot(bot_id, username, description, features, "Other", rating, 1, None, None)
+
+def _index(bots) -> InlineIndex:
+    index = InlineIndex()
+    index.build(bots)
+    return index
+
+def _names(bots):
+    return [b.username for b in bots]
+
+WEATHER = [
+    _bot(1, "@weather_bot", 2.0),
+    _bot(2, "@news_bot", 4.9, description="News and weather for your city"),
+    _bot(3, "@weatherly_bot", 3.0, features="weather"),
+    _bot(4, "@music_bot", 5.0, features="weather radio"),
+]
+
+def test_username_match_beats_better_rated_description_match():
+    results = _index(WEATHER).matches("weather", 10)
+    assert _names(results) == ["@weather_bot", "@weatherly_bot", "@music_bot", "@news_bot"]
+
+def test_search_puts_the_exact_username_first():
+    assert _names(_index(WEATHER).search("weather_bot"))[0] == "@weather_bot"
+
+def test_rating_breaks_ties_in_relevance():
+    bots = [_bot(1, "@a_bot", 3.0, description="chess"), _bot(2, "@b_bot", 4.0, description="chess"),
+            _bot(3, "@c_bot", 1.0, description="chess")]
+    assert _names(_index(bots).matches("chess", 10)) == ["@b_bot", "@a_bot", "@c_bot"]
+
+def test_prefix_prefers_the_closest_username_then_rating():
+    bots = [_bot(1, "@poke_bot", 1.0), _bot(2, "@pokedex_bot", 5.0), _bot(3, "@pokemon_go_bot", 4.0),
+            _bot(4, "@pokemon_bot", 2.0)]
+    assert _names(_index(bots).prefix("pokemon_bot", 10)) == ["@pokemon_bot"]
+    assert _names(_index(bots).prefix("poke", 10)) == ["@poke_bot", "@pokedex_bot", "@pokemon_bot", "@pokemon_go_bot"]
+
+def test_unspecific_query_still_ranks_username_matches_first():
+    # More matches than WALK_THRESHOLD: the top rated ones are walked, then ranked
+    bots = [_bot(i, f"@filler{i}_bot", 5.0, description="a music player") for i in range(1, WALK_THRESHOLD + 50)]
+    bots.append(_bot(10_000, "@music_bot", 4.9))
+    results = _index(bots).matches("music", 5)
+    assert results[0].username == "@music_bot"
+    assert len(results) == 5
+
+def test_added_and_removed_bots_between_merges():
+    index = _index(WEATHER)
+    index.add(_bot(5, "@weatherman_bot", 1.0))
+    index.remove(1)
+    assert "@weather_bot" not in _names(index.search("weather"))
+    assert _names(index.prefix("weatherm", 10)) == ["@weatherman_bot"]
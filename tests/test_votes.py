@@ -0,0 +1,102 @@
+"""Votes against the scratch database (services/votes.py, services/vote_buffer.py).
+
+SQLite unless TEST_PG_URL is set (see conftest.py); no server needed:
+
+    python -m pytest tests
+"""
+import asyncio
+import uuid
+
+def _run(coro):
+    async def run():
+        from database import async_engine
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()   # its connections belong to this event loop
+    from database import init_db
+    init_db()
+    return asyncio.run(run())
+
+async def _new_bot() -> int:
+    from database import AsyncSessionLocal, Bot
+    async with AsyncSessionLocal() as session:
+        bot = Bot(username=f"@test_{uuid.uuid4().hex[:12]}_bot", description="", features="", category="Other")
+        session.add(bot)
+        await session.commit()
+        return bot.bot_id
+
+async def _vote(bot_id: int, user_id: int, score: int):
+    from database import AsyncSessionLocal
+    from services.votes import record_vote
+    async with AsyncSessionLocal() as session:
+        result = await record_vote(session, bot_id, user_id, score)
+        await session.commit()
+        return result
+
+async def _aggregates(bot_id: int):
+    from database import AsyncSessionLocal, Bot
+    async with AsyncSessionLocal() as session:
+        bot = await session.get(Bot, bot_id)
+        return bot.rating, bot.score_sum, bot.vote_count
+
+def test_first_vote_then_changed_vote():
+    async def run():
+        bot_id = await _new_bot()
+        first = await _vote(bot_id, 1, 4)
+        second = await _vote(bot_id, 2, 5)
+        changed = await _vote(bot_id, 1, 2)
+        return first, second, changed, await _aggregates(bot_id)
+
+    first, second, changed, aggregates = _run(run())
+    assert first.changed and first.previous_score is None
+    assert (first.rating, first.vote_count) == (4.0, 1)
+    assert (second.rating, second.vote_count) == (4.5, 2)
+    assert changed.previous_score == 4
+    assert (changed.rating, changed.vote_count) == (3.5, 2)
+    assert aggregates == (3.5, 7, 2)
+
+def test_same_score_again_changes_nothing():
+    async def run():
+        bot_id = await _new_bot()
+        await _vote(bot_id, 1, 3)
+        return await _vote(bot_id, 1, 3), await _aggregates(bot_id)
+
+    result, aggregates = _run(run())
+    assert not result.changed
+    assert aggregates == (3.0, 3, 1)
+
+def test_vote_for_missing_bot_is_skipped():
+    assert _run(_vote(2 ** 31 - 1, 1, 5)) is None
+
+def test_flush_writes_the_batch():
+    from services.vote_buffer import VoteBuffer
+
+    async def run():
+        bot_id = await _new_bot()
+        buffer = VoteBuffer(flush_interval=60, edit_window=60)
+        buffer.add(bot_id, 1, 5)
+        buffer.add(bot_id, 2, 1)
+        buffer.add(bot_id, 2, 3)   # a later click replaces the earlier one
+        await buffer.flush()
+        return buffer.pending, await _aggregates(bot_id)
+
+    pending, aggregates = _run(run())
+    assert pending == {}
+    assert aggregates == (4.0, 8, 2)
+
+def test_flush_drops_a_bad_vote_and_writes_the_rest():
+    from services.vote_buffer import VoteBuffer
+
+    async def run():
+        bot_id = await _new_bot()
+        buffer = VoteBuffer(flush_interval=60, edit_window=60)
+        buffer.add(2 ** 70, 1, 5)          # no database stores this id
+        buffer.add(bot_id, 1, 4)
+        buffer.add(2 ** 31 - 1, 1, 5)      # a bot that doesn't exist: skipped, not an error
+        await buffer.flush()
+        return buffer.pending, await _aggregates(bot_id)
+
+    pending, aggregates = _run(run())
+    assert pending == {}
+    assert aggregates == (4.0, 4, 1)